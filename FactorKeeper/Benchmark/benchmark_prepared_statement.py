@@ -0,0 +1,74 @@
+"""
+    Micro benchmark of hot meta queries executed as
+        -sql built by str.format(the way daos built queries before)
+        -parameterized sql
+        -server side prepared statements
+    on a pooled connection of the configured factor keeper database, timings of each case and speedups over
+    the formatted query are printed.
+
+    usage: python benchmark_prepared_statement.py <factor> <version> <stock_code> [iterations]
+"""
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_case(name, func, iterations):
+    import time
+
+    func()  # warm up, statements are prepared here
+    costs = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        costs.append((time.perf_counter() - start) * 1000)
+
+    costs.sort()
+    mean = sum(costs) / len(costs)
+    print("{0:<14} mean:{1:.3f}ms  p50:{2:.3f}ms  p99:{3:.3f}ms".format(
+        name, mean, percentile(costs, 0.5), percentile(costs, 0.99)))
+    return mean
+
+
+def main():
+    import sys, os
+    FACTOR_KEEPER_BASE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    sys.path.append(FACTOR_KEEPER_BASE)
+
+    from Core.Conf.DatabaseConf import DBConfig, Schemas, Tables
+    from Core.DAO.PreparedStatement import PreparedStatement
+    import pandas as pd
+
+    if len(sys.argv) < 4:
+        print(__doc__)
+        return
+
+    factor, version, stock_code = sys.argv[1:4]
+    iterations = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+
+    query = """
+        SELECT linkage_id FROM "{0}"."{1}" L JOIN "{0}"."{2}" V ON L.version_id=V.version_id
+        WHERE V.factor=%s AND V.version=%s AND L.stock_code=%s
+    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_TICK_LINKAGE, Tables.TABLE_FACTOR_VERSION)
+    params = (factor, version, stock_code)
+    formatted_query = query.replace("%s", "'{}'").format(*params)
+
+    db_engine = DBConfig.create_default_sa_engine(pool_size=1, max_overflow=0)
+    conn = db_engine.connect()
+    try:
+        rows = pd.read_sql(query, con=conn, params=params).shape[0]
+        print("{0} iterations, {1} rows per query".format(iterations, rows))
+
+        formatted = run_case("formatted", lambda: pd.read_sql(formatted_query, con=conn), iterations)
+        parameterized = run_case("parameterized", lambda: pd.read_sql(query, con=conn, params=params), iterations)
+        prepared = run_case("prepared", lambda: PreparedStatement.read_sql(conn, query, params), iterations)
+
+        print("speedup over formatted  parameterized:{0:.2f}x  prepared:{1:.2f}x".format(
+            formatted / parameterized, formatted / prepared))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
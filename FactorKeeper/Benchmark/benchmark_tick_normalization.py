@@ -0,0 +1,90 @@
+"""
+    Micro benchmark of aligning a day of raw ticks onto the 3 seconds tick grid with
+        -the pandas path(dedup, resample per second, reindex onto two date ranges, fill)
+        -TickGridNormalizer(searchsorted onto the cached grid)
+    on synthetic ticks, no database is needed.
+
+    usage: python benchmark_tick_normalization.py [ticks_per_day] [iterations]
+"""
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_case(name, func, iterations):
+    import time
+
+    func()  # warm up
+    costs = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        costs.append((time.perf_counter() - start) * 1000)
+
+    costs.sort()
+    print("{0:<14} mean:{1:.3f}ms  p50:{2:.3f}ms  p99:{3:.3f}ms".format(
+        name, sum(costs) / len(costs), percentile(costs, 0.5), percentile(costs, 0.99)))
+
+
+def make_ticks(day, tick_num):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.RandomState(0)
+    sessions = [(9 * 3600 + 25 * 60, 11 * 3600 + 30 * 60), (13 * 3600, 15 * 3600)]
+    seconds = np.concatenate([rng.uniform(start, end, tick_num // 2) for start, end in sessions])
+    seconds = np.sort(np.round(seconds, 3))
+    seconds = np.insert(seconds, rng.randint(0, seconds.shape[0], 20), seconds[:20])  # duplicated timestamps
+
+    data = {
+        "datetime": pd.Timestamp(day) + pd.to_timedelta(seconds, unit='s'),
+        "last": 10 + np.cumsum(rng.normal(0, 0.01, seconds.shape[0])),
+        "volume": rng.randint(0, 10000, seconds.shape[0]).astype(np.float64)
+    }
+    for i in range(1, 11):
+        for col in ("ask", "bid", "asize", "bsize"):
+            data[col + str(i)] = rng.uniform(1, 100, seconds.shape[0])
+
+    return pd.DataFrame(data)
+
+
+def pandas_normalize(stock_df, day):
+    import pandas as pd
+
+    stock_df = stock_df.set_index('datetime')
+    stock_df = stock_df[~stock_df.index.duplicated()]
+    stock_df = stock_df.resample('s').sum()
+    stock_df = stock_df.ffill()
+
+    day_str = str(day)
+    stock_df = pd.DataFrame(stock_df,
+                            index=pd.date_range(day_str + ' 09:30:03', day_str + ' 11:30:00', freq='3s').append(
+                                pd.date_range(day_str + ' 13:00:00', day_str + ' 14:56:57', freq='3s'))).ffill()
+    stock_df = stock_df.bfill()
+    stock_df['date'] = day
+    stock_df['datetime'] = stock_df.index
+
+    return stock_df
+
+
+def main():
+    import sys, os, datetime
+    FACTOR_KEEPER_BASE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    sys.path.append(FACTOR_KEEPER_BASE)
+
+    from Core.WorkerNode.WorkerNodeImpl.TickNormalizer import TickGridNormalizer
+
+    tick_num = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    day = datetime.date(2018, 1, 2)
+    stock_df = make_ticks(day, tick_num)
+    print("{0} ticks, {1} columns".format(stock_df.shape[0], stock_df.shape[1]))
+
+    run_case("pandas", lambda: pandas_normalize(stock_df, day), iterations)
+    run_case("searchsorted", lambda: TickGridNormalizer.normalize(stock_df, day), iterations)
+
+
+if __name__ == "__main__":
+    main()
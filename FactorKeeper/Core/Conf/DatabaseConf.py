@@ -41,7 +41,7 @@ class DBConfig(object):
         return psycopg2.connect(database=self.db_name, user=self.user, password=self.password,
                                 host=self.host, port=self.port)
 
-    def __create_sqlalchemy_engine(self, use_pool, pool_size=None, max_overflow=None):
+    def __create_sqlalchemy_engine(self, use_pool, pool_size=None, max_overflow=None, pool_timeout=30):
         import sqlalchemy as sa
         from sqlalchemy.pool import QueuePool, NullPool
         if use_pool:
@@ -49,7 +49,7 @@ class DBConfig(object):
                 '{0}://{1}:{2}@{3}:{4}/{5}'.
                     format(self.db_type, self.user, self.password,
                            self.host, self.port, self.db_name),
-                poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow)
+                poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
         else:
             return sa.create_engine(
                 '{0}://{1}:{2}@{3}:{4}/{5}'.
@@ -58,15 +58,22 @@ class DBConfig(object):
                 poolclass=NullPool)
 
     @classmethod
-    def create_default_sa_engine(cls, use_pool=True, pool_size=5, max_overflow=5):
+    def create_default_sa_engine(cls, use_pool=True, pool_size=5, max_overflow=5, pool_timeout=30):
         return cls.default_config().__create_sqlalchemy_engine(use_pool=use_pool, pool_size=pool_size,
-                                                               max_overflow=max_overflow)
+                                                               max_overflow=max_overflow, pool_timeout=pool_timeout)
 
     @classmethod
     def create_default_sa_engine_without_pool(cls):
         return cls.default_config().__create_sqlalchemy_engine(use_pool=False)
 
 
+# ========================== Prepared Statement Configuration =====================================
+class PreparedStatementConf(object):
+    # hot queries are prepared on server side per pooled connection if enabled
+    ENABLED = True
+    MAX_STATEMENTS_PER_CONNECTION = 256
+
+
 # ========================== Database Schema/Table Configuration ==================================
 # Schemas configuration
 class Schemas(object):
@@ -85,12 +92,15 @@ class Tables(object):
     TABLE_FACTOR_RESULT_PREFIX = "T_FACTOR_RESULT_"
     TABLE_FACTOR_UPDATE_LOG = "T_FACTOR_UPDATE_LOG"
     TABLE_GROUP_FACTOR = "T_GROUP_FACTOR"
+    TABLE_FACTOR_STATE = "T_FACTOR_STATE"
 
     # tick data relative tables
     TABLE_TICK_STOCK_PREFIX = "T_STOCK_"
     TABLE_TICK_STOCK_VIEW_PREFIX = "T_VIEW_"
     TABLE_TICK_UPDATE_LOGS = "T_TICK_UPDATE_LOGS"
     TABLE_TICK_STOCK_VIEW_LIST = "T_STOCK_VIEW_LIST"
+    TABLE_TICK_SOURCE_CATALOG = "T_TICK_SOURCE_CATALOG"
+    TABLE_TICK_SOURCE_CATALOG_STATE = "T_TICK_SOURCE_CATALOG_DAY_STATE"
 
     # name node relative table
     TABLE_MANAGER_FINISHED_TASKS = "T_FINISHED_TASKS"
@@ -103,6 +113,16 @@ class TickDataSourceDatabaseConf(object):
     TABLE = "table"
     STOCK_CODE_COL_NAME = "col"
 
+    # rows fetched from server side cursor at a time by range imports
+    FETCH_ROWS_PER_CHUNK = 50000
+
+    # available dates of stocks are served from a catalog kept in factor keeper database if enabled, days changed
+    # in data source since the latest cataloged day are refreshed into the catalog by name node in background once
+    # per interval, days backfilled before it are looked for once per backfill check interval
+    DATE_CATALOG_ENABLED = True
+    DATE_CATALOG_REFRESH_INTERVAL = 60  # in seconds
+    DATE_CATALOG_BACKFILL_CHECK_INTERVAL = 3600  # in seconds
+
     @staticmethod
     def create_db_engine():
         return DBConfig.default_config().create_default_sa_engine_without_pool()
@@ -6,8 +6,18 @@ class MasterConf(object):
     TASK_CHECK_CYCLE = 10  # in seconds
 
     # Database Conf
-    DB_POOL_SIZE = 3
-    DB_MAX_OVERFLOW = 5
+    # connections are shared by server threads(one per concurrent request, mostly result callbacks sent by
+    # pool processes of workers), the task manager routine and the tick date catalog refresher, the pool keeps
+    # one connection per expected concurrent request and per background thread. Requests exceeding it wait for
+    # an overflow connection, then fail with a db error after DB_POOL_TIMEOUT instead of blocking workers forever
+    SERVER_CONCURRENT_REQUESTS = 32  # about total pool processes of workers
+    BACKGROUND_DB_THREADS = 2  # task manager routine, tick date catalog refresher
+    DB_POOL_SIZE = SERVER_CONCURRENT_REQUESTS + BACKGROUND_DB_THREADS
+    DB_MAX_OVERFLOW = 16
+    DB_POOL_TIMEOUT = 30  # in seconds
+
+    # Factor Result Cache
+    RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # in bytes
 
     # Server
     SERVER_HOST = "localhost"
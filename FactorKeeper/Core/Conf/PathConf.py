@@ -13,6 +13,9 @@ class Path(object):
     FACTOR_GENERATOR_ZIP_TEMP_NAME = "factor_generator.factor_keeper.temp.zip"
     FACTOR_GENERATOR_UNZIP_DIR_NAME = "factor_generator.factor_keeper.temp"
 
+    # tick data cache path of worker node
+    TICK_CACHE_BASE = "{}/TickCache".format(SKYECON_BASE)
+
     # Log Path, Relative to Bin Dir
     WORKERNODE_MANAGER_LOG_PATH = "../Log/WorkerNode/Manager"
     WORKERNODE_WORKER_LOG_PATH = "../Log/WorkerNode/Workers"
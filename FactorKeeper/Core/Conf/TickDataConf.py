@@ -1,8 +1,22 @@
 class TickDataConf(object):
     TICK_LENGTH = 4740
 
+    # tick grid layout(see Util.TimeUtil.TickGrid), both ends of a session are grid points
+    TICK_SESSIONS = (("09:30:03", "11:30:00"), ("13:00:00", "14:56:57"))
+    TICK_STEP_SECONDS = 3
+
+    # aggregation of raw ticks onto the tick grid, "last" or "sum"(see TickGridNormalizer)
+    TICK_COLUMN_AGGREGATIONS = {"volume": "sum"}
+    DEFAULT_TICK_COLUMN_AGGREGATION = "last"
+
     STOCK_VIEW_SUFFIX = ".VIEW"
 
+    # materialized views are copied into view tables, virtual views are assembled from stocks on read
+    STOCK_VIEW_TYPE_MATERIALIZED = "materialized"
+    STOCK_VIEW_TYPE_VIRTUAL = "virtual"
+    STOCK_VIEW_TYPES = (STOCK_VIEW_TYPE_MATERIALIZED, STOCK_VIEW_TYPE_VIRTUAL)
+    VIRTUAL_VIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024  # per process cache of assembled days of virtual views
+
     @classmethod
     def is_stock_view(cls, stock_code):
         return stock_code.endswith(cls.STOCK_VIEW_SUFFIX)
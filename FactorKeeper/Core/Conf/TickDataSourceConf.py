@@ -0,0 +1,30 @@
+class TickDataSourceConf(object):
+    # tick data are imported from a database table(see DatabaseConf.TickDataSourceDatabaseConf)
+    # or from a directory of daily dump files(see TickDataSourceFileConf)
+    SOURCE_DATABASE = "database"
+    SOURCE_FILE = "file"
+    SOURCE_TYPE = SOURCE_DATABASE
+
+    @classmethod
+    def is_file_source(cls):
+        return cls.SOURCE_TYPE == cls.SOURCE_FILE
+
+
+class TickDataSourceFileConf(object):
+    # directory of dump files, one file per exchange per day, e.g. "SH_20180102.csv"
+    ROOT_DIR = "/data/tick_dumps"
+    FILE_FORMATS = ("csv", "parquet")
+    # file names not matched are ignored, the "date" group is parsed with DATE_FORMAT
+    FILE_NAME_PATTERN = r"^(?P<exchange>[A-Za-z]+)_(?P<date>\d{8})\.(?P<format>csv|parquet)$"
+    DATE_FORMAT = "%Y%m%d"
+
+    # column names in dump files
+    STOCK_CODE_COL_NAME = "windcode"
+    DATETIME_COL_NAME = "datetime"
+    # dump file column name -> tick data table column name, columns not listed keep their names
+    COLUMN_MAPPING = {}
+
+    # rows decoded at a time, only rows of requested stocks of a chunk are kept
+    READ_ROWS_PER_CHUNK = 500000
+    # files decoded in parallel by threads, csv and parquet decoders release the GIL for most of the work
+    DECODE_THREADS = 4
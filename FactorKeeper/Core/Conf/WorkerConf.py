@@ -6,6 +6,41 @@ class WorkerConf(object):
     # Runner Conf
     PROCESSOR_NUM = 2
 
+    # Worker Context Conf(see WorkerContext), connections are pooled per pool process
+    DB_POOL_SIZE = 2
+    DB_MAX_OVERFLOW = 2
+
+    # Warm Up Conf(see WorkerTaskManager.apply_warm_up)
+    WARM_UP_TIMEOUT = 10  # max seconds a pool process waits for other processes to take a warm up
+    WARM_UP_KEEP_NUM = 16  # warm ups run again by processes of a restarted pool
+
+    # Factor Update Conf
+    FACTOR_UPDATE_DAYS_PER_TASK = 20  # max days of a unit task, passed at once to "factor_generator_batch"
+
+    # Tick Data Cache Conf(see TickDataCache), files are kept in Path.TICK_CACHE_BASE
+    TICK_CACHE_ENABLED = True
+    TICK_CACHE_MEMORY_MAX_BYTES = 512 * 1024 ** 2  # in-memory LRU of each pool process
+    TICK_CACHE_DISK_MAX_BYTES = 20 * 1024 ** 3  # cache files shared by pool processes of a host
+    TICK_CACHE_DISK_CHECK_WRITES = 50  # disk usage is checked by a process once per this number of writes
+    TICK_SHARED_MEMORY_ENABLED = True  # days used by running tasks are shared by pool processes(see SharedTickBlock)
+    # pandas copy on write is enabled in pool processes, so that frames passed to generators are not deep copies of
+    # cached days(always on since pandas 3.0, deep copies are made if disabled before it)
+    PANDAS_COPY_ON_WRITE = True
+
     # Routine Conf
     UPDATE_CYCLE = 5  # in seconds
 
+    # Tick Data Import Conf
+    TICK_BULK_IMPORT = True  # import consecutive missing days of a stock with one range query
+    TICK_BULK_IMPORT_MAX_DAYS = 60  # max days imported by one unit task
+
+    TICK_UNIVERSE_IMPORT_STOCKS_PER_TASK = 200  # max stocks imported by one unit task of a universe update
+    STOCK_VIEW_SQL_MATERIALIZE = True  # materialize stock views inside database by joining stock tables
+
+    # Tick Update Pipeline Conf(see TickUpdatePipeline), the normalizer stage runs in pool processes(PROCESSOR_NUM)
+    TICK_PIPELINE_READER_THREADS = 2  # source queries run concurrently by a unit task
+    TICK_PIPELINE_WRITER_THREADS = 2  # callback requests run concurrently by a unit task
+    TICK_PIPELINE_QUEUE_SIZE = 8  # max days buffered between two stages
+    TICK_PIPELINE_READ_DAYS = 10  # days fetched by one source query of a bulk import
+    TICK_PIPELINE_READ_STOCKS = 50  # stocks fetched by one source query of a universe import
+    TICK_PIPELINE_WRITE_BATCH = 5  # max days posted to master by one callback request
@@ -55,9 +55,8 @@ class CreateFactorMetaDao(object):
         try:
             conn.execute("""
                         INSERT INTO "{0}"."{1}"(factor, version, code)
-                        VALUES ('{2}', '{3}', %s)
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION,
-                               factor, factor_version), (code,))
+                        VALUES (%s, %s, %s)
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), (factor, factor_version, code))
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED
@@ -8,6 +8,7 @@ from Core.Conf.DatabaseConf import Schemas, Tables
 from Core.Error.Error import Error
 from Core.DAO.FactorDao.FactorGetterDao import FactorGetterDao
 from Core.DAO.FactorDao.FactorStatusDao import FactorStatusDao
+from Core.DAO.PreparedStatement import PreparedStatement
 import traceback, datetime
 import pandas as pd
 
@@ -51,13 +52,13 @@ class FactorAssistDao(object):
 
             # 创建条件子句
             where_clause = """
-                                    WHERE datetime >= '{0}' AND datetime < '{1}'
-                                """. \
-                format(day, day + datetime.timedelta(days=1))
+                                    WHERE datetime >= %s AND datetime < %s
+                                """
 
             conn.execute("""
                 DELETE FROM "{0}"."{1}" {2}
-            """.format(Schemas.SCHEMA_FACTOR_DATA, Tables.TABLE_FACTOR_RESULT_PREFIX + str(link_id), where_clause))
+            """.format(Schemas.SCHEMA_FACTOR_DATA, Tables.TABLE_FACTOR_RESULT_PREFIX + str(link_id), where_clause),
+                         (day, day + datetime.timedelta(days=1)))
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED
@@ -82,15 +83,14 @@ class FactorAssistDao(object):
 
             conn.execute("""
                 INSERT INTO "{0}"."{1}"(linkage_id, factor_date, start_update_time)
-                VALUES({2}, '{3}', '{4}')
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG,
-                       linkage_id, date, now))
+                VALUES(%s, %s, %s)
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG), (int(linkage_id), date, now))
 
-            log_id = pd.read_sql("""
+            log_id = PreparedStatement.read_sql(conn, """
                 SELECT log_id FROM "{0}"."{1}" 
-                WHERE linkage_id={2} AND factor_date='{3}' AND start_update_time='{4}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG,
-                       linkage_id, date, now), con=conn)['log_id'].tolist()[0]
+                WHERE linkage_id=%s AND factor_date=%s AND start_update_time=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG),
+                                                (int(linkage_id), date, now))['log_id'].tolist()[0]
 
             return Error.SUCCESS, log_id
         except:
@@ -112,9 +112,36 @@ class FactorAssistDao(object):
         try:
             conn.execute("""
                 UPDATE "{0}"."{1}"
-                SET end_update_time='{2}' WHERE log_id={3}
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG,
-                       datetime.datetime.now(), log_id))
+                SET end_update_time=%s WHERE log_id=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG), (datetime.datetime.now(), int(log_id)))
+            return Error.SUCCESS
+
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            if con is None:
+                conn.close()
+
+    def save_factor_state(self, linkage_id, date, state, con=None):
+        """
+        Save state of a stateful factor generator after a day is updated, old state of the day is replaced
+        :param linkage_id:
+        :param date:
+        :param state: serialized state string
+        :param con:
+        :return: err_code
+        """
+
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            conn.execute("""
+                INSERT INTO "{0}"."{1}"(linkage_id, factor_date, state, update_time)
+                VALUES(%s, %s, %s, %s)
+                ON CONFLICT (linkage_id, factor_date)
+                DO UPDATE SET state=EXCLUDED.state, update_time=EXCLUDED.update_time
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_STATE),
+                         (int(linkage_id), date, state, datetime.datetime.now()))
             return Error.SUCCESS
 
         except:
@@ -136,9 +163,8 @@ class FactorAssistDao(object):
         try:
             code = pd.read_sql("""
                 SELECT code FROM "{0}"."{1}"
-                WHERE factor='{2}' AND version='{3}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION,
-                       factor, version), con=conn)
+                WHERE factor=%s AND version=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), con=conn, params=(factor, version))
 
             if code.shape[0] == 0:
                 self.logger.log_error("factor version not found({0}:{1})".format(factor, version))
@@ -42,12 +42,16 @@ class FactorDao(object):
             return err
         return self.creator_dao.create_linkage(factor, version, stock)
 
-    def load_factor_result(self, factor, version, stock, fetch_date, with_time=True):
-        return self.getter_dao.load_factor_result(factor, version, stock, fetch_date, with_time=with_time)
+    def load_factor_result(self, factor, version, stock, fetch_date, with_time=True, start_time=None, end_time=None,
+                           columns=None):
+        return self.getter_dao.load_factor_result(factor, version, stock, fetch_date, with_time=with_time,
+                                                  start_time=start_time, end_time=end_time, columns=columns)
 
-    def load_factor_result_by_range(self, factor, version, stock, start_date, end_date, with_time=True):
+    def load_factor_result_by_range(self, factor, version, stock, start_date, end_date, with_time=True,
+                                    start_time=None, end_time=None, columns=None):
         return self.getter_dao.load_factor_result_by_range(factor, version, stock, start_date, end_date,
-                                                           with_time=with_time)
+                                                           with_time=with_time, start_time=start_time,
+                                                           end_time=end_time, columns=columns)
 
     def list_factors(self):
         return self.getter_dao.get_factor_list()
@@ -61,12 +65,22 @@ class FactorDao(object):
             return err
         return self.getter_dao.get_linked_stock_list(factor, version)
 
+    def list_stock_linkages(self, stock_code):
+        return self.getter_dao.get_stock_linkage_list(stock_code)
+
     def list_updated_dates(self, factor, version, stock):
         err, factor = self.get_group_factor(factor, default=factor)
         if err:
             return err, None
         return self.getter_dao.get_updated_dates_list(factor, version, stock)
 
+    def list_update_times(self, factor, version, stock, start_date=None, end_date=None):
+        err, factor = self.get_group_factor(factor, default=factor)
+        if err:
+            return err, None
+        return self.getter_dao.get_updated_dates_with_time(factor, version, stock, start_date=start_date,
+                                                           end_date=end_date)
+
     def get_group_factor(self, sub_factor_name, default=None):
         return self.getter_dao.get_group_factor(sub_factor_name, default=default)
 
@@ -103,6 +117,21 @@ class FactorDao(object):
     def finish_update_log(self, log_id):
         return self.assist_dao.finish_update_log(log_id)
 
+    def list_factor_state_dates(self, factor, version, stock):
+        err, factor = self.get_group_factor(factor, default=factor)
+        if err:
+            return err, None
+        return self.getter_dao.get_factor_state_dates_list(factor, version, stock)
+
+    def get_factor_state(self, factor, version, stock, day):
+        err, factor = self.get_group_factor(factor, default=factor)
+        if err:
+            return err, None, None
+        return self.getter_dao.get_factor_state(factor, version, stock, day)
+
+    def save_factor_state(self, link_id, day, state):
+        return self.assist_dao.save_factor_state(link_id, day, state)
+
     def get_factor_version_code(self, factor, version):
         err, factor = self.get_group_factor(factor, default=factor)
         if err:
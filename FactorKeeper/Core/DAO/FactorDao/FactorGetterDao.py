@@ -6,6 +6,8 @@
 
 from Core.Conf.DatabaseConf import Schemas, Tables
 from Core.DAO.TickDataDao import TickDataDao
+from Core.DAO.QueryClause import make_time_window_clause, make_column_list
+from Core.DAO.PreparedStatement import PreparedStatement
 from Core.DAO.FactorDao.FactorStatusDao import FactorStatusDao
 from Core.Error.Error import Error
 import pandas as pd
@@ -67,16 +69,15 @@ class FactorGetterDao(object):
             if group_factor_name is None:
                 versions = pd.read_sql("""
                             SELECT version from "{0}"."{1}"
-                            WHERE factor='{2}'
-                        """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION, factor), con=conn)['version'].\
-                    tolist()
+                            WHERE factor=%s
+                        """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), con=conn,
+                                       params=(factor,))['version'].tolist()
             else:
                 versions = pd.read_sql("""
                                             SELECT version from "{0}"."{1}"
-                                            WHERE group_factor_name='{2}' AND sub_factor_name='{3}'
-                                        """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR, group_factor_name,
-                                                   factor), con=conn)[
-                    'version'].tolist()
+                                            WHERE group_factor_name=%s AND sub_factor_name=%s
+                                        """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR), con=conn,
+                                       params=(group_factor_name, factor))['version'].tolist()
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED, None
@@ -101,21 +102,20 @@ class FactorGetterDao(object):
                 return err, None
 
             if group_factor is None:
-                latest_version_df = pd.read_sql("""
+                latest_version_df = PreparedStatement.read_sql(conn, """
                     SELECT version FROM "{0}"."{1}"
-                    WHERE factor='{2}'
+                    WHERE factor=%s
                     ORDER BY version_id DESC LIMIT 1
-                """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION, factor), con=conn)
+                """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), (factor,))
 
                 if latest_version_df.shape[0] == 0:
                     return Error.ERROR_FACTOR_NOT_EXISTS, None
             else:
-                latest_version_df = pd.read_sql("""
+                latest_version_df = PreparedStatement.read_sql(conn, """
                                     SELECT version FROM "{0}"."{1}"
-                                    WHERE sub_factor_name='{2}' AND group_factor_name='{3}'
+                                    WHERE sub_factor_name=%s AND group_factor_name=%s
                                     ORDER BY id DESC LIMIT 1
-                                """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR, factor, group_factor)
-                                                , con=conn)
+                                """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR), (factor, group_factor))
 
                 if latest_version_df.shape[0] == 0:
                     return Error.ERROR_FACTOR_NOT_EXISTS, None
@@ -140,11 +140,10 @@ class FactorGetterDao(object):
 
         conn = con if con is not None else self.db_engine.connect()
         try:
-            query_factor_version_id_df = pd.read_sql("""
+            query_factor_version_id_df = PreparedStatement.read_sql(conn, """
                         SELECT version_id from "{0}"."{1}"
-                        WHERE factor='{2}' AND version='{3}'
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION,
-                               factor, version), conn)
+                        WHERE factor=%s AND version=%s
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), (factor, version))
 
             if query_factor_version_id_df.shape[0] == 0:
                 err, is_factor_exists = self.status_dao.is_factor_exists(factor, con=conn)
@@ -176,8 +175,9 @@ class FactorGetterDao(object):
         try:
             factor_version_df = pd.read_sql("""
                         SELECT factor, version FROM "{0}"."{1}"
-                        WHERE version_id={2}
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION, factor_version_id), conn)
+                        WHERE version_id=%s
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), conn,
+                                            params=(int(factor_version_id),))
 
             if factor_version_df.shape[0] == 0:
                 return Error.ERROR_FACTOR_VERSION_NOT_EXISTS, None, None
@@ -211,11 +211,10 @@ class FactorGetterDao(object):
             if err:
                 return err, None
 
-            link_id_df = pd.read_sql("""
+            link_id_df = PreparedStatement.read_sql(conn, """
                 SELECT linkage_id FROM "{0}"."{1}"
-                WHERE version_id={2} AND stock_code='{3}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_TICK_LINKAGE, version_id, stock_code),
-                                     conn)
+                WHERE version_id=%s AND stock_code=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_TICK_LINKAGE), (version_id, stock_code))
 
             if link_id_df.shape[0] == 0:
                 return Error.ERROR_LINKAGE_NOT_EXISTS, None
@@ -245,9 +244,9 @@ class FactorGetterDao(object):
 
             linked_stocks = pd.read_sql("""
                         SELECT "stock_code" FROM "{0}"."{1}"
-                        WHERE "version_id"='{2}'
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_TICK_LINKAGE, version_id),
-                                        con=conn)['stock_code'].tolist()
+                        WHERE "version_id"=%s
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_TICK_LINKAGE),
+                                        con=conn, params=(version_id,))['stock_code'].tolist()
 
             return Error.SUCCESS, linked_stocks
         except:
@@ -257,6 +256,32 @@ class FactorGetterDao(object):
             if con is None:
                 conn.close()
 
+    def get_stock_linkage_list(self, stock_code, con=None):
+        """
+        List all factor versions linked to a stock
+        :param con:
+        :param stock_code:
+        :return: err_code, list of (factor, version), factor is group factor name for group factors
+        """
+
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            linkage_df = pd.read_sql("""
+                        SELECT V.factor, V.version FROM "{0}"."{1}" L
+                        JOIN "{0}"."{2}" V ON L.version_id=V.version_id
+                        WHERE L.stock_code=%s
+                        ORDER BY L.linkage_id
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_TICK_LINKAGE, Tables.TABLE_FACTOR_VERSION),
+                                     con=conn, params=(stock_code,))
+
+            return Error.SUCCESS, list(zip(linkage_df['factor'].tolist(), linkage_df['version'].tolist()))
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            if con is None:
+                conn.close()
+
     # group factor ####################################################################
 
     def get_group_factor(self, sub_factor_name, default=None, con=None):
@@ -270,10 +295,10 @@ class FactorGetterDao(object):
 
         conn = con if con is not None else self.db_engine.connect()
         try:
-            group_factor_df = pd.read_sql("""
+            group_factor_df = PreparedStatement.read_sql(conn, """
                 SELECT group_factor_name FROM "{0}"."{1}"
-                WHERE sub_factor_name='{2}' LIMIT 1
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR, sub_factor_name), con=conn)
+                WHERE sub_factor_name=%s LIMIT 1
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR), (sub_factor_name,))
 
             if group_factor_df.shape[0] == 0:
                 return Error.SUCCESS, default
@@ -296,12 +321,13 @@ class FactorGetterDao(object):
         """
         conn = con if con is not None else self.db_engine.connect()
         try:
-            where_version_clause = " AND version='{}'".format(version) if version is not None else ""
+            where_version_clause = " AND version=%s" if version is not None else ""
+            params = (group_factor_name, version) if version is not None else (group_factor_name,)
             sub_factors = pd.read_sql("""
                 SELECT DISTINCT sub_factor_name FROM "{0}"."{1}"
-                WHERE group_factor_name='{2}' {3}
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR, group_factor_name, where_version_clause),
-                                      con=conn)['sub_factor_name'].tolist()
+                WHERE group_factor_name=%s {2}
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR, where_version_clause),
+                                      con=conn, params=params)['sub_factor_name'].tolist()
             return Error.SUCCESS, sub_factors
         except:
             self.logger.log_error(traceback.format_exc())
@@ -312,7 +338,8 @@ class FactorGetterDao(object):
 
     # result info ##############################################################
 
-    def load_factor_result(self, factor, version, stock, fetch_date, with_time=True, con=None):
+    def load_factor_result(self, factor, version, stock, fetch_date, with_time=True, start_time=None, end_time=None,
+                           columns=None, con=None):
         """
         Fetch factor data within a day
         :param stock:
@@ -321,6 +348,9 @@ class FactorGetterDao(object):
         :param con:
         :param with_time: time columns reserved in returned dataframe if "with_time" is True else False
         :param fetch_date: the day to fetch data
+        :param start_time: only rows not earlier than start_time(datetime.time) are fetched if not None
+        :param end_time: only rows not later than end_time(datetime.time) are fetched if not None
+        :param columns: columns to fetch among factor, "datetime" and "date", overrides "with_time" if not None
         :return: err_code, a dataframe contains factor data
         """
 
@@ -334,17 +364,20 @@ class FactorGetterDao(object):
             if err:
                 return err, None
 
+            time_window_clause, time_window_params = make_time_window_clause(start_time, end_time)
             where_clause = """
-                                WHERE datetime >= '{0}' AND datetime < '{1}'
+                                WHERE datetime >= %s AND datetime < %s {0}
                             """. \
-                format(fetch_date, fetch_date + datetime.timedelta(days=1))
+                format(time_window_clause)
 
-            columns = """ "{}" """.format(factor) if not with_time else """ "{}", "datetime", "date" """.format(factor)
+            if columns is None:
+                columns = [factor] if not with_time else [factor, "datetime", "date"]
+            columns = make_column_list(columns)
 
-            ret = pd.read_sql("""
+            ret = PreparedStatement.read_sql(conn, """
                 SELECT {4} FROM "{0}"."{1}{2}" {3} ORDER BY datetime
             """.format(Schemas.SCHEMA_FACTOR_DATA, Tables.TABLE_FACTOR_RESULT_PREFIX, link_id, where_clause, columns),
-                              con=conn)
+                                             (fetch_date, fetch_date + datetime.timedelta(days=1)) + time_window_params)
 
             if ret.shape[0] == 0:
                 return Error.ERROR_FACTOR_RESULT_NOT_EXISTS, None
@@ -357,7 +390,8 @@ class FactorGetterDao(object):
             if con is None:
                 conn.close()
 
-    def load_factor_result_by_range(self, factor, version, stock, start_date, end_date, with_time=True, con=None):
+    def load_factor_result_by_range(self, factor, version, stock, start_date, end_date, with_time=True,
+                                    start_time=None, end_time=None, columns=None, con=None):
         """
         load factor data by a time range
         :param factor:
@@ -366,6 +400,9 @@ class FactorGetterDao(object):
         :param start_date:
         :param end_date:
         :param with_time:
+        :param start_time: only rows not earlier than start_time(datetime.time) of each day are fetched if not None
+        :param end_time: only rows not later than end_time(datetime.time) of each day are fetched if not None
+        :param columns: columns to fetch among factor, "datetime" and "date", overrides "with_time" if not None
         :param con:
         :return: err_code, a dataframe contains factor data
         """
@@ -380,18 +417,22 @@ class FactorGetterDao(object):
             if err:
                 return err, None
 
+            time_window_clause, time_window_params = make_time_window_clause(start_time, end_time)
             where_clause = """
-                                            WHERE datetime >= '{0}' AND datetime < '{1}'
+                                            WHERE datetime >= %s AND datetime < %s {0}
                                         """. \
-                format(start_date, end_date + datetime.timedelta(days=1))
+                format(time_window_clause)
 
-            columns = """ "{}" """.format(factor) if not with_time else """ "{}", "datetime", "date" """.format(factor)
+            if columns is None:
+                columns = [factor] if not with_time else [factor, "datetime", "date"]
+            columns = make_column_list(columns)
 
             ret = pd.read_sql("""
                             SELECT {4} FROM "{0}"."{1}{2}" {3} ORDER BY datetime
                         """.format(Schemas.SCHEMA_FACTOR_DATA, Tables.TABLE_FACTOR_RESULT_PREFIX, link_id, where_clause,
                                    columns),
-                              con=conn)
+                              con=conn,
+                              params=(start_date, end_date + datetime.timedelta(days=1)) + time_window_params)
 
             if ret.shape[0] == 0:
                 return Error.ERROR_FACTOR_RESULT_NOT_EXISTS, None
@@ -412,10 +453,10 @@ class FactorGetterDao(object):
             if err:
                 return err, None
 
-            updated_dates = pd.read_sql("""
+            updated_dates = PreparedStatement.read_sql(conn, """
                 SELECT factor_date FROM "{0}"."{1}"
-                WHERE linkage_id='{2}' AND (end_update_time IS NOT NULL) ORDER BY factor_date
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG, link_id), con=conn)['factor_date'].tolist()
+                WHERE linkage_id=%s AND (end_update_time IS NOT NULL) ORDER BY factor_date
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG), (link_id,))['factor_date'].tolist()
 
             return Error.SUCCESS, updated_dates
         except:
@@ -424,3 +465,106 @@ class FactorGetterDao(object):
         finally:
             if con is None:
                 conn.close()
+
+    def get_factor_state_dates_list(self, factor, version, stock, con=None):
+        """
+        Get dates of states saved by a stateful factor generator, including days skipped by the generator which only
+        carry the state of the day before
+        :param factor:
+        :param version:
+        :param stock:
+        :param con:
+        :return: err_code, sorted list of date objects
+        """
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            err, link_id = self.get_linkage_id(factor, version, stock, con=conn)
+            if err:
+                return err, None
+
+            state_dates = PreparedStatement.read_sql(conn, """
+                SELECT factor_date FROM "{0}"."{1}"
+                WHERE linkage_id=%s ORDER BY factor_date
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_STATE), (link_id,))['factor_date'].tolist()
+
+            return Error.SUCCESS, state_dates
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            if con is None:
+                conn.close()
+
+    def get_factor_state(self, factor, version, stock, day, con=None):
+        """
+        Get the latest state of a stateful factor generator saved before a day
+        :param factor:
+        :param version:
+        :param stock:
+        :param day: date object
+        :param con:
+        :return: err_code, date of state(None if no state saved), state string
+        """
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            err, link_id = self.get_linkage_id(factor, version, stock, con=conn)
+            if err:
+                return err, None, None
+
+            state_df = PreparedStatement.read_sql(conn, """
+                SELECT factor_date, state FROM "{0}"."{1}"
+                WHERE linkage_id=%s AND factor_date<%s ORDER BY factor_date DESC LIMIT 1
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_STATE), (link_id, day))
+
+            if state_df.shape[0] == 0:
+                return Error.SUCCESS, None, None
+
+            return Error.SUCCESS, state_df['factor_date'].tolist()[0], state_df['state'].tolist()[0]
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None, None
+        finally:
+            if con is None:
+                conn.close()
+
+    def get_updated_dates_with_time(self, factor, version, stock, start_date=None, end_date=None, con=None):
+        """
+        Get updated dates with the time their latest update finished
+        :param factor:
+        :param version:
+        :param stock:
+        :param start_date: only dates not earlier than start_date are listed if not None
+        :param end_date: only dates not later than end_date are listed if not None
+        :param con:
+        :return: err_code, list of (factor date, end update time) sorted by factor date
+        """
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            err, link_id = self.get_linkage_id(factor, version, stock, con=conn)
+            if err:
+                return err, None
+
+            date_range_clause = ""
+            params = (link_id,)
+            if start_date is not None:
+                date_range_clause += " AND factor_date >= %s"
+                params += (start_date,)
+            if end_date is not None:
+                date_range_clause += " AND factor_date <= %s"
+                params += (end_date,)
+
+            update_time_df = pd.read_sql("""
+                SELECT factor_date, max(end_update_time) AS end_update_time FROM "{0}"."{1}"
+                WHERE linkage_id=%s AND (end_update_time IS NOT NULL) {2}
+                GROUP BY factor_date ORDER BY factor_date
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_UPDATE_LOG, date_range_clause), con=conn,
+                                         params=params)
+
+            return Error.SUCCESS, list(zip(update_time_df['factor_date'].tolist(),
+                                           update_time_df['end_update_time'].tolist()))
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            if con is None:
+                conn.close()
@@ -31,8 +31,8 @@ class FactorStatusDao(object):
         try:
             factor_count = pd.read_sql("""
                 SELECT count(1) as factor_count FROM "{0}"."{1}"
-                WHERE sub_factor_name='{2}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR, factor), con=conn)['factor_count'][0]
+                WHERE sub_factor_name=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_GROUP_FACTOR), con=conn, params=(factor,))['factor_count'][0]
             return Error.SUCCESS, factor_count > 0
         except:
             self.logger.log_error(traceback.format_exc())
@@ -51,9 +51,9 @@ class FactorStatusDao(object):
         try:
             factor_count = pd.read_sql("""
                             SELECT COUNT(1) AS factor_count FROM "{0}"."{1}"
-                            WHERE factor='{2}'
-                        """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_LIST, factor),
-                                       conn)['factor_count'].tolist()[0]
+                            WHERE factor=%s
+                        """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_LIST),
+                                       conn, params=(factor,))['factor_count'].tolist()[0]
 
             if factor_count == 0 and check_group_factor:
                 return self.__is_factor_exists_as_sub_factor(factor, conn)
@@ -80,8 +80,8 @@ class FactorStatusDao(object):
         try:
             count = pd.read_sql("""
                 SELECT count(1) as version_count FROM "{0}"."{1}"
-                WHERE factor='{2}' AND version='{3}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION, factor, version), conn)[
+                WHERE factor=%s AND version=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_VERSION), conn, params=(factor, version))[
                 'version_count'].tolist()[0]
 
             return Error.SUCCESS, count > 0
@@ -103,9 +103,9 @@ class FactorStatusDao(object):
         try:
             count = pd.read_sql("""
                         SELECT count(1) as table_count FROM pg_tables
-                        WHERE schemaname='{0}' AND tablename='{1}{2}'
-                    """.format(Schemas.SCHEMA_FACTOR_DATA, Tables.TABLE_FACTOR_RESULT_PREFIX, link_id,),
-                                conn)['table_count'].tolist()[0]
+                        WHERE schemaname=%s AND tablename=%s
+                    """, conn, params=(Schemas.SCHEMA_FACTOR_DATA, Tables.TABLE_FACTOR_RESULT_PREFIX + str(link_id)))[
+                'table_count'].tolist()[0]
 
             return Error.SUCCESS, count > 0
         except:
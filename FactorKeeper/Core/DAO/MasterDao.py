@@ -118,9 +118,9 @@ class MasterDao(object):
             # get dependencies
             deps_task_id_df = pd.read_sql("""
                 SELECT dependency_task_id FROM "{0}"."{1}"
-                WHERE base_task_id='{2}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_MANAGER_FINISHED_TASK_DEPENDENCY, task.finish_task_id),
-                                          con=sa_conn)
+                WHERE base_task_id=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_MANAGER_FINISHED_TASK_DEPENDENCY),
+                                          con=sa_conn, params=(task.finish_task_id,))
 
             if deps_task_id_df.shape[0] == 0:
                 return Error.SUCCESS
@@ -145,8 +145,8 @@ class MasterDao(object):
         """
         try:
             task_df = pd.read_sql("""
-                SELECT * FROM "{0}"."{1}" WHERE task_id='{2}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_MANAGER_FINISHED_TASKS, task_id), con=sa_conn)
+                SELECT * FROM "{0}"."{1}" WHERE task_id=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_MANAGER_FINISHED_TASKS), con=sa_conn, params=(task_id,))
             if task_df.shape[0] == 0:
                 return Error.ERROR_TASK_NOT_EXISTS, None
 
@@ -174,8 +174,8 @@ class MasterDao(object):
         try:
             # get base tasks
             task_df = pd.read_sql("""
-                SELECT * FROM "{0}"."{1}" WHERE is_sub_task=0 ORDER BY id DESC LIMIT {2}
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_MANAGER_FINISHED_TASKS, task_num), con=conn)
+                SELECT * FROM "{0}"."{1}" WHERE is_sub_task=0 ORDER BY id DESC LIMIT %s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_MANAGER_FINISHED_TASKS), con=conn, params=(int(task_num),))
 
             err, task_list = self.__df_to_task_obj(task_df)
             if err:
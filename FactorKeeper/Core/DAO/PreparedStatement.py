@@ -0,0 +1,103 @@
+"""
+    This file defines server side prepared statements used by daos for hot queries.
+
+    A statement is prepared once on each pooled database connection and executed by name
+    afterwards, so postgres does not parse and plan it again. Prepared statements only live
+    as long as the database session, so queries on connections which are not pooled are
+    executed as plain parameterized queries.
+"""
+
+
+from Core.Conf.DatabaseConf import PreparedStatementConf
+from collections import OrderedDict
+import pandas as pd
+import hashlib, datetime, re
+
+
+class PreparedStatement(object):
+    INFO_KEY = "factor_keeper_prepared_statements"
+    STATEMENT_NAME_PREFIX = "fk_stmt_"
+
+    @staticmethod
+    def query(conn, sql, params=()):
+        """
+        Execute a query as a prepared statement
+        :param conn: sqlalchemy connection
+        :param sql: query using "%s" placeholders, same as parameterized queries
+        :param params: tuple of parameters
+        :return: list of column names, list of rows
+        """
+        if not PreparedStatement.is_available(conn):
+            result = conn.execute(sql, tuple(params))
+            return list(result.keys()), result.fetchall()
+
+        dbapi_conn = conn.connection
+        statements = dbapi_conn.info.setdefault(PreparedStatement.INFO_KEY, OrderedDict())
+        name = PreparedStatement.STATEMENT_NAME_PREFIX + hashlib.md5(sql.encode("utf-8")).hexdigest()[:16]
+
+        cursor = dbapi_conn.cursor()
+        try:
+            if name in statements:
+                statements.move_to_end(name)
+            else:
+                if len(statements) >= PreparedStatementConf.MAX_STATEMENTS_PER_CONNECTION:
+                    old_name, _ = statements.popitem(last=False)
+                    cursor.execute('DEALLOCATE "{}"'.format(old_name))
+                cursor.execute('PREPARE "{0}" AS {1}'.format(name, PreparedStatement.to_positional(sql)))
+                statements[name] = True
+
+            if len(params) > 0:
+                cursor.execute('EXECUTE "{0}"({1})'.format(name, ", ".join(["%s"] * len(params))),
+                               tuple(PreparedStatement.adapt(p) for p in params))
+            else:
+                cursor.execute('EXECUTE "{}"'.format(name))
+
+            columns = [desc[0] for desc in cursor.description]
+            return columns, cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def read_sql(conn, sql, params=()):
+        """
+        Same as pandas.read_sql with params, executed as a prepared statement
+        :param conn: sqlalchemy connection
+        :param sql: query using "%s" placeholders
+        :param params: tuple of parameters
+        :return: dataframe of query result
+        """
+        if not PreparedStatement.is_available(conn):
+            return pd.read_sql(sql, con=conn, params=tuple(params))
+
+        columns, rows = PreparedStatement.query(conn, sql, params)
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    @staticmethod
+    def is_available(conn):
+        from sqlalchemy.pool import NullPool
+        return PreparedStatementConf.ENABLED and not isinstance(conn.engine.pool, NullPool)
+
+    @staticmethod
+    def to_positional(sql):
+        """
+        Replace "%s" placeholders with postgres positional parameters "$1", "$2", ...
+        """
+        counter = [0]
+
+        def replace(match):
+            if match.group(0) == "%%":
+                return "%"
+            counter[0] += 1
+            return "${}".format(counter[0])
+
+        return re.sub(r"%%|%s", replace, sql)
+
+    @staticmethod
+    def adapt(param):
+        # parameters of EXECUTE are passed as untyped literals so that postgres casts them to
+        # the types inferred when preparing
+        if isinstance(param, (datetime.datetime, datetime.date, datetime.time)):
+            return str(param)
+        if hasattr(param, "item"):
+            return param.item()
+        return param
@@ -0,0 +1,32 @@
+"""
+    This file defines helpers to build sql clauses shared by daos.
+"""
+
+
+def make_time_window_clause(start_time=None, end_time=None, time_column="datetime"):
+    """
+    Make a predicate restricting rows to an intraday time window, both ends are inclusive
+    :param start_time: datetime.time, no lower bound if None
+    :param end_time: datetime.time, no upper bound if None
+    :param time_column: name of the timestamp column
+    :return: sql predicate starting with "AND"(empty string if no bound is given), tuple of its parameters
+    """
+    clause = ""
+    params = ()
+    if start_time is not None:
+        clause += """ AND "{0}"::time >= %s """.format(time_column)
+        params += (start_time,)
+    if end_time is not None:
+        clause += """ AND "{0}"::time <= %s """.format(time_column)
+        params += (end_time,)
+    return clause, params
+
+
+def make_column_list(columns):
+    """
+    :param columns: list of column names, all columns are selected if None
+    :return: quoted column list used in select statement
+    """
+    if columns is None:
+        return "*"
+    return ", ".join(['"{}"'.format(col) for col in columns])
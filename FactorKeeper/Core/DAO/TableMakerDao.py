@@ -5,6 +5,7 @@
 
 
 from Core.Conf.DatabaseConf import Schemas, Tables
+from Core.Conf.TickDataConf import TickDataConf
 from Core.DAO.ComplicatedTables.TickDataTable import TickDataTable
 from Core.Error.Error import Error
 import traceback
@@ -144,6 +145,32 @@ class TableMaker(object):
 
         return Error.SUCCESS
 
+    def create_factor_state_table(self):
+        """
+        Create factor state table, states of stateful factor generators are kept per linkage and day
+        :return: err_code
+        """
+        create_factor_state_table_sql = """
+                CREATE TABLE IF NOT EXISTS "{0}"."{1}" (
+                    linkage_id int NOT NULL,
+                    factor_date date NOT NULL,
+                    state text NOT NULL,
+                    update_time timestamp without time zone NOT NULL,
+                    PRIMARY KEY (linkage_id, factor_date)
+                );
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_FACTOR_STATE)
+
+        conn = self.db_engine.connect()
+        try:
+            conn.execute(create_factor_state_table_sql)
+        except:
+            self._logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            conn.close()
+
+        return Error.SUCCESS
+
     def create_factor_table(self, factor, link_id):
         """
         Create factor table.
@@ -279,6 +306,38 @@ class TableMaker(object):
 
         return Error.SUCCESS
 
+    def create_tick_source_catalog_tables(self):
+        """
+        Create catalog of dates available in tick data source and its per day refresh state table.
+        :return: err_code
+        """
+        create_catalog_sql = """
+        CREATE TABLE IF NOT EXISTS "{0}"."{1}" (
+            stock_code text NOT NULL,
+            tick_date date NOT NULL,
+            PRIMARY KEY (stock_code, tick_date)
+        );
+        CREATE INDEX IF NOT EXISTS tick_catalog_date_index on "{0}"."{1}"(tick_date);
+        CREATE TABLE IF NOT EXISTS "{0}"."{2}" (
+            source_name text NOT NULL,
+            tick_date date NOT NULL,
+            signature text NOT NULL,
+            refresh_time timestamp without time zone NOT NULL,
+            PRIMARY KEY (source_name, tick_date)
+        );
+        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG, Tables.TABLE_TICK_SOURCE_CATALOG_STATE)
+
+        conn = self.db_engine.connect()
+        try:
+            conn.execute(create_catalog_sql)
+        except:
+            self._logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            conn.close()
+
+        return Error.SUCCESS
+
     def create_finished_tasks_table(self):
         """
         Create finished task list table.
@@ -346,7 +405,10 @@ class TableMaker(object):
                             stock_view_name text NOT NULL PRIMARY KEY,
                             stock_view_relation text NOT NULL
                         );
-                        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST)
+                        ALTER TABLE "{0}"."{1}"
+                        ADD COLUMN IF NOT EXISTS view_type text NOT NULL DEFAULT '{2}';
+                        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST,
+                                   TickDataConf.STOCK_VIEW_TYPE_MATERIALIZED)
 
         conn = self.db_engine.connect()
         try:
@@ -5,6 +5,8 @@
 
 
 from Core.DAO.TableMakerDao import TableMaker
+from Core.DAO.QueryClause import make_time_window_clause, make_column_list
+from Core.DAO.PreparedStatement import PreparedStatement
 from Core.Conf.DatabaseConf import Schemas, Tables
 from Core.Error.Error import Error
 import traceback, datetime
@@ -24,12 +26,14 @@ class FactorKeeperDBTickDataDao(object):
         self.logger = logger.sub_logger(self.__class__.__name__)
         self.table_maker = TableMaker(db_engine, self.logger)
 
-    def load_data_by_code(self, stock_code, fetch_date, columns=None):
+    def load_data_by_code(self, stock_code, fetch_date, columns=None, start_time=None, end_time=None):
         """
         Load tick data from factor keeper database.
         :param stock_code: stock code
         :param fetch_date: the date to fetch
-        :param columns: list of columns to fetch, must not be None or empty list
+        :param columns: list of columns to fetch, all columns are fetched if None
+        :param start_time: only ticks not earlier than start_time(datetime.time) are fetched if not None
+        :param end_time: only ticks not later than end_time(datetime.time) are fetched if not None
         :return: err_code, dataframe of tick data
         """
 
@@ -37,19 +41,20 @@ class FactorKeeperDBTickDataDao(object):
         try:
             if isinstance(fetch_date, datetime.datetime):
                 fetch_date = fetch_date.date()
+            time_window_clause, time_window_params = make_time_window_clause(start_time, end_time)
             where_clause = """
-                WHERE "date"='{}'
+                WHERE "date"=%s {0}
             """. \
-                format(fetch_date)
+                format(time_window_clause)
 
-            column_str = "*" if columns is None else ", ".join(columns)
+            column_str = make_column_list(columns)
 
             load_data_sql = """
                     SELECT {4} FROM "{0}"."{1}{2}" {3} ORDER BY datetime; 
                 """.format(Schemas.SCHEMA_TICK_DATA, Tables.TABLE_TICK_STOCK_PREFIX, stock_code, where_clause,
                            column_str)
 
-            ret_df = pd.read_sql(load_data_sql, conn)
+            ret_df = PreparedStatement.read_sql(conn, load_data_sql, (fetch_date,) + time_window_params)
             if ret_df.shape[0] == 0:
                 self.logger.log_error("tick data not exists(stock code:{0} day:{1})".format(stock_code, fetch_date))
                 return Error.ERROR_TICK_DATA_NOT_EXISTS, None
@@ -72,10 +77,10 @@ class FactorKeeperDBTickDataDao(object):
         try:
             get_tick_dates_sql = """
                         SELECT DISTINCT "update_date" FROM "{0}"."{1}"
-                        WHERE end_update_time IS NOT NULL AND stock_code='{2}'
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS, stock_code)
+                        WHERE end_update_time IS NOT NULL AND stock_code=%s
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
 
-            res = pd.read_sql(get_tick_dates_sql, conn)['update_date'].tolist()
+            res = PreparedStatement.read_sql(conn, get_tick_dates_sql, (stock_code,))['update_date'].tolist()
             res.sort()
             return Error.SUCCESS, res
         except Exception:
@@ -84,6 +89,82 @@ class FactorKeeperDBTickDataDao(object):
         finally:
             conn.close()
 
+    def list_common_tick_dates(self, stock_codes):
+        """
+        list dates where tick data of all the stocks exists
+        :param stock_codes: list of stock codes
+        :return: err_code, list of date object
+        """
+        stock_codes = sorted(set(stock_codes))
+
+        conn = self.db_engine.connect()
+        try:
+            get_tick_dates_sql = """
+                        SELECT update_date FROM "{0}"."{1}"
+                        WHERE end_update_time IS NOT NULL AND stock_code=ANY(%s)
+                        GROUP BY update_date HAVING COUNT(DISTINCT stock_code)=%s
+                        ORDER BY update_date
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
+
+            res = pd.read_sql(get_tick_dates_sql, conn, params=(stock_codes, len(stock_codes)))['update_date'].tolist()
+            return Error.SUCCESS, res
+        except Exception:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+    def list_stocks_updated_on_day(self, stock_codes, day):
+        """
+        list stocks whose tick data on a day exists
+        :param stock_codes: list of stock codes to check
+        :param day: date object
+        :return: err_code, list of stock codes
+        """
+
+        conn = self.db_engine.connect()
+        try:
+            get_stocks_sql = """
+                        SELECT DISTINCT stock_code FROM "{0}"."{1}"
+                        WHERE end_update_time IS NOT NULL AND update_date=%s AND stock_code=ANY(%s)
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
+
+            res = pd.read_sql(get_stocks_sql, conn, params=(day, list(stock_codes)))['stock_code'].tolist()
+            return Error.SUCCESS, res
+        except Exception:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+    def get_tick_data_log_version(self, stock_codes, day):
+        """
+        Version of tick data of stocks on a day, it changes whenever tick data of any stock is updated again
+        :param stock_codes: list of stock codes
+        :param day: date object
+        :return: err_code, version string, None if tick data of some stock is not updated
+        """
+
+        conn = self.db_engine.connect()
+        try:
+            get_version_sql = """
+                        SELECT COUNT(DISTINCT stock_code) AS stock_num, COUNT(*) AS log_num, MAX(log_id) AS max_log_id
+                        FROM "{0}"."{1}"
+                        WHERE end_update_time IS NOT NULL AND update_date=%s AND stock_code=ANY(%s)
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
+
+            stock_codes = sorted(set(stock_codes))
+            row = pd.read_sql(get_version_sql, conn, params=(day, stock_codes)).iloc[0]
+            if row['stock_num'] < len(stock_codes):
+                return Error.SUCCESS, None
+
+            return Error.SUCCESS, "{0}-{1}".format(int(row['log_num']), int(row['max_log_id']))
+        except Exception:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
     def is_stock_table_exists(self, stock_code):
         """
         Check is stock tick data table exists in factor keeper database
@@ -94,8 +175,8 @@ class FactorKeeperDBTickDataDao(object):
         try:
             num = pd.read_sql("""
                 SELECT count(1) as num FROM pg_tables
-                WHERE schemaname='{0}' and tablename='{1}'
-            """.format(Schemas.SCHEMA_TICK_DATA, Tables.TABLE_TICK_STOCK_PREFIX + stock_code), con=conn)['num'][0]
+                WHERE schemaname=%s and tablename=%s
+            """, con=conn, params=(Schemas.SCHEMA_TICK_DATA, Tables.TABLE_TICK_STOCK_PREFIX + stock_code))['num'][0]
 
             if num > 0:
                 return Error.SUCCESS, True
@@ -118,9 +199,8 @@ class FactorKeeperDBTickDataDao(object):
         try:
             num = pd.read_sql("""
                 SELECT count(1) AS num FROM "{0}"."{1}"
-                WHERE stock_code='{2}' AND end_update_time IS NOT NULL
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS,
-                       stock_code), con=conn)['num'][0]
+                WHERE stock_code=%s AND end_update_time IS NOT NULL
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS), con=conn, params=(stock_code,))['num'][0]
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED, None
@@ -147,20 +227,18 @@ class FactorKeeperDBTickDataDao(object):
                                 stock_code,
                                 update_date
                                 )
-                                VALUES('{2}', '{3}', '{4}');
-                            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS,
-                                       now, stock_code, update_date)
+                                VALUES(%s, %s, %s);
+                            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
 
-            conn.execute(add_stock_list_log_sql)
+            conn.execute(add_stock_list_log_sql, (now, stock_code, update_date))
 
             # fetch this row and return log id
             fetch_row_sql = """
                         SELECT log_id FROM "{0}"."{1}" 
-                        WHERE start_update_time='{2}' AND stock_code='{3}' AND update_date='{4}'
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS,
-                               now, stock_code, update_date)
+                        WHERE start_update_time=%s AND stock_code=%s AND update_date=%s
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
 
-            id_df = pd.read_sql(fetch_row_sql, conn)
+            id_df = PreparedStatement.read_sql(conn, fetch_row_sql, (now, stock_code, update_date))
             if id_df.shape[0] == 0:
                 self.logger.log_error("Unable to fetch log id")
                 return Error.ERROR_SERVER_INTERNAL_ERROR, None
@@ -172,6 +250,39 @@ class FactorKeeperDBTickDataDao(object):
         finally:
             conn.close()
 
+    def add_finished_stock_tick_data_logs(self, stock_code, update_dates, start_update_time, con=None):
+        """
+        create finished update logs of days updated at once
+        :param stock_code: stock code
+        :param update_dates: list of updated dates
+        :param start_update_time: time when update started
+        :param con: run in the transaction of this connection if not None
+        :return: err_code
+        """
+        add_logs_sql = """
+                    INSERT INTO "{0}"."{1}"
+                    (
+                    start_update_time,
+                    end_update_time,
+                    stock_code,
+                    update_date
+                    )
+                    VALUES(%s, %s, %s, %s);
+                """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
+
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            now = datetime.datetime.now()
+            conn.execute(add_logs_sql, [(start_update_time, now, stock_code, day) for day in update_dates])
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            if con is None:
+                conn.close()
+
+        return Error.SUCCESS
+
     def finish_stock_tick_data_log(self, log_id):
         """
         create a finish update log
@@ -180,14 +291,13 @@ class FactorKeeperDBTickDataDao(object):
         """
         finish_stock_list_log_sql = """
                     UPDATE "{0}"."{1}" 
-                    SET end_update_time = '{2}'
-                    WHERE log_id = {3};
-                """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS,
-                           datetime.datetime.now(), log_id)
+                    SET end_update_time = %s
+                    WHERE log_id = %s;
+                """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_UPDATE_LOGS)
 
         conn = self.db_engine.connect()
         try:
-            conn.execute(finish_stock_list_log_sql)
+            conn.execute(finish_stock_list_log_sql, (datetime.datetime.now(), int(log_id)))
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED
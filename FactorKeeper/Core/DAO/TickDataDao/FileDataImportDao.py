@@ -0,0 +1,337 @@
+"""
+    Import tick data from a directory of daily dump files(csv or parquet), one file per exchange per day.
+    Dump files are decoded directly, they don't need to be staged into a database first.
+"""
+
+
+from Core.Error.Error import Error
+from Core.Conf.TickDataSourceConf import TickDataSourceFileConf
+from Core.DAO.ComplicatedTables.TickDataTable import TickDataTable
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import traceback, datetime, os, re
+import pandas as pd
+
+
+class FileDataImportDao(object):
+    """
+        This class is an implementation of interfaces defined by TickDataImportDao which
+        decode data from dump files:
+            -dates are discovered from file names(see TickDataSourceFileConf.FILE_NAME_PATTERN)
+            -only columns of tick data table are decoded, their names are mapped by COLUMN_MAPPING
+            -files are read in chunks of READ_ROWS_PER_CHUNK rows, only rows of requested stocks are kept
+            -files of a day, or of the days of a range, are decoded in parallel by a thread pool
+        Stock codes of a file are cached per process until the file is modified.
+    """
+    __stock_codes_cache = {}
+    __stock_codes_cache_lock = Lock()
+
+    def __init__(self, logger):
+        """
+        :param logger:
+        """
+        self.logger = logger.sub_logger(self.__class__.__name__)
+        self.file_name_re = re.compile(TickDataSourceFileConf.FILE_NAME_PATTERN)
+        self.tick_columns = set(TickDataTable().get_column_name_list(without_quote=True)) - {"id"}
+
+    def list_files(self):
+        """
+        :return: dict of date object -> list of dump file paths of the day
+        """
+        files = {}
+        for name in sorted(os.listdir(TickDataSourceFileConf.ROOT_DIR)):
+            match = self.file_name_re.match(name)
+            if match is None or match.group('format') not in TickDataSourceFileConf.FILE_FORMATS:
+                continue
+
+            day = datetime.datetime.strptime(match.group('date'), TickDataSourceFileConf.DATE_FORMAT).date()
+            files.setdefault(day, []).append(os.path.join(TickDataSourceFileConf.ROOT_DIR, name))
+
+        return files
+
+    def get_tick_dates_from_data_source(self, stock_code):
+        """
+        Implementation of "get_tick_dates_from_data_source", stock codes of every file are read so
+        the date catalog should be enabled with file sources
+        :param stock_code: stock code
+        :return: err_code, sorted list of date objects
+        """
+        err, df = self.list_tick_dates_on(sorted(self.list_files()))
+        if err:
+            return err, []
+
+        return Error.SUCCESS, sorted(df[df['stock_code'] == stock_code]['date'].tolist())
+
+    def list_tick_date_signatures(self, since=None, days=None):
+        """
+        Implementation of "list_tick_date_signatures", the signature of a day is made of names, sizes and
+        modification times of its files, so no file is decoded.
+        :param since: date object, only days at or after it are listed if not None
+        :param days: list of date objects, only these days are listed if not None
+        :return: err_code, dict of date object -> signature string
+        """
+        since = self.__to_date(since) if since is not None else None
+        days = set(self.__to_date(day) for day in days) if days is not None else None
+
+        try:
+            files = self.list_files()
+            signatures = {}
+            for day, paths in files.items():
+                if since is not None and day < since or days is not None and day not in days:
+                    continue
+                stats = [(os.path.basename(path), os.stat(path)) for path in sorted(paths)]
+                signatures[day] = ",".join("{0}:{1}:{2}".format(name, stat.st_size, stat.st_mtime)
+                                           for name, stat in stats)
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None
+
+        return Error.SUCCESS, signatures
+
+    def list_tick_days_before(self, day):
+        """
+        Implementation of "list_tick_days_before", days are found from file names.
+        :param day: date object
+        :return: err_code, sorted list of date objects
+        """
+        day = self.__to_date(day)
+
+        try:
+            return Error.SUCCESS, sorted(file_day for file_day in self.list_files() if file_day < day)
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None
+
+    def list_tick_dates_on(self, days):
+        """
+        Implementation of "list_tick_dates_on".
+        :param days: list of date objects
+        :return: err_code, dataframe with "stock_code" and "date" columns
+        """
+        days = set(self.__to_date(day) for day in days)
+
+        try:
+            files = self.list_files()
+            paths = [(day, path) for day in sorted(files) if day in days for path in files[day]]
+
+            with ThreadPoolExecutor(TickDataSourceFileConf.DECODE_THREADS) as pool:
+                stock_codes = list(pool.map(lambda item: self.__read_stock_codes(item[1]), paths))
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None
+
+        rows = set()
+        for (day, _), codes in zip(paths, stock_codes):
+            rows.update((code, day) for code in codes)
+
+        return Error.SUCCESS, pd.DataFrame(sorted(rows), columns=['stock_code', 'date'])
+
+    def is_stock_available(self, stock_code):
+        """
+        Implementation of "is_stock_available", files are searched from the latest day
+        :param stock_code: stock code
+        :return: err_code, True if stock data exists in dump files, else False
+        """
+        try:
+            files = self.list_files()
+            for day in sorted(files, reverse=True):
+                for path in files[day]:
+                    if stock_code in self.__read_stock_codes(path):
+                        return Error.SUCCESS, True
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None
+
+        return Error.SUCCESS, False
+
+    def get_tick_data_from_data_source_on_day(self, stock_code, day):
+        """
+        Implementation of "get_tick_data_from_data_source_on_day".
+        :param stock_code: stock code
+        :param day: specify a day to fetch tick data
+        :return: err_code, a dataframe contains tick data on "day"
+        """
+        err, df = self.__read_day(self.__to_date(day), {stock_code})
+        if err:
+            return err, None
+
+        if df is None:
+            return Error.ERROR_TICK_DATA_NOT_EXISTS_IN_OLD_DB_ON_DAY, None
+
+        return Error.SUCCESS, df
+
+    def iter_tick_data_from_data_source_by_range(self, stock_code, start_day, end_day):
+        """
+        Implementation of "iter_tick_data_from_data_source_by_range". Files of all days in range are decoded in
+        parallel, days are yielded in order as soon as their files are decoded.
+        :param stock_code: stock code
+        :param start_day:
+        :param end_day:
+        :return: iterator of (err_code, day, dataframe of tick data on day)
+        """
+        start_day, end_day = self.__to_date(start_day), self.__to_date(end_day)
+
+        try:
+            files = self.list_files()
+        except:
+            self.logger.log_error(traceback.format_exc())
+            yield Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None, None
+            return
+
+        days = [day for day in sorted(files) if start_day <= day <= end_day]
+        pool = ThreadPoolExecutor(TickDataSourceFileConf.DECODE_THREADS)
+        day_futures = [(day, [pool.submit(self.__read_file, path, day, {stock_code}) for path in files[day]])
+                       for day in days]
+        try:
+            for day, futures in day_futures:
+                try:
+                    df = self.__merge([future.result() for future in futures])
+                except:
+                    self.logger.log_error(traceback.format_exc())
+                    yield Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None, None
+                    return
+
+                if df is not None:
+                    yield Error.SUCCESS, day, df
+        finally:
+            # iteration may be stopped early, files not decoded yet are skipped
+            for _, futures in day_futures:
+                for future in futures:
+                    future.cancel()
+            pool.shutdown(wait=False)
+
+    def import_day_for_universe(self, stock_codes, day):
+        """
+        Implementation of "import_day_for_universe".
+        :param stock_codes: list of stock codes
+        :param day: specify a day to fetch tick data
+        :return: iterator of (err_code, stock code, dataframe of tick data of stock on day)
+        """
+        err, df = self.__read_day(self.__to_date(day), set(stock_codes))
+        if err:
+            yield err, None, None
+            return
+
+        if df is None:
+            return
+
+        for stock_code, stock_df in df.groupby(TickDataSourceFileConf.STOCK_CODE_COL_NAME, sort=True):
+            yield Error.SUCCESS, stock_code, stock_df.reset_index(drop=True)
+
+    def __read_day(self, day, stock_codes):
+        """
+        Decode files of a day in parallel
+        :param day: date object
+        :param stock_codes: set of stock codes to keep
+        :return: err_code, dataframe sorted by stock code and datetime, None if no rows found
+        """
+        try:
+            paths = self.list_files().get(day, [])
+            with ThreadPoolExecutor(TickDataSourceFileConf.DECODE_THREADS) as pool:
+                dfs = list(pool.map(lambda path: self.__read_file(path, day, stock_codes), paths))
+            return Error.SUCCESS, self.__merge(dfs)
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_TICK_SOURCE_FILE_READ_FAILED, None
+
+    def __read_file(self, path, day, stock_codes):
+        """
+        Decode rows of stocks from a dump file
+        :param path: dump file path
+        :param day: date of dump file
+        :param stock_codes: set of stock codes to keep
+        :return: dataframe with mapped column names, "datetime" and "date" columns, None if no rows found
+        """
+        stock_col = TickDataSourceFileConf.STOCK_CODE_COL_NAME
+        chunks = []
+        for chunk_df in self.__iter_file_chunks(path, self.__is_decoded_column):
+            chunk_df = chunk_df[chunk_df[stock_col].isin(stock_codes)]
+            if chunk_df.shape[0] > 0:
+                chunks.append(chunk_df)
+
+        if len(chunks) == 0:
+            return None
+
+        df = pd.concat(chunks, ignore_index=True)
+        df = df.rename(columns=dict(TickDataSourceFileConf.COLUMN_MAPPING,
+                                    **{TickDataSourceFileConf.DATETIME_COL_NAME: 'datetime'}))
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        df['date'] = day
+        return df
+
+    def __read_stock_codes(self, path):
+        """
+        :param path: dump file path
+        :return: set of stock codes in a dump file
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        cls = FileDataImportDao
+
+        cls.__stock_codes_cache_lock.acquire()
+        try:
+            if key in cls.__stock_codes_cache:
+                return cls.__stock_codes_cache[key]
+        finally:
+            cls.__stock_codes_cache_lock.release()
+
+        stock_col = TickDataSourceFileConf.STOCK_CODE_COL_NAME
+        stock_codes = set()
+        for chunk_df in self.__iter_file_chunks(path, lambda col: col == stock_col):
+            stock_codes.update(chunk_df[stock_col].unique().tolist())
+        stock_codes = frozenset(stock_codes)
+
+        cls.__stock_codes_cache_lock.acquire()
+        try:
+            for cached_key in [k for k in cls.__stock_codes_cache if k[0] == path]:
+                cls.__stock_codes_cache.pop(cached_key)
+            cls.__stock_codes_cache[key] = stock_codes
+        finally:
+            cls.__stock_codes_cache_lock.release()
+
+        return stock_codes
+
+    @staticmethod
+    def __iter_file_chunks(path, is_decoded_column):
+        """
+        Read a dump file in chunks of READ_ROWS_PER_CHUNK rows
+        :param path: dump file path
+        :param is_decoded_column: function telling if a column should be decoded by its name in file
+        :return: iterator of dataframes
+        """
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            parquet_file = pq.ParquetFile(path)
+            columns = [col for col in parquet_file.schema_arrow.names if is_decoded_column(col)]
+            for batch in parquet_file.iter_batches(batch_size=TickDataSourceFileConf.READ_ROWS_PER_CHUNK,
+                                                   columns=columns):
+                yield batch.to_pandas()
+        else:
+            for chunk_df in pd.read_csv(path, usecols=is_decoded_column,
+                                        chunksize=TickDataSourceFileConf.READ_ROWS_PER_CHUNK):
+                yield chunk_df
+
+    def __is_decoded_column(self, column):
+        if column in (TickDataSourceFileConf.STOCK_CODE_COL_NAME, TickDataSourceFileConf.DATETIME_COL_NAME):
+            return True
+
+        return TickDataSourceFileConf.COLUMN_MAPPING.get(column, column) in self.tick_columns
+
+    @staticmethod
+    def __merge(dfs):
+        dfs = [df for df in dfs if df is not None]
+        if len(dfs) == 0:
+            return None
+
+        df = pd.concat(dfs, ignore_index=True)
+        return df.sort_values([TickDataSourceFileConf.STOCK_CODE_COL_NAME, 'datetime'],
+                              kind='mergesort').reset_index(drop=True)
+
+    @staticmethod
+    def __to_date(day):
+        if isinstance(day, str):
+            return datetime.datetime.strptime(day, "%Y-%m-%d").date()
+        if isinstance(day, datetime.datetime):
+            return day.date()
+        return day
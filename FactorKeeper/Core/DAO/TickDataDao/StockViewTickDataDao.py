@@ -16,15 +16,29 @@
 
 
 from Core.DAO.ComplicatedTables.TickDataTable import TickDataTable
-from Core.Conf.DatabaseConf import Schemas, Tables
+from Core.DAO.QueryClause import make_time_window_clause, make_column_list
+from Core.DAO.PreparedStatement import PreparedStatement
+from Core.Conf.DatabaseConf import Schemas, Tables, TickDataSourceDatabaseConf
 from Core.Conf.TickDataConf import TickDataConf
 from Core.DAO.TickDataDao.TickDataImportDao import TickDataImportDao
+from Core.DAO.TickDataDao.TickDateCatalogDao import TickDateCatalogDao
+from Core.DAO.TickDataDao.FactorKeeperDBTickDataDao import FactorKeeperDBTickDataDao
+from Util.CacheUtil.LRUCache import ByteBudgetLRUCache
 from Core.Error.Error import Error
-import traceback
+import traceback, datetime
 import pandas as pd
 
 
 class StockViewTickDataDao(object):
+    """
+        Views are never modified after creation, so their definitions are cached in process, cached definitions
+        and days of a view are dropped when the view is created again. Assembled days of virtual views are cached
+        with the tick data version of their stocks(see "get_tick_data_log_version" of FactorKeeperDBTickDataDao),
+        which is checked before a cached day is served, so days of stocks updated again are assembled again.
+    """
+    __view_definitions = {}
+    __virtual_view_cache = ByteBudgetLRUCache(TickDataConf.VIRTUAL_VIEW_CACHE_MAX_BYTES)
+
     def __init__(self, db_engine, logger):
         """
         :param db_engine: sqlalchemy database engine
@@ -33,8 +47,10 @@ class StockViewTickDataDao(object):
         self.db_engine = db_engine
         self.logger = logger.sub_logger(self.__class__.__name__)
         self.tick_data_import_dao = TickDataImportDao(db_engine, logger)
+        self.catalog_dao = TickDateCatalogDao(db_engine, logger)
+        self.factor_keeper_dao = FactorKeeperDBTickDataDao(db_engine, logger)
 
-    def create_stock_view(self, stock_view_name, stock_relation):
+    def create_stock_view(self, stock_view_name, stock_relation, view_type=TickDataConf.STOCK_VIEW_TYPE_MATERIALIZED):
         """
         create a stock view with name "stock_view_name" and table relation "stock_relation".
         stock_relation should be defined as a dict:
@@ -45,10 +61,15 @@ class StockViewTickDataDao(object):
             }
         :param stock_view_name: stock view name
         :param stock_relation: stock view relation
+        :param view_type: one of TickDataConf.STOCK_VIEW_TYPES
         :return: err_code, error message
         """
         import json
 
+        if view_type not in TickDataConf.STOCK_VIEW_TYPES:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, "stock view type must be one of {}".\
+                format(list(TickDataConf.STOCK_VIEW_TYPES))
+
         err, is_stock_view_exists = self.is_stock_view_exists(stock_view_name)
         if err:
             return err
@@ -113,48 +134,85 @@ class StockViewTickDataDao(object):
         relation_json = json.dumps(stock_relation)
 
         insert_sql = """
-            INSERT INTO "{0}"."{1}"(stock_view_name, stock_view_relation)
-            VALUES(%s, %s)
+            INSERT INTO "{0}"."{1}"(stock_view_name, stock_view_relation, view_type)
+            VALUES(%s, %s, %s)
         """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST)
 
         conn = self.db_engine.connect()
         try:
-            conn.execute(insert_sql, (stock_view_name, relation_json))
+            conn.execute(insert_sql, (stock_view_name, relation_json, view_type))
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED, None
         finally:
             conn.close()
 
+        # a view dropped and created again must not be served from what was cached for its old definition
+        self.drop_cached_stock_view(stock_view_name)
+
         return Error.SUCCESS, None
 
-    def get_stock_view_relation(self, stock_view_name):
+    @staticmethod
+    def drop_cached_stock_view(stock_view_name):
         """
-        Fetch stock view relation which returned as a dict
+        Drop cached definition and assembled days of a stock view
         :param stock_view_name: stock view name
-        :return: err_code, stock view relation
+        """
+        StockViewTickDataDao.__view_definitions.pop(stock_view_name, None)
+        StockViewTickDataDao.__virtual_view_cache.invalidate_matching(lambda key: key[0] == stock_view_name)
+
+    def get_stock_view_definition(self, stock_view_name):
+        """
+        Fetch stock view relation and type
+        :param stock_view_name: stock view name
+        :return: err_code, stock view relation as a dict, stock view type
         """
         import json
 
+        definition = StockViewTickDataDao.__view_definitions.get(stock_view_name, None)
+        if definition is not None:
+            return Error.SUCCESS, json.loads(definition[0]), definition[1]
+
         conn = self.db_engine.connect()
         try:
             stock_view_relation_df = pd.read_sql("""
-                SELECT stock_view_relation FROM "{0}"."{1}"
-                WHERE stock_view_name='{2}'
-            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST, stock_view_name), con=conn)
+                SELECT stock_view_relation, view_type FROM "{0}"."{1}"
+                WHERE stock_view_name=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST), con=conn, params=(stock_view_name,))
 
             if stock_view_relation_df.shape[0] == 0:
-                return Error.ERROR_TICK_STOCK_VIEW_NOT_EXISTS, None
+                return Error.ERROR_TICK_STOCK_VIEW_NOT_EXISTS, None, None
 
             relation_json = stock_view_relation_df['stock_view_relation'][0]
-            relation_dict = json.loads(relation_json)
-            return Error.SUCCESS, relation_dict
+            view_type = stock_view_relation_df['view_type'][0]
+            StockViewTickDataDao.__view_definitions[stock_view_name] = (relation_json, view_type)
+            return Error.SUCCESS, json.loads(relation_json), view_type
         except:
             self.logger.log_error(traceback.format_exc())
-            return Error.ERROR_DB_EXECUTION_FAILED
+            return Error.ERROR_DB_EXECUTION_FAILED, None, None
         finally:
             conn.close()
 
+    def get_stock_view_relation(self, stock_view_name):
+        """
+        Fetch stock view relation which returned as a dict
+        :param stock_view_name: stock view name
+        :return: err_code, stock view relation
+        """
+        err, relation, _ = self.get_stock_view_definition(stock_view_name)
+        return err, relation
+
+    def is_virtual_stock_view(self, stock_view_name):
+        """
+        :param stock_view_name: stock view name
+        :return: err_code, True if stock view is assembled on read else False
+        """
+        err, _, view_type = self.get_stock_view_definition(stock_view_name)
+        if err:
+            return err, None
+
+        return Error.SUCCESS, view_type == TickDataConf.STOCK_VIEW_TYPE_VIRTUAL
+
     def is_stock_view_exists(self, stock_view_name):
         """
         Check weather stock view exists.
@@ -166,8 +224,9 @@ class StockViewTickDataDao(object):
         try:
             stock_view_relation_df = pd.read_sql("""
                         SELECT count(1) as stock_count FROM "{0}"."{1}"
-                        WHERE stock_view_name='{2}'
-                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST, stock_view_name), con=conn)
+                        WHERE stock_view_name=%s
+                    """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_STOCK_VIEW_LIST), con=conn,
+                                                 params=(stock_view_name,))
 
             return Error.SUCCESS, stock_view_relation_df['stock_count'][0] > 0
         except:
@@ -194,6 +253,9 @@ class StockViewTickDataDao(object):
             return err, None
 
         stocks = stock_view_relation.keys()
+        if TickDataSourceDatabaseConf.DATE_CATALOG_ENABLED:
+            return self.catalog_dao.list_common_dates(list(stocks))
+
         available_dates = None
         for stock in stocks:
             err, dates = self.tick_data_import_dao.get_tick_dates_from_data_source(stock)
@@ -211,21 +273,32 @@ class StockViewTickDataDao(object):
 
         return Error.SUCCESS, available_dates
 
-    def load_stock_view_data(self, stock_view_name, day):
+    def load_stock_view_data(self, stock_view_name, day, columns=None, start_time=None, end_time=None):
         """
         Load stock view data from factor keeper database.
         :param stock_view_name: stock view name
         :param day: the day to fetch
+        :param columns: list of columns to fetch, all columns are fetched if None
+        :param start_time: only ticks not earlier than start_time(datetime.time) are fetched if not None
+        :param end_time: only ticks not later than end_time(datetime.time) are fetched if not None
         :return: err_code, a dataframe contains stock view tick data
         """
+        err, is_virtual = self.is_virtual_stock_view(stock_view_name)
+        if err:
+            return err, None
+
+        if is_virtual:
+            return self.load_virtual_stock_view_data(stock_view_name, day, columns=columns, start_time=start_time,
+                                                     end_time=end_time)
 
         conn = self.db_engine.connect()
         try:
-            stock_view_df = pd.read_sql("""
-                                SELECT * FROM "{0}"."{1}"
-                                WHERE "date"='{2}'
+            time_window_clause, time_window_params = make_time_window_clause(start_time, end_time)
+            stock_view_df = PreparedStatement.read_sql(conn, """
+                                SELECT {2} FROM "{0}"."{1}"
+                                WHERE "date"=%s {3}
                             """.format(Schemas.SCHEMA_STOCK_VIEW_DATA, Tables.TABLE_TICK_STOCK_VIEW_PREFIX + stock_view_name,
-                                       day), con=conn)
+                                       make_column_list(columns), time_window_clause), (day,) + time_window_params)
 
             return Error.SUCCESS, stock_view_df
         except:
@@ -234,6 +307,126 @@ class StockViewTickDataDao(object):
         finally:
             conn.close()
 
+    def load_virtual_stock_view_data(self, stock_view_name, day, columns=None, start_time=None, end_time=None):
+        """
+        Assemble a day of virtual stock view data from its constituent stocks, complete days are cached with the
+        tick data version of the stocks
+        :param stock_view_name: stock view name
+        :param day: the day to fetch
+        :param columns: list of columns to fetch, all columns are fetched if None
+        :param start_time: only ticks not earlier than start_time(datetime.time) are fetched if not None
+        :param end_time: only ticks not later than end_time(datetime.time) are fetched if not None
+        :return: err_code, a dataframe contains stock view tick data
+        """
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+
+        err, relation = self.get_stock_view_relation(stock_view_name)
+        if err:
+            return err, None
+
+        # version of a day changes when any stock of view is updated again, None if some stock is not updated
+        err, version = self.factor_keeper_dao.get_tick_data_log_version(list(relation.keys()), day)
+        if err:
+            return err, None
+
+        cache = StockViewTickDataDao.__virtual_view_cache
+        is_hit, entry = cache.get((stock_view_name, day))
+        if is_hit and version is not None and entry[0] == version:
+            view_df = entry[1]
+        else:
+            is_complete = version is not None
+            stock_dfs = []
+            for stock in relation:
+                err, stock_df = self.factor_keeper_dao.load_data_by_code(stock, day,
+                                                                         columns=relation[stock] + ["datetime"])
+                if err:
+                    return err, None
+
+                is_complete = is_complete and stock_df.shape[0] == TickDataConf.TICK_LENGTH
+                stock_df = stock_df.set_index('datetime')[relation[stock]]
+                stock_df.columns = ["{0}_{1}".format(col, stock) for col in relation[stock]]
+                stock_dfs.append(stock_df)
+
+            view_df = pd.concat(stock_dfs, axis=1, join='inner').sort_index()
+            view_df.index.name = 'datetime'
+            view_df = view_df.reset_index()
+            view_df['date'] = day
+
+            if is_complete:
+                cache.put((stock_view_name, day), (version, view_df), int(view_df.memory_usage(deep=True).sum()))
+            elif is_hit:
+                cache.invalidate((stock_view_name, day))
+
+        if start_time is not None or end_time is not None:
+            times = view_df['datetime'].dt.time
+            is_selected = pd.Series(True, index=view_df.index)
+            if start_time is not None:
+                is_selected &= times >= start_time
+            if end_time is not None:
+                is_selected &= times <= end_time
+            view_df = view_df[is_selected].reset_index(drop=True)
+
+        if columns is not None:
+            view_df = view_df[list(columns)]
+
+        # cached dataframe is shared, callers get their own copy
+        return Error.SUCCESS, view_df.copy()
+
+    def materialize_stock_view(self, stock_view_name, stock_relation, days, con=None):
+        """
+        Materialize stock view data of days with a single "INSERT ... SELECT" which joins the
+        constituent stock tables on datetime inside database, rows already materialized on the days
+        are deleted by the same statement so that days can be materialized again
+        :param stock_view_name: stock view name
+        :param stock_relation: stock view relation
+        :param days: list of date objects
+        :param con: run in the transaction of this connection if not None
+        :return: err_code, dict of row number inserted of each day
+        """
+        stocks = list(stock_relation.keys())
+
+        insert_columns = []
+        select_columns = []
+        from_clause = ""
+        for i, stock in enumerate(stocks):
+            alias = "S{}".format(i)
+            for col in stock_relation[stock]:
+                insert_columns.append('"{0}_{1}"'.format(col, stock))
+                select_columns.append('{0}."{1}"'.format(alias, col))
+
+            table = '"{0}"."{1}{2}" {3}'.format(Schemas.SCHEMA_TICK_DATA, Tables.TABLE_TICK_STOCK_PREFIX, stock, alias)
+            if i == 0:
+                from_clause = table
+            else:
+                from_clause += ' JOIN {0} ON {1}.datetime=S0.datetime AND {1}."date"=S0."date"'.format(table, alias)
+
+        # both parts of the statement see the same snapshot, inserted rows are not deleted
+        insert_sql = """
+            WITH deleted AS (
+                DELETE FROM "{0}"."{1}{2}" WHERE "date"=ANY(%s)
+            )
+            INSERT INTO "{0}"."{1}{2}"({3}, datetime, "date")
+            SELECT {4}, S0.datetime, S0."date" FROM {5}
+            WHERE S0."date"=ANY(%s)
+            RETURNING "date"
+        """.format(Schemas.SCHEMA_STOCK_VIEW_DATA, Tables.TABLE_TICK_STOCK_VIEW_PREFIX, stock_view_name,
+                   ", ".join(insert_columns), ", ".join(select_columns), from_clause)
+
+        conn = con if con is not None else self.db_engine.connect()
+        try:
+            row_nums = {day: 0 for day in days}
+            for row in conn.execute(insert_sql, (list(days), list(days))):
+                row_nums[row[0]] = row_nums.get(row[0], 0) + 1
+
+            return Error.SUCCESS, row_nums
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            if con is None:
+                conn.close()
+
     def create_stock_view_index_if_not_exists(self, stock_view_name):
         """
         create stock view index if not exists
@@ -265,9 +458,9 @@ class StockViewTickDataDao(object):
         try:
             num = pd.read_sql("""
                         SELECT count(1) as num FROM pg_tables
-                        WHERE schemaname='{0}' and tablename='{1}'
-                    """.format(Schemas.SCHEMA_STOCK_VIEW_DATA, Tables.TABLE_TICK_STOCK_VIEW_PREFIX + stock_view_name),
-                              con=conn)['num'][0]
+                        WHERE schemaname=%s and tablename=%s
+                    """, con=conn, params=(Schemas.SCHEMA_STOCK_VIEW_DATA,
+                                           Tables.TABLE_TICK_STOCK_VIEW_PREFIX + stock_view_name))['num'][0]
 
             if num > 0:
                 return Error.SUCCESS, True
@@ -9,6 +9,9 @@ from Core.Conf.TickDataConf import TickDataConf
 from Core.DAO.TickDataDao.TickDataImportDao import TickDataImportDao
 from Core.DAO.TickDataDao.FactorKeeperDBTickDataDao import FactorKeeperDBTickDataDao
 from Core.DAO.TickDataDao.StockViewTickDataDao import StockViewTickDataDao
+from Core.DAO.TickDataDao.TickDateCatalogDao import TickDateCatalogDao
+from Core.Conf.DatabaseConf import Schemas, Tables, TickDataSourceDatabaseConf
+import traceback, datetime
 
 
 class TickDataDao(object):
@@ -23,6 +26,7 @@ class TickDataDao(object):
         self.tick_data_source_dao = TickDataImportDao(db_engine, self.logger)
         self.factor_keeper_dao = FactorKeeperDBTickDataDao(db_engine, self.logger)
         self.stock_view_dao = StockViewTickDataDao(db_engine, self.logger)
+        self.catalog_dao = TickDateCatalogDao(db_engine, self.logger)
 
     # common interface
     def is_stock_available(self, stock_code):
@@ -34,17 +38,51 @@ class TickDataDao(object):
     def list_available_tick_dates(self, stock_code):
         if TickDataConf.is_stock_view(stock_code):
             return self.stock_view_dao.get_stock_view_available_dates(stock_code)
+        elif TickDataSourceDatabaseConf.DATE_CATALOG_ENABLED:
+            return self.catalog_dao.list_dates(stock_code)
         else:
             return self.tick_data_source_dao.get_tick_dates_from_data_source(stock_code)
 
+    def refresh_date_catalog(self, full=False, check_backfill=False):
+        return self.catalog_dao.refresh(full=full, check_backfill=check_backfill)
+
     def list_updated_dates(self, stock_code):
+        if TickDataConf.is_stock_view(stock_code):
+            err, relation, view_type = self.stock_view_dao.get_stock_view_definition(stock_code)
+            if err:
+                return err, None
+
+            # a virtual view is available wherever all of its stocks are
+            if view_type == TickDataConf.STOCK_VIEW_TYPE_VIRTUAL:
+                return self.factor_keeper_dao.list_common_tick_dates(list(relation.keys()))
+
         return self.factor_keeper_dao.list_tick_dates(stock_code)
 
-    def load_updated_tick_data(self, stock_code, day, columns=None):
+    def load_updated_tick_data(self, stock_code, day, columns=None, start_time=None, end_time=None):
         if TickDataConf.is_stock_view(stock_code):
-            return self.stock_view_dao.load_stock_view_data(stock_code, day)
+            return self.stock_view_dao.load_stock_view_data(stock_code, day, columns=columns, start_time=start_time,
+                                                            end_time=end_time)
         else:
-            return self.factor_keeper_dao.load_data_by_code(stock_code, day, columns=columns)
+            return self.factor_keeper_dao.load_data_by_code(stock_code, day, columns=columns, start_time=start_time,
+                                                            end_time=end_time)
+
+    def get_tick_data_version(self, stock_code, day):
+        """
+        :param stock_code: stock code or stock view name
+        :param day: date object
+        :return: err_code, version string of tick data on day taken from tick update logs, None if not updated
+        """
+        stock_codes = [stock_code]
+        if TickDataConf.is_stock_view(stock_code):
+            err, relation, view_type = self.stock_view_dao.get_stock_view_definition(stock_code)
+            if err:
+                return err, None
+
+            # a virtual view changes with any of its stocks
+            if view_type == TickDataConf.STOCK_VIEW_TYPE_VIRTUAL:
+                stock_codes = list(relation.keys())
+
+        return self.factor_keeper_dao.get_tick_data_log_version(stock_codes, day)
 
     def is_tick_data_newest_version(self, stock_code):
         err, available_dates = self.list_available_tick_dates(stock_code)
@@ -59,6 +97,12 @@ class TickDataDao(object):
         return Error.SUCCESS, len(set(available_dates) - set(new_db_dates)) == 0
 
     # outer source interface
+    def iter_data_from_outer_source_by_range(self, stock_code, start_day, end_day):
+        return self.tick_data_source_dao.iter_tick_data_from_data_source_by_range(stock_code, start_day, end_day)
+
+    def import_day_for_universe(self, stock_codes, day):
+        return self.tick_data_source_dao.import_day_for_universe(stock_codes, day)
+
     def load_data_from_outer_source(self, stock_code, day):
         return self.tick_data_source_dao.get_tick_data_from_data_source_on_day(stock_code, day)
 
@@ -69,19 +113,94 @@ class TickDataDao(object):
     def is_stock_data_updated_in_factor_keeper_db(self, stock_code):
         return self.factor_keeper_dao.is_stock_data_exists(stock_code)
 
+    def list_stocks_updated_on_day(self, stock_codes, day):
+        return self.factor_keeper_dao.list_stocks_updated_on_day(stock_codes, day)
+
     def create_new_update_log(self, stock_code, day):
         return self.factor_keeper_dao.new_stock_tick_data_log(stock_code, day)
 
     def finish_update_log(self, log_id):
         return self.factor_keeper_dao.finish_stock_tick_data_log(log_id)
 
+    def save_day_tick_data(self, stock_code, day, df):
+        """
+        Save tick data of a whole day aligned to the tick grid and log it
+        :param stock_code: stock code or stock view name
+        :param day: date object
+        :param df: dataframe of TickDataConf.TICK_LENGTH rows with time columns
+        :return: err_code
+        """
+        err, log_id = self.create_new_update_log(stock_code, day)
+        if err:
+            return err
+
+        conn = self.db_engine.connect()
+        try:
+            if not TickDataConf.is_stock_view(stock_code):
+                df.to_sql(Tables.TABLE_TICK_STOCK_PREFIX + stock_code, schema=Schemas.SCHEMA_TICK_DATA,
+                          if_exists='append', index=False, con=conn)
+            else:
+                df.to_sql(Tables.TABLE_TICK_STOCK_VIEW_PREFIX + stock_code, schema=Schemas.SCHEMA_STOCK_VIEW_DATA,
+                          if_exists='append', index=False, con=conn)
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            conn.close()
+
+        return self.finish_update_log(log_id)
+
     # stock view interface(inherit from factor keeper tick db)
-    def create_stock_view(self, stock_code, stock_relation):
-        return self.stock_view_dao.create_stock_view(stock_code, stock_relation)
+    def create_stock_view(self, stock_code, stock_relation, view_type=TickDataConf.STOCK_VIEW_TYPE_MATERIALIZED):
+        return self.stock_view_dao.create_stock_view(stock_code, stock_relation, view_type=view_type)
+
+    def is_virtual_stock_view(self, stock_code):
+        return self.stock_view_dao.is_virtual_stock_view(stock_code)
 
     def get_stock_view_relation(self, stock_code):
         return self.stock_view_dao.get_stock_view_relation(stock_code)
 
+    def materialize_stock_view(self, stock_code, days):
+        """
+        Materialize stock view data of days inside database and log them in one transaction,
+        nothing is written unless every constituent stock has full tick data on every day
+        :param stock_code: stock view name
+        :param days: list of date objects
+        :return: err_code
+        """
+        err, relation = self.get_stock_view_relation(stock_code)
+        if err:
+            return err
+
+        start_time = datetime.datetime.now()
+        conn = self.db_engine.connect()
+        try:
+            trans = conn.begin()
+            try:
+                err, row_nums = self.stock_view_dao.materialize_stock_view(stock_code, relation, days, con=conn)
+                if not err:
+                    incomplete_days = [day for day in days if row_nums.get(day, 0) != TickDataConf.TICK_LENGTH]
+                    if len(incomplete_days) > 0:
+                        self.logger.log_error("stock view data incomplete on {}".format(incomplete_days))
+                        err = Error.ERROR_TICK_RESULT_INCORRECT
+                if not err:
+                    err = self.factor_keeper_dao.add_finished_stock_tick_data_logs(stock_code, days, start_time,
+                                                                                   con=conn)
+            except:
+                trans.rollback()
+                raise
+
+            if err:
+                trans.rollback()
+            else:
+                trans.commit()
+            return err
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            conn.close()
+
     def create_stock_view_index_if_not_exists(self, stock_code):
         return self.stock_view_dao.create_stock_view_index_if_not_exists(stock_code)
 
@@ -6,6 +6,8 @@
 
 from Core.Error.Error import Error
 from Core.Conf.DatabaseConf import TickDataSourceDatabaseConf
+from Core.Conf.TickDataSourceConf import TickDataSourceConf
+from Core.DAO.TickDataDao.FileDataImportDao import FileDataImportDao
 import traceback, datetime
 import pandas as pd
 
@@ -13,8 +15,9 @@ import pandas as pd
 class TickDataImportDao(object):
     """
         This class lists the interfaces used to import tick data from outer source.
-        Default implementation import data from an existing database, you may modify
-        its functions to adapt to your data source.
+        Default implementation import data from an existing database, data can also be imported
+        from a directory of dump files(see TickDataSourceConf), you may modify its functions
+        to adapt to your data source.
     """
     def __init__(self, db_engine, logger):
         """
@@ -23,7 +26,12 @@ class TickDataImportDao(object):
         """
         self.db_engine = db_engine
         self.logger = logger.sub_logger(self.__class__.__name__)
-        self.db_importer = OuterDBDataImportDao(db_engine, logger)
+        if TickDataSourceConf.is_file_source():
+            self.db_importer = None
+            self.file_importer = FileDataImportDao(logger)
+        else:
+            self.db_importer = OuterDBDataImportDao(db_engine, logger)
+            self.file_importer = None
 
     def get_tick_dates_from_data_source(self, stock_code):
         """
@@ -33,8 +41,50 @@ class TickDataImportDao(object):
         :return: err_code, tick data dataframe with "date" and "datetime" column
         """
 
+        if self.file_importer is not None:
+            return self.file_importer.get_tick_dates_from_data_source(stock_code)
+
         return self.db_importer.get_tick_dates_from_old_db(stock_code)
 
+    def list_tick_date_signatures(self, since=None, days=None):
+        """
+        List days available in data source with a signature of their data, a day is listed again into the date
+        catalog when its signature changes, so that days loaded or reloaded into data source in any order are found
+        :param since: date object, only days at or after it are listed if not None
+        :param days: list of date objects, only these days are listed if not None
+        :return: err_code, dict of date object -> signature string
+        """
+
+        if self.file_importer is not None:
+            return self.file_importer.list_tick_date_signatures(since=since, days=days)
+
+        return self.db_importer.list_tick_date_signatures_from_old_db(since=since, days=days)
+
+    def list_tick_days_before(self, day):
+        """
+        List days available in data source before a day without reading their data, used by the date catalog to
+        find days backfilled below the latest day it has cataloged
+        :param day: date object
+        :return: err_code, sorted list of date objects
+        """
+
+        if self.file_importer is not None:
+            return self.file_importer.list_tick_days_before(day)
+
+        return self.db_importer.list_tick_days_before_from_old_db(day)
+
+    def list_tick_dates_on(self, days):
+        """
+        List (stock, date) pairs available in data source on some days, used to refresh the date catalog
+        :param days: list of date objects
+        :return: err_code, dataframe with "stock_code" and "date"(date object) columns
+        """
+
+        if self.file_importer is not None:
+            return self.file_importer.list_tick_dates_on(days)
+
+        return self.db_importer.list_tick_dates_on_from_old_db(days)
+
     def is_stock_available(self, stock_code):
         """
         Check data source weather stock tick data is available
@@ -42,6 +92,9 @@ class TickDataImportDao(object):
         :return: err_code, True if available else False
         """
 
+        if self.file_importer is not None:
+            return self.file_importer.is_stock_available(stock_code)
+
         return self.db_importer.is_stock_exists_in_old_db(stock_code)
 
     def get_tick_data_from_data_source_on_day(self, stock_code, day):
@@ -53,8 +106,42 @@ class TickDataImportDao(object):
         :return: err_code, a dataframe with tick data on the day specified by parameter "day"
         """
 
+        if self.file_importer is not None:
+            return self.file_importer.get_tick_data_from_data_source_on_day(stock_code, day)
+
         return self.db_importer.get_tick_data_from_old_db_on_day(stock_code, day)
 
+    def iter_tick_data_from_data_source_by_range(self, stock_code, start_day, end_day):
+        """
+        Fetch stock data of days between "start_day" and "end_day"(both inclusive) from data source
+        with a single query and iterate it day by day
+        :param stock_code: stock code
+        :param start_day:
+        :param end_day:
+        :return: iterator of (err_code, day, dataframe of tick data on day) sorted by day, iteration stops
+                after an error is yielded
+        """
+
+        if self.file_importer is not None:
+            return self.file_importer.iter_tick_data_from_data_source_by_range(stock_code, start_day, end_day)
+
+        return self.db_importer.iter_tick_data_from_old_db_by_range(stock_code, start_day, end_day)
+
+    def import_day_for_universe(self, stock_codes, day):
+        """
+        Fetch data of many stocks on date specified by "day" parameter from data source with a single query
+        and iterate it stock by stock
+        :param stock_codes: list of stock codes
+        :param day: the day of data you want to fetch
+        :return: iterator of (err_code, stock code, dataframe of tick data of stock on day) sorted by stock code,
+                stocks without data on day are not yielded, iteration stops after an error is yielded
+        """
+
+        if self.file_importer is not None:
+            return self.file_importer.import_day_for_universe(stock_codes, day)
+
+        return self.db_importer.iter_tick_data_from_old_db_for_universe(stock_codes, day)
+
 
 class OuterDBDataImportDao(object):
     """
@@ -79,13 +166,13 @@ class OuterDBDataImportDao(object):
 
         get_tick_dates_sql = """
                             SELECT DISTINCT "date" FROM "{0}"."{1}"
-                            WHERE {2}='{3}'
+                            WHERE {2}=%s
                         """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
-                                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME, stock_code)
+                                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
 
         conn = self.db_engine.connect()
         try:
-            res = pd.read_sql(get_tick_dates_sql, conn)['date'].tolist()
+            res = pd.read_sql(get_tick_dates_sql, conn, params=(stock_code,))['date'].tolist()
             res = [datetime.datetime.strptime(date, "%Y-%m-%d").date() for date in res]
             res.sort()
             return Error.SUCCESS, res
@@ -95,6 +182,104 @@ class OuterDBDataImportDao(object):
         finally:
             conn.close()
 
+    def list_tick_date_signatures_from_old_db(self, since=None, days=None):
+        """
+        Implementation of "list_tick_date_signatures", the signature of a day is made of its number of stocks
+        and number of rows.
+        :param since: date object, only days at or after it are listed if not None
+        :param days: list of date objects, only these days are listed if not None
+        :return: err_code, dict of date object -> signature string
+        """
+        if days is not None and len(days) == 0:
+            return Error.SUCCESS, {}
+
+        # "date" of data source is compared as text, same as the literal used before
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append('"date">=%s')
+            params.append(str(since))
+        if days is not None:
+            conditions.append('"date" IN %s')
+            params.append(tuple(str(day) for day in days))
+
+        sql = """
+            SELECT "date", COUNT(DISTINCT {2}) AS stock_count, COUNT(1) AS row_count FROM "{0}"."{1}"
+            {3}
+            GROUP BY "date"
+        """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
+                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME,
+                   "WHERE " + " AND ".join(conditions) if len(conditions) > 0 else "")
+
+        conn = self.db_engine.connect()
+        try:
+            df = pd.read_sql(sql, con=conn, params=tuple(params))
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+        return Error.SUCCESS, {self.__parse_date(date): "{0}:{1}".format(stock_count, row_count)
+                               for date, stock_count, row_count in zip(df['date'], df['stock_count'], df['row_count'])}
+
+    def list_tick_days_before_from_old_db(self, day):
+        """
+        Implementation of "list_tick_days_before", distinct days are walked through the index of "date" with one
+        lookup per day instead of scanning rows of the days.
+        :param day: date object
+        :return: err_code, sorted list of date objects
+        """
+
+        sql = """
+            WITH RECURSIVE days AS (
+                SELECT MIN("date") AS day FROM "{0}"."{1}" WHERE "date"<%s
+                UNION ALL
+                SELECT (SELECT MIN("date") FROM "{0}"."{1}" WHERE "date">days.day AND "date"<%s)
+                FROM days WHERE days.day IS NOT NULL
+            )
+            SELECT day FROM days WHERE day IS NOT NULL
+        """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE)
+
+        conn = self.db_engine.connect()
+        try:
+            res = pd.read_sql(sql, con=conn, params=(str(day), str(day)))['day'].tolist()
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+        return Error.SUCCESS, sorted(self.__parse_date(date) for date in res)
+
+    def list_tick_dates_on_from_old_db(self, days):
+        """
+        Implementation of "list_tick_dates_on".
+        :param days: list of date objects
+        :return: err_code, dataframe with "stock_code" and "date" columns
+        """
+
+        sql = """
+            SELECT DISTINCT {2} AS stock_code FROM "{0}"."{1}"
+            WHERE "date"=%s
+        """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
+                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
+
+        conn = self.db_engine.connect()
+        try:
+            rows = []
+            for day in days:
+                # "date" of data source is compared as text, same as the literal used before
+                stock_codes = pd.read_sql(sql, con=conn, params=(str(day),))['stock_code'].tolist()
+                rows.extend((stock_code, day) for stock_code in stock_codes)
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+        return Error.SUCCESS, pd.DataFrame(rows, columns=['stock_code', 'date'])
+
     def is_stock_exists_in_old_db(self, stock_code):
         """
         Implementation of "is_stock_available".
@@ -104,13 +289,13 @@ class OuterDBDataImportDao(object):
 
         sql = """
             SELECT COUNT(1) as stock_count FROM "{0}"."{1}"
-            WHERE {2}='{3}'
+            WHERE {2}=%s
         """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
-                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME, stock_code)
+                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
 
         conn = self.db_engine.connect()
         try:
-            count = pd.read_sql(sql, con=conn)['stock_count'][0]
+            count = pd.read_sql(sql, con=conn, params=(stock_code,))['stock_count'][0]
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED, None
@@ -129,13 +314,14 @@ class OuterDBDataImportDao(object):
 
         sql = """
             SELECT * FROM "{0}"."{1}"
-            WHERE {2}='{3}' AND "date"='{4}'
+            WHERE {2}=%s AND "date"=%s
         """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
-                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME, stock_code, day)
+                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
 
         conn = self.db_engine.connect()
         try:
-            df = pd.read_sql(sql, con=conn)
+            # "date" of data source is compared as text, same as the literal used before
+            df = pd.read_sql(sql, con=conn, params=(stock_code, str(day)))
         except:
             self.logger.log_error(traceback.format_exc())
             return Error.ERROR_DB_EXECUTION_FAILED, None
@@ -146,3 +332,78 @@ class OuterDBDataImportDao(object):
             return Error.ERROR_TICK_DATA_NOT_EXISTS_IN_OLD_DB_ON_DAY, None
 
         return Error.SUCCESS, df
+
+    def iter_tick_data_from_old_db_by_range(self, stock_code, start_day, end_day):
+        """
+        Implementation of "iter_tick_data_from_data_source_by_range". Rows are read through a server side
+        cursor in chunks, so only about one day of data is kept in memory.
+        :param stock_code: stock code
+        :param start_day:
+        :param end_day:
+        :return: iterator of (err_code, day, dataframe of tick data on day)
+        """
+
+        sql = """
+            SELECT * FROM "{0}"."{1}"
+            WHERE {2}=%s AND "date">=%s AND "date"<=%s
+            ORDER BY "date", datetime
+        """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
+                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
+
+        for err, date, day_df in self.__iter_groups(sql, (stock_code, str(start_day), str(end_day)), 'date'):
+            yield err, self.__parse_date(date), day_df
+
+    def iter_tick_data_from_old_db_for_universe(self, stock_codes, day):
+        """
+        Implementation of "import_day_for_universe".
+        :param stock_codes: list of stock codes
+        :param day: specify a day to fetch tick data
+        :return: iterator of (err_code, stock code, dataframe of tick data of stock on day)
+        """
+
+        sql = """
+            SELECT * FROM "{0}"."{1}"
+            WHERE {2}=ANY(%s) AND "date"=%s
+            ORDER BY {2}, datetime
+        """.format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE,
+                   TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
+
+        return self.__iter_groups(sql, (list(stock_codes), str(day)), TickDataSourceDatabaseConf.STOCK_CODE_COL_NAME)
+
+    def __iter_groups(self, sql, params, group_column):
+        """
+        Read rows sorted by "group_column" through a server side cursor in chunks and yield them group by group,
+        so that only about one group of data is kept in memory
+        :param sql:
+        :param params:
+        :param group_column:
+        :return: iterator of (err_code, group value, dataframe of group)
+        """
+        conn = self.db_engine.connect().execution_options(stream_results=True)
+        try:
+            pending_df = None
+            for chunk_df in pd.read_sql(sql, con=conn, params=params,
+                                        chunksize=TickDataSourceDatabaseConf.FETCH_ROWS_PER_CHUNK):
+                if pending_df is not None:
+                    chunk_df = pd.concat([pending_df, chunk_df], ignore_index=True)
+
+                # the last group of a chunk may continue in the next chunk
+                last_value = chunk_df[group_column].iloc[-1]
+                is_last_group = (chunk_df[group_column] == last_value).values
+                for value, group_df in chunk_df[~is_last_group].groupby(group_column, sort=False):
+                    yield Error.SUCCESS, value, group_df.reset_index(drop=True)
+                pending_df = chunk_df[is_last_group].reset_index(drop=True)
+
+            if pending_df is not None and pending_df.shape[0] > 0:
+                yield Error.SUCCESS, pending_df[group_column].iloc[0], pending_df
+        except:
+            self.logger.log_error(traceback.format_exc())
+            yield Error.ERROR_DB_EXECUTION_FAILED, None, None
+        finally:
+            conn.close()
+
+    @staticmethod
+    def __parse_date(date):
+        if isinstance(date, str):
+            return datetime.datetime.strptime(date, "%Y-%m-%d").date()
+        return date
@@ -0,0 +1,237 @@
+"""
+    This file defines the catalog of (stock, date) pairs available in tick data source.
+    The catalog is kept in factor keeper database so that available dates are looked up by index
+    instead of scanning the data source.
+"""
+
+
+from Core.DAO.PreparedStatement import PreparedStatement
+from Core.DAO.TickDataDao.TickDataImportDao import TickDataImportDao
+from Core.Conf.DatabaseConf import Schemas, Tables, TickDataSourceDatabaseConf
+from Core.Conf.TickDataSourceConf import TickDataSourceConf, TickDataSourceFileConf
+from Core.Error.Error import Error
+import traceback, datetime, threading
+import pandas as pd
+
+
+class TickDateCatalogDao(object):
+    """
+        The catalog is refreshed day by day from a high water mark, the latest day cataloged: data source lists a
+        signature of each of its days at or after the mark(see "list_tick_date_signatures" of TickDataImportDao),
+        and only the days whose signature differs from the one recorded by the last refresh are listed again and
+        replaced in catalog, so new days, as well as days still being loaded, are found by next refresh.
+        Days backfilled below the mark are found by a cheaper check listing days only(see "list_tick_days_before"),
+        run less often, days reloaded below the mark are found by full refreshes. Days removed from data source are
+        removed from catalog.
+        Refreshes are run by name node in background(see TickDateCatalogRefresher), lookups only read the catalog,
+        except lookups finding nothing cataloged for the data source, which run the initial refresh themselves.
+    """
+    # refreshes of a process are serialized, so the initial refresh of lookups doesn't race the background one
+    __refresh_lock = threading.Lock()
+
+    def __init__(self, db_engine, logger):
+        """
+        :param db_engine: sqlalchemy database engine of factor keeper database
+        :param logger:
+        """
+        self.db_engine = db_engine
+        self.logger = logger.sub_logger(self.__class__.__name__)
+        self.tick_data_import_dao = TickDataImportDao(db_engine, logger)
+        self.__initialized = False
+
+    @staticmethod
+    def get_source_name():
+        if TickDataSourceConf.is_file_source():
+            return "file:{0}".format(TickDataSourceFileConf.ROOT_DIR)
+        return "{0}.{1}".format(TickDataSourceDatabaseConf.SCHEMA, TickDataSourceDatabaseConf.TABLE)
+
+    def refresh(self, full=False, check_backfill=False):
+        """
+        Replace catalog rows of days changed in data source since last refresh
+        :param full: list all days of data source again if True
+        :param check_backfill: look for days added or removed below the high water mark if True
+        :return: err_code
+        """
+        with self.__refresh_lock:
+            return self.__refresh(full=full, check_backfill=check_backfill)
+
+    def __refresh(self, full=False, check_backfill=False):
+        err, catalog_signatures = self.get_day_signatures()
+        if err:
+            return err
+
+        # the day at the mark is listed again, it may still be loading
+        high_water_mark = max(catalog_signatures.keys()) if len(catalog_signatures) > 0 and not full else None
+        err, source_signatures = self.tick_data_import_dao.list_tick_date_signatures(since=high_water_mark)
+        if err:
+            return err
+
+        # cataloged days whose presence in data source is known after listing
+        checked_days = set(day for day in catalog_signatures
+                           if high_water_mark is None or day >= high_water_mark)
+        if check_backfill and high_water_mark is not None:
+            err, source_days = self.tick_data_import_dao.list_tick_days_before(high_water_mark)
+            if err:
+                return err
+
+            backfilled_days = [day for day in source_days if day not in catalog_signatures]
+            err, backfilled_signatures = self.tick_data_import_dao.list_tick_date_signatures(days=backfilled_days)
+            if err:
+                return err
+
+            source_signatures.update(backfilled_signatures)
+            # days below the mark kept in data source are not listed again, reloads are found by full refreshes
+            source_signatures.update((day, catalog_signatures[day]) for day in source_days
+                                     if day in catalog_signatures)
+            checked_days.update(day for day in catalog_signatures if day < high_water_mark)
+
+        changed_days = sorted(day for day, signature in source_signatures.items()
+                              if full or catalog_signatures.get(day) != signature)
+        removed_days = sorted(day for day in checked_days if day not in source_signatures)
+        if len(changed_days) == 0 and len(removed_days) == 0:
+            return Error.SUCCESS
+
+        err, source_df = self.tick_data_import_dao.list_tick_dates_on(changed_days)
+        if err:
+            return err
+
+        delete_sql = """
+            DELETE FROM "{0}"."{1}" WHERE tick_date=ANY(%s)
+        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG)
+        insert_sql = """
+            INSERT INTO "{0}"."{1}"(stock_code, tick_date) VALUES(%s, %s)
+        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG)
+        delete_state_sql = """
+            DELETE FROM "{0}"."{1}" WHERE source_name=%s AND tick_date=ANY(%s)
+        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG_STATE)
+        update_state_sql = """
+            INSERT INTO "{0}"."{1}"(source_name, tick_date, signature, refresh_time) VALUES(%s, %s, %s, %s)
+            ON CONFLICT (source_name, tick_date) DO UPDATE
+            SET signature=EXCLUDED.signature, refresh_time=EXCLUDED.refresh_time
+        """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG_STATE)
+
+        source_name = self.get_source_name()
+        refresh_time = datetime.datetime.now()
+        conn = self.db_engine.connect()
+        try:
+            with conn.begin():
+                conn.execute(delete_sql, (changed_days + removed_days,))
+                rows = list(zip(source_df['stock_code'].tolist(), source_df['date'].tolist()))
+                if len(rows) > 0:
+                    conn.execute(insert_sql, rows)
+                if len(removed_days) > 0:
+                    conn.execute(delete_state_sql, (source_name, removed_days))
+                if len(changed_days) > 0:
+                    conn.execute(update_state_sql, [(source_name, day, source_signatures[day], refresh_time)
+                                                    for day in changed_days])
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED
+        finally:
+            conn.close()
+
+        self.logger.log_info("tick date catalog refreshed, {0} days changed, {1} days removed".
+                             format(len(changed_days), len(removed_days)))
+        return Error.SUCCESS
+
+    def get_day_signatures(self):
+        """
+        :return: err_code, dict of cataloged date object -> signature of the day when it was cataloged
+        """
+        conn = self.db_engine.connect()
+        try:
+            df = PreparedStatement.read_sql(conn, """
+                SELECT tick_date, signature FROM "{0}"."{1}" WHERE source_name=%s
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG_STATE), (self.get_source_name(),))
+            return Error.SUCCESS, dict(zip(df['tick_date'].tolist(), df['signature'].tolist()))
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+    def is_cataloged(self):
+        """
+        :return: err_code, True if any day of data source is cataloged
+        """
+        conn = self.db_engine.connect()
+        try:
+            df = pd.read_sql("""
+                SELECT 1 FROM "{0}"."{1}" WHERE source_name=%s LIMIT 1
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG_STATE), con=conn,
+                params=(self.get_source_name(),))
+            return Error.SUCCESS, df.shape[0] > 0
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+    def wait_initial_refresh(self):
+        """
+        Refresh catalog if nothing is cataloged for data source, a refresh already running is waited for
+        :return: err_code
+        """
+        if self.__initialized:
+            return Error.SUCCESS
+
+        with self.__refresh_lock:
+            err, cataloged = self.is_cataloged()
+            if err:
+                return err
+
+            if not cataloged:
+                err = self.__refresh()
+                if err:
+                    return err
+
+            self.__initialized = True
+
+        return Error.SUCCESS
+
+    def list_dates(self, stock_code):
+        """
+        List dates available in data source of a stock
+        :param stock_code: stock code
+        :return: err_code, sorted list of date objects
+        """
+        err = self.wait_initial_refresh()
+        if err:
+            return err, None
+
+        conn = self.db_engine.connect()
+        try:
+            res = PreparedStatement.read_sql(conn, """
+                SELECT tick_date FROM "{0}"."{1}" WHERE stock_code=%s ORDER BY tick_date
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG), (stock_code,))['tick_date'].tolist()
+            return Error.SUCCESS, res
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
+
+    def list_common_dates(self, stock_codes):
+        """
+        List dates available in data source for all of the stocks, used by stock views
+        :param stock_codes: list of stock codes
+        :return: err_code, sorted list of date objects
+        """
+        stock_codes = sorted(set(stock_codes))
+        err = self.wait_initial_refresh()
+        if err:
+            return err, None
+
+        conn = self.db_engine.connect()
+        try:
+            res = pd.read_sql("""
+                SELECT tick_date FROM "{0}"."{1}" WHERE stock_code=ANY(%s)
+                GROUP BY tick_date HAVING COUNT(1)=%s ORDER BY tick_date
+            """.format(Schemas.SCHEMA_META, Tables.TABLE_TICK_SOURCE_CATALOG), con=conn,
+                params=(stock_codes, len(stock_codes)))['tick_date'].tolist()
+            return Error.SUCCESS, res
+        except:
+            self.logger.log_error(traceback.format_exc())
+            return Error.ERROR_DB_EXECUTION_FAILED, None
+        finally:
+            conn.close()
@@ -59,3 +59,8 @@ class Error(object):
     ERROR_GROUP_FACTOR_SIGNATURE_NOT_MATCHED = 51
     ERROR_SUB_FACTOR_CONFLICT_WITH_OTHER_FACTOR = 52
     ERROR_GROUP_FACTOR_SOURCE_CONFLICT = 53
+    ERROR_TICK_STREAM_NOT_EXISTS = 54
+    ERROR_TICK_DATA_ALREADY_UPDATED_ON_DAY = 55
+    ERROR_TICK_SOURCE_FILE_READ_FAILED = 56
+    ERROR_TICK_STREAM_BEING_SEALED = 57
+    ERROR_FACTOR_GENERATOR_FUNCTION_NOT_DEFINED = 58
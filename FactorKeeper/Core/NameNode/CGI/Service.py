@@ -7,6 +7,7 @@ from Core.Conf.ProtoConf import ProtoConf
 from Util.ServiceUtil.Response import ResponseMaker
 from Core.Error.Error import Error
 from Util.ServiceUtil.Debug import ServiceDebugger
+from Util.TimeUtil.TimeParser import par_time
 import datetime
 import traceback
 import pandas as pd
@@ -18,6 +19,29 @@ def define_name_node_service(app, name_node):
     resp_maker = ResponseMaker()
     ServiceDebugger.set_debug(True)
 
+    def parse_result_projection(params):
+        """
+        parse optional intraday time window and columns of a factor result request
+        :param params: request args or form
+        :return: start time, end time, list of columns, None for each one not given
+        """
+        start_time = params.get("start_time")
+        end_time = params.get("end_time")
+        columns = params.get("columns")
+
+        if start_time is not None:
+            start_time = par_time(start_time)
+            if start_time is None:
+                raise ValueError("invalid start time")
+        if end_time is not None:
+            end_time = par_time(end_time)
+            if end_time is None:
+                raise ValueError("invalid end time")
+        if columns is not None:
+            columns = [col.strip() for col in columns.split(",") if col.strip()]
+
+        return start_time, end_time, columns
+
     @app.route("/worker", methods=['POST'])
     @ServiceDebugger.debug()
     def register_worker():
@@ -133,6 +157,99 @@ def define_name_node_service(app, name_node):
         else:
             return resp_maker.make_response(err, stock_status)
 
+    @app.route("/stock/tick_data/date/<update_date>", methods=['POST'])
+    @ServiceDebugger.debug()
+    def update_tick_data_universe(update_date):
+        """
+        update tick data of many stocks on a day
+        :return: return message
+        """
+        import json
+
+        try:
+            stock_codes = json.loads(request.form.get("stock_codes"))
+            update_date = datetime.datetime.strptime(update_date, "%Y-%m-%d").date()
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, status = name_node.update_tick_data_universe(stock_codes, update_date)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, status)
+
+    @app.route("/stock/<stock_code>/factors", methods=['PUT'])
+    @ServiceDebugger.debug()
+    def update_stock_factors(stock_code):
+        """
+        update all factors linked to a stock, each day of tick data is loaded once for all factors
+        :return: return message
+        """
+        err, status = name_node.update_stock_factors(stock_code)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, status)
+
+    @app.route("/stock/<stock_code>/factors/update_status", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_stock_factors_status(stock_code):
+        """
+        get status of updating all factors linked to a stock
+        :return: return message
+        """
+        err, status = name_node.get_stock_factors_update_status(stock_code)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, status)
+
+    @app.route("/stock/<stock_code>/ticks", methods=['POST'])
+    @ServiceDebugger.debug()
+    def append_intraday_ticks(stock_code):
+        """
+        append streamed ticks of the current trading day, form "ticks" is json records with "datetime" column
+        :return: return message, number of filled tick slots of the day
+        """
+        try:
+            ticks_df = pd.read_json(request.form.get("ticks"), orient="records", convert_dates=["datetime"])
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, filled_num = name_node.append_intraday_ticks(stock_code, ticks_df)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, filled_num)
+
+    @app.route("/stock/<stock_code>/ticks", methods=['GET'])
+    @ServiceDebugger.debug()
+    def load_intraday_ticks(stock_code):
+        """
+        load filled tick slots of the streamed day starting from slot "since"
+        :return: return message
+        """
+        try:
+            since = int(request.args.get("since", 0))
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, ticks_json = name_node.load_intraday_ticks(stock_code, since)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, ticks_json)
+
+    @app.route("/stock/<stock_code>/ticks/seal", methods=['POST'])
+    @ServiceDebugger.debug()
+    def seal_intraday_ticks(stock_code):
+        """
+        save the streamed day as updated tick data
+        :return: return message
+        """
+        err = name_node.seal_intraday_ticks(stock_code)
+        return resp_maker.make_response(err)
+
     @app.route("/worker/call_back/update_factor/update", methods=['POST'])
     @ServiceDebugger.debug()
     def factor_update_call_back():
@@ -150,13 +267,42 @@ def define_name_node_service(app, name_node):
         day = request.form.get("date")
         day = datetime.datetime.strptime(day, "%Y-%m-%d")
         try:
+            # days skipped by stateful generators are sent with state only
             df_json = request.form.get("data_frame")
-            df = pd.read_json(df_json)
+            df = pd.read_json(df_json) if df_json is not None else None
+        except:
+            return resp_maker.make_response(Error.ERROR_SERVER_INTERNAL_ERROR)
+        task_id = request.form.get("task_id")
+        # serialized state of stateful factor generators, None for other generators
+        state = request.form.get("state")
+
+        err = name_node.call_back_update_factor_task(factor, version, stock_code, day, df, task_id, state=state)
+        return resp_maker.make_response(err)
+
+    @app.route("/worker/call_back/update_factor/update_batch", methods=['POST'])
+    @ServiceDebugger.debug()
+    def update_factor_batch_call_back():
+        """
+        update factor results of several (factor, day) pairs call back called by workers
+        :return: return message
+        """
+        import json
+
+        header = request.form.get("HEADER")
+        if header != ProtoConf.CALLBACK_HEADER:
+            return resp_maker.make_response(Error.ERROR_UNRECOGNIZED_HEADER, "unrecognized header '{}'".format(header))
+
+        try:
+            items = []
+            for item in json.loads(request.form.get("data_frames")):
+                day = datetime.datetime.strptime(item["date"], "%Y-%m-%d")
+                items.append((item["factor"], item["version"], item["stock_code"], day,
+                              pd.read_json(item["data_frame"])))
         except:
             return resp_maker.make_response(Error.ERROR_SERVER_INTERNAL_ERROR)
         task_id = request.form.get("task_id")
 
-        err = name_node.call_back_update_factor_task(factor, version, stock_code, day, df, task_id)
+        err = name_node.call_back_update_factor_batch(items, task_id)
         return resp_maker.make_response(err)
 
     @app.route("/worker/call_back/update_tick_data/update", methods=['POST'])
@@ -183,6 +329,31 @@ def define_name_node_service(app, name_node):
         err = name_node.call_back_update_tick_data_task(stock_code, day, df, task_id)
         return resp_maker.make_response(err)
 
+    @app.route("/worker/call_back/update_tick_data/update_batch", methods=['POST'])
+    @ServiceDebugger.debug()
+    def update_tick_data_batch_call_back():
+        """
+        update tick data of several (stock, day) pairs call back called by workers
+        :return: return message
+        """
+        import json
+
+        header = request.form.get("HEADER")
+        if header != ProtoConf.CALLBACK_HEADER:
+            return resp_maker.make_response(Error.ERROR_UNRECOGNIZED_HEADER, "unrecognized header '{}'".format(header))
+
+        try:
+            items = []
+            for item in json.loads(request.form.get("data_frames")):
+                day = datetime.datetime.strptime(item["date"], "%Y-%m-%d")
+                items.append((item["stock_code"], day, pd.read_json(item["data_frame"])))
+        except:
+            return resp_maker.make_response(Error.ERROR_SERVER_INTERNAL_ERROR)
+        task_id = request.form.get("task_id")
+
+        err = name_node.call_back_update_tick_data_batch(items, task_id)
+        return resp_maker.make_response(err)
+
     @app.route("/worker/call_back/finish", methods=['POST'])
     @ServiceDebugger.debug()
     def finish_task():
@@ -221,7 +392,7 @@ def define_name_node_service(app, name_node):
         except:
             return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
 
-        err, msg = name_node.create_stock_view(stock_view_name, relation)
+        err, msg = name_node.create_stock_view(stock_view_name, relation, view_type=request.form.get("view_type"))
         return resp_maker.make_response(err, msg)
 
     @app.route("/factor", methods=["POST"])
@@ -429,6 +600,53 @@ def define_name_node_service(app, name_node):
         else:
             return resp_maker.make_response(err, status)
 
+    @app.route("/factor/<factor>/version/<version>/cross_section", methods=['PUT'])
+    @ServiceDebugger.debug()
+    def update_factor_result_xs(factor, version):
+        """
+        update factor data of all linked stocks with cross-sectional factor generator
+        :param factor:
+        :param version:
+        :return: return message
+        """
+
+        err, status = name_node.update_factor_result_xs(factor, version=version)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, status)
+
+    @app.route("/factor/<factor>/cross_section", methods=['PUT'])
+    @ServiceDebugger.debug()
+    def update_latest_factor_result_xs(factor):
+        """
+        update factor data of all linked stocks of the latest version with cross-sectional factor generator
+        :param factor:
+        :return: return message
+        """
+
+        err, status = name_node.update_factor_result_xs(factor)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, status)
+
+    @app.route("/factor/<factor>/version/<version>/cross_section/update_status", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_factor_xs_status(factor, version):
+        """
+        get status of cross-sectional factor update
+        :param factor:
+        :param version:
+        :return: return message
+        """
+        err, status = name_node.get_factor_xs_update_status(factor, version)
+
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, status)
+
     @app.route("/factor/<factor>/version/<version>/stock/<stock_code>/date/<fetch_date>", methods=['GET'])
     @ServiceDebugger.debug()
     def load_factor_result(factor, version, stock_code, fetch_date):
@@ -442,11 +660,19 @@ def define_name_node_service(app, name_node):
         """
         # TODO: validate input
         fetch_date = datetime.datetime.strptime(fetch_date, "%Y-%m-%d")
-        err, df = name_node.load_factor_results(factor, stock_code, fetch_date, version=version)
+        try:
+            start_time, end_time, columns = parse_result_projection(request.args)
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, df_json = name_node.load_serialized_factor_results(factor, stock_code, fetch_date, version=version,
+                                                                start_time=start_time, end_time=end_time,
+                                                                columns=columns, bar=request.args.get("bar"),
+                                                                agg=request.args.get("agg"))
         if err:
             return resp_maker.make_response(err)
         else:
-            return resp_maker.make_response(err, df.to_json())
+            return resp_maker.make_response(err, df_json)
 
     @app.route("/factor/load_multi_factors", methods=['POST'])
     @ServiceDebugger.debug()
@@ -463,10 +689,13 @@ def define_name_node_service(app, name_node):
             stock_code = request.form.get("stock_code")
             fetch_date = request.form.get("fetch_date")
             fetch_date = datetime.datetime.strptime(fetch_date, "%Y-%m-%d")
+            start_time, end_time, columns = parse_result_projection(request.form)
         except:
             return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
 
-        err, res_df = name_node.load_multi_factor_results(factors, stock_code, fetch_date)
+        err, res_df = name_node.load_multi_factor_results(factors, stock_code, fetch_date, start_time=start_time,
+                                                          end_time=end_time, columns=columns,
+                                                          bar=request.form.get("bar"), agg=request.form.get("agg"))
         if err:
             return resp_maker.make_response(err, res_df)
         else:
@@ -489,10 +718,14 @@ def define_name_node_service(app, name_node):
             end_date = request.form.get("end_date")
             start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
             end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+            start_time, end_time, columns = parse_result_projection(request.form)
         except:
             return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
 
-        err, res_df = name_node.load_multi_factor_result_by_range(factors, stock_code, start_date, end_date)
+        err, res_df = name_node.load_multi_factor_result_by_range(factors, stock_code, start_date, end_date,
+                                                                  start_time=start_time, end_time=end_time,
+                                                                  columns=columns, bar=request.form.get("bar"),
+                                                                  agg=request.form.get("agg"))
         if err:
             return resp_maker.make_response(err, res_df)
         else:
@@ -510,11 +743,19 @@ def define_name_node_service(app, name_node):
         """
         # TODO: validate input
         fetch_date = datetime.datetime.strptime(fetch_date, "%Y-%m-%d")
-        err, df = name_node.load_factor_results(factor, stock_code, fetch_date)
+        try:
+            start_time, end_time, columns = parse_result_projection(request.args)
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, df_json = name_node.load_serialized_factor_results(factor, stock_code, fetch_date,
+                                                                start_time=start_time, end_time=end_time,
+                                                                columns=columns, bar=request.args.get("bar"),
+                                                                agg=request.args.get("agg"))
         if err:
             return resp_maker.make_response(err)
         else:
-            return resp_maker.make_response(err, df.to_json())
+            return resp_maker.make_response(err, df_json)
 
     @app.route("/factor/<factor>/version/<version>/stock/<stock_code>/update_status", methods=['GET'])
     @ServiceDebugger.debug()
@@ -586,6 +827,77 @@ def define_name_node_service(app, name_node):
             dates_string = str([str(day) for day in date_list])
             return resp_maker.make_response(err, dates_string)
 
+    def make_update_times_response(factor, stock_code, version):
+        import json
+
+        try:
+            start_date = request.args.get("start_date")
+            end_date = request.args.get("end_date")
+            start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+            end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, version, update_times = name_node.get_factor_update_times(factor, stock_code, start_date=start_date,
+                                                                       end_date=end_date, version=version)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, json.dumps({
+                "version": version,
+                "update_times": {str(day): str(update_time) for day, update_time in update_times}
+            }))
+
+    @app.route("/factor/<factor>/version/<version>/stock/<stock_code>/update_time", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_factor_update_times(factor, version, stock_code):
+        """
+        get the time each updated day of a factor was last written
+        :param factor:
+        :param version:
+        :param stock_code:
+        :return: return message
+        """
+        return make_update_times_response(factor, stock_code, version)
+
+    @app.route("/factor/<factor>/stock/<stock_code>/update_time", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_latest_factor_update_times(factor, stock_code):
+        """
+        get the time each updated day of the latest version of a factor was last written
+        :param factor:
+        :param stock_code:
+        :return: return message
+        """
+        return make_update_times_response(factor, stock_code, None)
+
+    @app.route("/manager/result_cache", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_result_cache_stats():
+        """
+        show factor result cache counters
+        :return: return message
+        """
+        err, stats = name_node.get_result_cache_stats()
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            stats_string = "<br>".join(["{0}: {1}".format(name, stats[name]) for name in sorted(stats)])
+            return resp_maker.make_response(err, stats_string)
+
+    @app.route("/manager/tick_date_catalog", methods=['POST'])
+    @ServiceDebugger.debug()
+    def refresh_tick_date_catalog():
+        """
+        request a background refresh of catalog of dates available in tick data source, a full refresh is done
+        if form "full" is "true"
+        :return: return message
+        """
+        full = str(request.form.get("full", "false")).lower() == "true"
+
+        err = name_node.refresh_tick_date_catalog(full=full)
+        return resp_maker.make_response(err)
+
     @app.route("/manager/stop_all", methods=['POST'])
     @ServiceDebugger.debug()
     def stop_update_process():
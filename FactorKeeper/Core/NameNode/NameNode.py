@@ -1,7 +1,8 @@
-from Core.Conf.DatabaseConf import DBConfig
+from Core.Conf.DatabaseConf import DBConfig, TickDataSourceDatabaseConf
 from Core.Conf.FactorConf import FactorConf
 from Core.Conf.TickDataConf import TickDataConf
 from Core.Conf.PathConf import Path
+from Core.Conf.MasterConf import MasterConf
 from Core.DAO.FactorDao.FactorDao import FactorDao
 from Core.DAO.TickDataDao import TickDataDao
 from Core.Logger.Logger import Logger
@@ -9,8 +10,13 @@ from Core.Error.Error import Error
 from Core.NameNode.NameNodeImpl.Initializer import Initializer, LogInitializer
 from Core.NameNode.TaskManager.TaskManager import TaskManager
 from Core.NameNode.WorkerManager.WorkerManager import WorkerManager
-from Core.NameNode.TaskManager.FactorUpdateTask import UpdateFactorTaskHandler
-from Core.NameNode.TaskManager.TickDataUpdateTask import TickDataUpdateTaskHandler
+from Core.NameNode.TaskManager.FactorUpdateTask import UpdateFactorTaskHandler, UpdateFactorXSTaskHandler, \
+    UpdateStockFactorsTaskHandler
+from Core.NameNode.TaskManager.TickDataUpdateTask import TickDataUpdateTaskHandler, TickDataUniverseUpdateTaskHandler
+from Core.NameNode.ResultCache.FactorResultCache import FactorResultCache
+from Core.NameNode.TickStream.IntradayTickStream import IntradayTickStreamManager
+from Core.NameNode.NameNodeImpl.ResultAggregator import FactorResultAggregator
+from Core.NameNode.NameNodeImpl.TickDateCatalogRefresher import TickDateCatalogRefresher
 import threading
 
 
@@ -22,18 +28,27 @@ class Master(object):
         # start log
         self.logger.log_info("starting name node...")
 
-        # create db engine
-        self.db_engine = DBConfig.create_default_sa_engine_without_pool()
+        # create db engine, connections are pooled so that prepared statements are reused across requests
+        self.db_engine = DBConfig.create_default_sa_engine(pool_size=MasterConf.DB_POOL_SIZE,
+                                                           max_overflow=MasterConf.DB_MAX_OVERFLOW,
+                                                           pool_timeout=MasterConf.DB_POOL_TIMEOUT)
 
         # create name node variables
         self.factor_dao = FactorDao(self.db_engine, self.logger)
         self.tick_dao = TickDataDao(self.db_engine, self.logger)
         self.lock = threading.Lock()
+        self.result_cache = FactorResultCache(MasterConf.RESULT_CACHE_MAX_BYTES, self.logger)
+        self.tick_stream = IntradayTickStreamManager(self.db_engine, self.logger)
 
         # init name node
         self.initializer = Initializer(self.db_engine, self.logger)
         self.initializer.init_master_node()
 
+        # refresh tick date catalog in background
+        self.tick_date_catalog_refresher = TickDateCatalogRefresher(self.tick_dao, self.logger)
+        if TickDataSourceDatabaseConf.DATE_CATALOG_ENABLED:
+            self.tick_date_catalog_refresher.start()
+
         # init managers
         self.logger.log_info("initializing managers...")
         self.worker_manager = WorkerManager(self.logger)
@@ -41,7 +56,16 @@ class Master(object):
 
         # install task handlers
         self.task_manager.install_task_handler(UpdateFactorTaskHandler)
+        self.task_manager.install_task_handler(UpdateFactorXSTaskHandler)
+        self.task_manager.install_task_handler(UpdateStockFactorsTaskHandler)
         self.task_manager.install_task_handler(TickDataUpdateTaskHandler)
+        self.task_manager.install_task_handler(TickDataUniverseUpdateTaskHandler)
+        _, factor_update_handler = self.task_manager.get_handler(UpdateFactorTaskHandler)
+        factor_update_handler.set_result_cache(self.result_cache)
+        _, factor_xs_update_handler = self.task_manager.get_handler(UpdateFactorXSTaskHandler)
+        factor_xs_update_handler.set_result_cache(self.result_cache)
+        _, stock_factors_update_handler = self.task_manager.get_handler(UpdateStockFactorsTaskHandler)
+        stock_factors_update_handler.set_result_cache(self.result_cache)
         self.logger.log_info("successfully initialized managers.")
 
     def register_worker(self, host, port, cores, worker_version):
@@ -81,14 +105,86 @@ class Master(object):
 
         return Error.SUCCESS, status
 
-    def call_back_update_factor_task(self, factor, version, stock_code, day, df, task_id):
+    def call_back_update_factor_task(self, factor, version, stock_code, day, df, task_id, state=None):
         return self.task_manager.callback_task(UpdateFactorTaskHandler, factor=factor, version=version,
-                                               stock_code=stock_code, date=day, data_frame=df, task_id=task_id)
+                                               stock_code=stock_code, date=day, data_frame=df, task_id=task_id,
+                                               state=state)
+
+    def call_back_update_factor_batch(self, items, task_id):
+        """
+        :param items: list of (factor, version, stock_code, day, dataframe)
+        :param task_id:
+        :return: err_code, the first error if any item failed, remaining items are still saved
+        """
+        ret_err = Error.SUCCESS
+        for factor, version, stock_code, day, df in items:
+            err = self.call_back_update_factor_task(factor, version, stock_code, day, df, task_id)
+            if err == Error.ERROR_TASK_NOT_EXISTS:
+                return err
+            if err and not ret_err:
+                ret_err = err
+
+        return ret_err
 
     def call_back_update_tick_data_task(self, stock_code, day, df, task_id):
         return self.task_manager.callback_task(TickDataUpdateTaskHandler, stock_code=stock_code,
                                                date=day, data_frame=df, task_id=task_id)
 
+    def call_back_update_tick_data_batch(self, items, task_id):
+        """
+        :param items: list of (stock_code, day, dataframe)
+        :param task_id:
+        :return: err_code, the first error if any item failed, remaining items are still saved
+        """
+        ret_err = Error.SUCCESS
+        for stock_code, day, df in items:
+            err = self.call_back_update_tick_data_task(stock_code, day, df, task_id)
+            if err == Error.ERROR_TASK_NOT_EXISTS:
+                return err
+            if err and not ret_err:
+                ret_err = err
+
+        return ret_err
+
+    def update_tick_data_universe(self, stock_codes, day):
+        """
+        Update tick data of many stocks on a day, data source is queried once per chunk of stocks
+        :param stock_codes: list of stock codes
+        :param day: date object
+        :return: err_code, task status
+        """
+        return self._create_task(TickDataUniverseUpdateTaskHandler, stock_codes=stock_codes, day=day)
+
+    def append_intraday_ticks(self, stock_code, ticks_df):
+        """
+        Append streamed ticks of the current trading day
+        :param stock_code: stock code
+        :param ticks_df: dataframe with "datetime" column and tick columns
+        :return: err_code, number of filled tick slots of the day
+        """
+        return self.tick_stream.append_ticks(stock_code, ticks_df)
+
+    def load_intraday_ticks(self, stock_code, since=0):
+        """
+        Load filled tick slots of the streamed day
+        :param stock_code: stock code
+        :param since: index of the first tick slot to load
+        :return: err_code, json of tick slots
+        """
+        err, df = self.tick_stream.load_ticks(stock_code, since)
+        if err:
+            return err, None
+
+        return Error.SUCCESS, df.to_json()
+
+    def seal_intraday_ticks(self, stock_code):
+        """
+        Save the streamed day as updated tick data
+        :param stock_code: stock code
+        :return: err_code
+        """
+        return self.tick_stream.seal(stock_code)
+
     def create_factor(self, factor, code_file):
         """
         :param factor:
@@ -176,10 +272,11 @@ class Master(object):
         """
         return self.factor_dao.list_versions(factor)
 
-    def create_stock_view(self, stock_view_name, relations):
+    def create_stock_view(self, stock_view_name, relations, view_type=None):
         """
         :param stock_view_name:
         :param relations:
+        :param view_type: one of TickDataConf.STOCK_VIEW_TYPES, a materialized view is created if None
         :return: err_code
         """
         import re
@@ -191,7 +288,10 @@ class Master(object):
             return Error.ERROR_INVALID_STOCK_VIEW_NAME, "stock view name must be consist of alphabet characters " \
                                                         "and '-', '_', '.'"
 
-        return self.tick_dao.create_stock_view(stock_view_name, relations)
+        if view_type is None:
+            view_type = TickDataConf.STOCK_VIEW_TYPE_MATERIALIZED
+
+        return self.tick_dao.create_stock_view(stock_view_name, relations, view_type=view_type)
 
     def create_stock_linkage(self, factor, stock_code, version=None, ):
         """
@@ -260,6 +360,52 @@ class Master(object):
         return self._create_task(UpdateFactorTaskHandler, factor=factor, version=version,
                                  stock_code=stock_code)
 
+    def update_factor_result_xs(self, factor, version=None):
+        """
+        Update factor of all linked stocks with cross-sectional generator, unit tasks are scheduled by date
+        :param factor:
+        :param version:
+        :return: err_code, task status
+        """
+        if version is None:
+            err, version = self.factor_dao.get_latest_version(factor)
+            if err:
+                return err, None
+
+        return self._create_task(UpdateFactorXSTaskHandler, factor=factor, version=version)
+
+    def update_stock_factors(self, stock_code):
+        """
+        Update all factors linked to a stock in fused mode, each day of tick data is loaded once
+        :param stock_code:
+        :return: err_code, task status
+        """
+        return self._create_task(UpdateStockFactorsTaskHandler, stock_code=stock_code)
+
+    def get_stock_factors_update_status(self, stock_code):
+        """
+        :param stock_code:
+        :return: err_code, update_status
+        """
+        return self._get_task_status(UpdateStockFactorsTaskHandler, stock_code=stock_code)
+
+    def get_factor_xs_update_status(self, factor, version=None):
+        """
+        :param factor:
+        :param version:
+        :return: err_code, update_status
+        """
+        if version is None:
+            err, version = self.factor_dao.get_latest_version(factor)
+            if err:
+                return err, None
+
+        err, factor = self.factor_dao.get_group_factor(factor, default=factor)
+        if err:
+            return err, None
+
+        return self._get_task_status(UpdateFactorXSTaskHandler, factor=factor, version=version)
+
     def load_factor_results(self, factor, stock_code, fetch_date, version=None):
         """
         :param stock_code:
@@ -275,11 +421,116 @@ class Master(object):
 
         return self.factor_dao.load_factor_result(factor, version, stock_code, fetch_date)
 
-    def load_multi_factor_results(self, factors, stock_code, fetch_date):
+    def load_serialized_factor_results(self, factor, stock_code, fetch_date, version=None, start_time=None,
+                                       end_time=None, columns=None, bar=None, agg=None):
+        """
+        Load factor data of a day serialized as json, served from result cache if the whole day is required
+        :param stock_code:
+        :param factor:
+        :param version:
+        :param fetch_date:
+        :param start_time: only rows not earlier than start_time(datetime.time) are loaded if not None
+        :param end_time: only rows not later than end_time(datetime.time) are loaded if not None
+        :param columns: columns to load among factor, "datetime" and "date", all of them are loaded if None
+        :param bar: bar size to aggregate results into(see FactorResultAggregator), not aggregated if None
+        :param agg: comma separated aggregations applied to each bar
+        :return: err_code, json string of factor dataframe
+        """
+        err = self._check_result_columns(columns, [factor])
+        if err:
+            return err, None
+
+        err, aggs = FactorResultAggregator.parse(bar, agg)
+        if err:
+            return err, None
+
+        if version is None:
+            err, version = self.factor_dao.get_latest_version(factor)
+            if err:
+                return err, None
+
+        if start_time is not None or end_time is not None or columns is not None or bar is not None:
+            # partial results are pushed down to database and not cached
+            err, df = self.factor_dao.load_factor_result(factor, version, stock_code, fetch_date,
+                                                         start_time=start_time, end_time=end_time,
+                                                         columns=self._get_load_columns(columns, bar))
+            if err:
+                return err, None
+            if bar is not None:
+                df = FactorResultAggregator.aggregate(df, bar, aggs)
+            return Error.SUCCESS, df.to_json()
+
+        is_hit, df_json, token = self.result_cache.get(factor, version, stock_code, fetch_date)
+        if is_hit:
+            return Error.SUCCESS, df_json
+
+        try:
+            err, df = self.factor_dao.load_factor_result(factor, version, stock_code, fetch_date)
+            if not err:
+                df_json = df.to_json()
+        finally:
+            self.result_cache.put(df_json, token)
+
+        if err:
+            return err, None
+
+        return Error.SUCCESS, df_json
+
+    def refresh_tick_date_catalog(self, full=False):
+        """
+        Request a background refresh of catalog of dates available in tick data source
+        :param full: list all days of data source again if True, else only days changed since last refresh
+        :return: err_code
+        """
+        if not TickDataSourceDatabaseConf.DATE_CATALOG_ENABLED:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID
+
+        self.tick_date_catalog_refresher.request_refresh(full=full)
+        return Error.SUCCESS
+
+    def get_result_cache_stats(self):
+        """
+        :return: err_code, dict of result cache counters
+        """
+        return Error.SUCCESS, self.result_cache.stats()
+
+    @staticmethod
+    def _get_load_columns(columns, bar):
+        """
+        Time columns are always loaded when results are aggregated since bars are labelled by them
+        """
+        if columns is None or bar is None:
+            return columns
+        return list(columns) + [col for col in FactorResultAggregator.TIME_COLUMNS if col not in columns]
+
+    @staticmethod
+    def _check_result_columns(columns, factors):
+        """
+        Check whether columns of a factor result projection are valid
+        :param columns: list of columns, None means no projection
+        :param factors: factor names
+        :return: err_code
+        """
+        if columns is None:
+            return Error.SUCCESS
+
+        if len(columns) == 0 or not set(columns).issubset(set(factors).union({"datetime", "date"})) or \
+                not set(columns).intersection(set(factors)):
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID
+
+        return Error.SUCCESS
+
+    def load_multi_factor_results(self, factors, stock_code, fetch_date, start_time=None, end_time=None,
+                                  columns=None, bar=None, agg=None):
         """
         :param factors:
         :param stock_code:
         :param fetch_date:
+        :param start_time: only rows not earlier than start_time(datetime.time) are loaded if not None
+        :param end_time: only rows not later than end_time(datetime.time) are loaded if not None
+        :param columns: columns to load among factors, "datetime" and "date", all of them are loaded if None
+        :param bar: bar size to aggregate results into(see FactorResultAggregator), not aggregated if None
+        :param agg: comma separated aggregations applied to each bar
         :return: err_code, dataframe
         """
 
@@ -304,10 +555,27 @@ class Master(object):
                 elif err:
                     return err, None
 
+        if self._check_result_columns(columns, factors):
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, "invalid columns"
+
+        err, aggs = FactorResultAggregator.parse(bar, agg)
+        if err:
+            return err, "invalid aggregation"
+        columns = self._get_load_columns(columns, bar)
+
+        time_columns = ["datetime", "date"]
+        if columns is not None:
+            time_columns = [col for col in time_columns if col in columns]
+
         result_df = None
         for factor in factors:
+            if columns is not None and factor not in columns:
+                continue
+
+            load_columns = [factor] + time_columns if result_df is None else [factor]
             err, factor_df = self.factor_dao.load_factor_result(factor, factors[factor], stock_code, fetch_date,
-                                                                with_time=result_df is None)
+                                                                start_time=start_time, end_time=end_time,
+                                                                columns=load_columns)
             if err == Error.ERROR_FACTOR_RESULT_NOT_EXISTS:
                 return err, "factor result not exists({0}:{1})".format(factor, factors[factor])
             else:
@@ -316,14 +584,26 @@ class Master(object):
                 else:
                     result_df[factor] = factor_df[factor]
 
+        if columns is not None:
+            result_df = result_df[columns]
+
+        if bar is not None:
+            result_df = FactorResultAggregator.aggregate(result_df, bar, aggs)
+
         return Error.SUCCESS, result_df
 
-    def load_multi_factor_result_by_range(self, factors, stock_code, start_date, end_date):
+    def load_multi_factor_result_by_range(self, factors, stock_code, start_date, end_date, start_time=None,
+                                          end_time=None, columns=None, bar=None, agg=None):
         """
         :param factors:
         :param stock_code:
         :param start_date:
         :param end_date:
+        :param start_time: only rows not earlier than start_time(datetime.time) of each day are loaded if not None
+        :param end_time: only rows not later than end_time(datetime.time) of each day are loaded if not None
+        :param columns: columns to load among factors, "datetime" and "date", all of them are loaded if None
+        :param bar: bar size to aggregate results into(see FactorResultAggregator), not aggregated if None
+        :param agg: comma separated aggregations applied to each bar
         :return: err_code, dataframe
         """
 
@@ -348,13 +628,25 @@ class Master(object):
                 elif err:
                     return err, None
 
+        if self._check_result_columns(columns, factors):
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, "invalid columns"
+
+        err, aggs = FactorResultAggregator.parse(bar, agg)
+        if err:
+            return err, "invalid aggregation"
+        columns = self._get_load_columns(columns, bar)
+
         result_df = None
         df_dict = {}
         dates = None
         for factor in factors:
+            if columns is not None and factor not in columns:
+                continue
+
             err, factor_df = self.factor_dao.load_factor_result_by_range(factor, factors[factor], stock_code,
                                                                          start_date, end_date,
-                                                                         with_time=True)
+                                                                         with_time=True, start_time=start_time,
+                                                                         end_time=end_time)
             if err == Error.ERROR_FACTOR_RESULT_NOT_EXISTS:
                 return err, "factor result not exists({0}:{1})".format(factor, factors[factor])
             else:
@@ -373,6 +665,12 @@ class Master(object):
             else:
                 result_df[factor] = df[factor].tolist()
 
+        if columns is not None:
+            result_df = result_df[columns]
+
+        if bar is not None:
+            result_df = FactorResultAggregator.aggregate(result_df, bar, aggs)
+
         return Error.SUCCESS, result_df
 
     def get_factor_update_status(self, factor, stock_code, version=None):
@@ -419,6 +717,27 @@ class Master(object):
 
         return self.factor_dao.list_updated_dates(factor, version, stock_code)
 
+    def get_factor_update_times(self, factor, stock_code, start_date=None, end_date=None, version=None):
+        """
+        :param factor:
+        :param stock_code:
+        :param start_date:
+        :param end_date:
+        :param version:
+        :return: err_code, resolved version, list of (date, end update time)
+        """
+        if version is None:
+            err, version = self.factor_dao.get_latest_version(factor)
+            if err:
+                return err, None, None
+
+        err, update_times = self.factor_dao.list_update_times(factor, version, stock_code, start_date=start_date,
+                                                              end_date=end_date)
+        if err:
+            return err, None, None
+
+        return Error.SUCCESS, version, update_times
+
     def _create_task(self, task_type, *args, **kwargs):
         return self.task_manager.new_task(task_type, *args, **kwargs)
 
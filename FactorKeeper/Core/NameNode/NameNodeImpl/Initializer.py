@@ -54,6 +54,10 @@ class Initializer(object):
         if err:
             return err
 
+        err = self._table_maker.create_factor_state_table()
+        if err:
+            return err
+
         err = self._table_maker.create_group_factor_list_table()
         if err:
             return err
@@ -69,6 +73,10 @@ class Initializer(object):
         if err:
             return err
 
+        err = self._table_maker.create_tick_source_catalog_tables()
+        if err:
+            return err
+
         return Error.SUCCESS
 
     def create_name_node_tables(self):
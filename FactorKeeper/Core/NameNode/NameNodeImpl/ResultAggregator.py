@@ -0,0 +1,117 @@
+"""
+    This file defines resampling of factor results into bars, which is done on name node
+    so that only aggregated data is sent back to clients.
+"""
+
+
+from Core.Error.Error import Error
+import numpy as np
+import pandas as pd
+
+
+class FactorResultAggregator(object):
+    """
+        Bars are right closed and right labelled, e.g. a 1min bar labelled 09:31:00 covers ticks in
+        (09:30:00, 09:31:00]. A "1d" bar summarizes a whole day and is labelled by date only.
+    """
+    BAR_SECONDS = {
+        "3s": 3,
+        "30s": 30,
+        "1min": 60,
+        "5min": 5 * 60,
+        "15min": 15 * 60,
+        "30min": 30 * 60,
+        "1h": 60 * 60,
+        "1d": None
+    }
+    AGGREGATIONS = ("mean", "last", "first", "sum", "min", "max")
+    DEFAULT_AGGREGATION = "last"
+    TIME_COLUMNS = ("datetime", "date")
+
+    @staticmethod
+    def parse(bar, agg):
+        """
+        Parse aggregation parameters of a read request
+        :param bar: bar size like "1min", None means no aggregation
+        :param agg: aggregation function or comma separated list of them, default aggregation is used if None
+        :return: err_code, list of aggregations
+        """
+        if bar is None:
+            return (Error.SUCCESS, None) if agg is None else (Error.ERROR_PARAMETER_MISSING_OR_INVALID, None)
+
+        if bar not in FactorResultAggregator.BAR_SECONDS:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+        aggs = [FactorResultAggregator.DEFAULT_AGGREGATION] if agg is None else \
+            [a.strip() for a in agg.split(",") if a.strip()]
+        if len(aggs) == 0 or not set(aggs).issubset(FactorResultAggregator.AGGREGATIONS):
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+        return Error.SUCCESS, aggs
+
+    @staticmethod
+    def aggregate(df, bar, aggs):
+        """
+        Aggregate factor results into bars
+        :param df: factor result dataframe with "datetime" column, sorted by datetime
+        :param bar: bar size, must be a key of BAR_SECONDS
+        :param aggs: list of aggregations, result columns are named "<factor>_<agg>" if more than one is given
+        :return: dataframe of bars with "datetime" (except daily bars), "date" and aggregated factor columns
+        """
+        factor_columns = [col for col in df.columns if col not in FactorResultAggregator.TIME_COLUMNS]
+        timestamps = df['datetime'].values.astype('datetime64[s]')
+
+        bar_seconds = FactorResultAggregator.BAR_SECONDS[bar]
+        if bar_seconds is None:
+            labels = timestamps.astype('datetime64[D]').astype(np.int64)
+        else:
+            seconds = timestamps.astype(np.int64)
+            labels = (seconds + bar_seconds - 1) // bar_seconds * bar_seconds
+
+        # rows are sorted by datetime, so each bar is a contiguous slice
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1)) if labels.shape[0] > 0 \
+            else np.array([], dtype=np.int64)
+        ends = np.concatenate((starts[1:], [labels.shape[0]])).astype(np.int64)
+
+        ret = {}
+        if bar_seconds is None:
+            ret['date'] = labels[starts].astype('datetime64[D]')
+        else:
+            bar_times = labels[starts].astype('datetime64[s]')
+            ret['datetime'] = bar_times
+            ret['date'] = bar_times.astype('datetime64[D]')
+
+        for factor in factor_columns:
+            values = df[factor].values.astype(np.float64)
+            for agg in aggs:
+                column = factor if len(aggs) == 1 else "{0}_{1}".format(factor, agg)
+                ret[column] = FactorResultAggregator._reduce(values, starts, ends, agg)
+
+        columns = [col for col in FactorResultAggregator.TIME_COLUMNS if col in ret] + \
+                  [col for col in ret if col not in FactorResultAggregator.TIME_COLUMNS]
+        return pd.DataFrame(ret, columns=columns)
+
+    @staticmethod
+    def _reduce(values, starts, ends, agg):
+        if starts.shape[0] == 0:
+            return values[:0]
+
+        if agg == "first":
+            return values[starts]
+        if agg == "last":
+            return values[ends - 1]
+        if agg == "min":
+            return np.fmin.reduceat(values, starts)
+        if agg == "max":
+            return np.fmax.reduceat(values, starts)
+
+        # nan values are skipped by mean and sum
+        is_valid = ~np.isnan(values)
+        counts = np.add.reduceat(is_valid.astype(np.int64), starts)
+        sums = np.add.reduceat(np.where(is_valid, values, 0.0), starts)
+        sums[counts == 0] = np.nan
+        if agg == "sum":
+            return sums
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / counts
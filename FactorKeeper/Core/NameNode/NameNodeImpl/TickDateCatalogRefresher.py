@@ -0,0 +1,63 @@
+"""
+    This file defines the background refresh of tick date catalog on name node.
+"""
+
+
+from Core.Conf.DatabaseConf import TickDataSourceDatabaseConf
+import threading, traceback, time
+
+
+class TickDateCatalogRefresher(object):
+    """
+        Catalog is refreshed by a daemon thread every DATE_CATALOG_REFRESH_INTERVAL seconds, or as soon as a refresh
+        is requested, so that requests listing available dates never wait for data source scans. Days at or after
+        the high water mark are listed by every refresh, days backfilled below it are looked for every
+        DATE_CATALOG_BACKFILL_CHECK_INTERVAL seconds.
+    """
+    def __init__(self, tick_dao, logger):
+        """
+        :param tick_dao: TickDataDao of name node
+        :param logger:
+        """
+        self.tick_dao = tick_dao
+        self.logger = logger.sub_logger(self.__class__.__name__)
+        self.__wake_up = threading.Event()
+        self.__lock = threading.Lock()
+        self.__full_requested = False
+        self.__last_backfill_check = None
+
+    def start(self):
+        thread = threading.Thread(target=self.__run)
+        thread.daemon = True
+        thread.start()
+
+    def request_refresh(self, full=False):
+        """
+        Wake up refresh thread, requests made while a refresh is running are served by next refresh
+        :param full: list all days of data source again if True
+        """
+        with self.__lock:
+            self.__full_requested = self.__full_requested or full
+        self.__wake_up.set()
+
+    def __run(self):
+        while True:
+            self.__wake_up.clear()
+            with self.__lock:
+                full = self.__full_requested
+                self.__full_requested = False
+
+            backfill_check_interval = TickDataSourceDatabaseConf.DATE_CATALOG_BACKFILL_CHECK_INTERVAL
+            check_backfill = not full and (self.__last_backfill_check is None or
+                                           time.time() - self.__last_backfill_check >= backfill_check_interval)
+
+            try:
+                err = self.tick_dao.refresh_date_catalog(full=full, check_backfill=check_backfill)
+                if err:
+                    self.logger.log_warn("failed to refresh tick date catalog, err_code: {0}".format(err))
+                elif full or check_backfill:
+                    self.__last_backfill_check = time.time()
+            except:
+                self.logger.log_error(traceback.format_exc())
+
+            self.__wake_up.wait(TickDataSourceDatabaseConf.DATE_CATALOG_REFRESH_INTERVAL)
@@ -0,0 +1,100 @@
+"""
+    This file defines the cache of serialized factor results kept by name node.
+    A cached day is invalidated when the day is rewritten by a factor update callback.
+"""
+
+
+from Util.CacheUtil.LRUCache import ByteBudgetLRUCache
+from threading import Lock
+import datetime
+
+
+class FactorResultCache(object):
+    """
+        Byte budgeted LRU cache of serialized factor results keyed by (factor, version, stock, day).
+
+        A miss returns a load token. The loader must hand the token back with "put" (with value None
+        if loading failed). Invalidating a key while it is being loaded makes its token stale, so a
+        result read before a rewrite is never cached after it.
+    """
+    def __init__(self, max_bytes, logger):
+        self.logger = logger.sub_logger(self.__class__.__name__)
+        self.__cache = ByteBudgetLRUCache(max_bytes)
+        self.__loading = {}  # key -> [number of loaders, generation]
+        self.__lock = Lock()
+
+    @staticmethod
+    def make_key(factor, version, stock_code, day):
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        return factor, version, stock_code, str(day)
+
+    def get(self, factor, version, stock_code, day):
+        """
+        Get a serialized factor result
+        :param factor:
+        :param version:
+        :param stock_code:
+        :param day:
+        :return: True if hit else False, serialized result, load token if missed
+        """
+        key = self.make_key(factor, version, stock_code, day)
+
+        is_hit, value = self.__cache.get(key)
+        if is_hit:
+            return True, value, None
+
+        self.__lock.acquire()
+        try:
+            loading = self.__loading.setdefault(key, [0, 0])
+            loading[0] += 1
+            token = (key, loading[1])
+        finally:
+            self.__lock.release()
+
+        return False, None, token
+
+    def put(self, value, token):
+        """
+        Cache a serialized factor result loaded after a miss
+        :param value: serialized result string, None if loading failed
+        :param token: load token returned by "get"
+        :return: True if cached else False
+        """
+        key, generation = token
+
+        self.__lock.acquire()
+        try:
+            loading = self.__loading[key]
+            loading[0] -= 1
+            is_valid = loading[1] == generation
+            if loading[0] == 0:
+                del self.__loading[key]
+
+            if value is None or not is_valid:
+                return False
+            return self.__cache.put(key, value, len(value))
+        finally:
+            self.__lock.release()
+
+    def invalidate(self, factors, version, stock_code, day):
+        """
+        Invalidate a rewritten day of factors
+        :param factors: list of factor names, sub factors of a group factor should all be listed
+        :param version:
+        :param stock_code:
+        :param day:
+        :return: None
+        """
+        self.__lock.acquire()
+        try:
+            for factor in factors:
+                key = self.make_key(factor, version, stock_code, day)
+                if key in self.__loading:
+                    self.__loading[key][1] += 1
+                self.__cache.invalidate(key)
+        finally:
+            self.__lock.release()
+
+    def stats(self):
+        return self.__cache.stats()
@@ -6,7 +6,8 @@ from Core.DAO.FactorDao.FactorDao import FactorDao
 from Core.DAO.TickDataDao import TickDataDao
 from Core.DAO.TableMakerDao import TableMaker
 from Core.Conf.FactorConf import FactorConf
-import traceback
+from Util.TimeUtil.TickGrid import TickGrid
+import traceback, json
 
 
 class UpdateFactorTaskHandler(TaskHandler):
@@ -21,6 +22,20 @@ class UpdateFactorTaskHandler(TaskHandler):
         self.factor_dao = FactorDao(db_engine, logger)
         self.tick_dao = TickDataDao(db_engine, logger)
         self.table_maker = TableMaker(db_engine, logger)
+        self.result_cache = None
+
+    def set_result_cache(self, result_cache):
+        """
+        set the factor result cache invalidated when a day of factor data is replaced
+        :param result_cache:
+        :return: err_code
+        """
+        self.result_cache = result_cache
+        return Error.SUCCESS
+
+    def _invalidate_cached_result(self, factors, version, stock_code, day):
+        if self.result_cache is not None:
+            self.result_cache.invalidate(factors, version, stock_code, day)
 
     @classmethod
     def gen_task_desc(cls, *args, **kwargs):
@@ -34,9 +49,38 @@ class UpdateFactorTaskHandler(TaskHandler):
         version = kwargs['version']
         stock_code = kwargs['stock_code']
 
+        err, factor = self._prepare_linkage_table(factor, version, stock_code)
+        if err:
+            return err, None
+
+        # check task
+        err, is_newest_version = self.tick_dao.is_tick_data_newest_version(stock_code)
+        if err:
+            return err, None
+
+        if is_newest_version:
+            # stock already exists, just update factor
+            err, task_desc = self.gen_task_desc(factor=factor, version=version, stock_code=stock_code)
+            return Error.SUCCESS, UpdateFactorTask(task_desc, factor, stock_code, version, None)
+        else:
+            # stock not exists, update tick data first
+            err, tick_update_task = self._new_tick_update_task(stock_code)
+            if err:
+                return err, None
+
+            _, task_desc = self.gen_task_desc(factor=factor, version=version, stock_code=stock_code)
+            update_factor_task = UpdateFactorTask(task_desc, factor, stock_code, version, None)
+            update_factor_task.add_dependency(tick_update_task)
+            return Error.SUCCESS, update_factor_task
+
+    def _prepare_linkage_table(self, factor, version, stock_code):
+        """
+        create factor table of a linkage if not exists
+        :return: err_code, group factor name(factor itself if it is not a sub factor)
+        """
         err, group_factor = self.factor_dao.get_group_factor(factor, factor)
         if err:
-            return err
+            return err, None
 
         # check weather linkage exists
         err, link_id = self.factor_dao.get_linkage_id(group_factor, version, stock_code)
@@ -62,31 +106,18 @@ class UpdateFactorTaskHandler(TaskHandler):
                 if err:
                     return err, None
 
-        factor = group_factor
+        return Error.SUCCESS, group_factor
 
-        # check task
-        err, is_newest_version = self.tick_dao.is_tick_data_newest_version(stock_code)
+    def _new_tick_update_task(self, stock_code):
+        """
+        :return: err_code, tick data update task of a stock
+        """
+        err, tick_update_handler = self.get_task_manager().get_handler(TickDataUpdateTaskHandler)
         if err:
-            return err, None
-
-        if is_newest_version:
-            # stock already exists, just update factor
-            err, task_desc = self.gen_task_desc(factor=factor, version=version, stock_code=stock_code)
-            return Error.SUCCESS, UpdateFactorTask(task_desc, factor, stock_code, version, None)
-        else:
-            # stock not exists, update tick data first
-            err, tick_update_handler = self.get_task_manager().get_handler(TickDataUpdateTaskHandler)
-            if err:
-                print("Tick update handler not registered ?")
-                return Error.ERROR_SERVER_INTERNAL_ERROR, None
-            err, tick_update_task = tick_update_handler.new_task(stock_code=stock_code)
-            if err:
-                return err, None
+            print("Tick update handler not registered ?")
+            return Error.ERROR_SERVER_INTERNAL_ERROR, None
 
-            _, task_desc = self.gen_task_desc(factor=factor, version=version, stock_code=stock_code)
-            update_factor_task = UpdateFactorTask(task_desc, factor, stock_code, version, None)
-            update_factor_task.add_dependency(tick_update_task)
-            return Error.SUCCESS, update_factor_task
+        return tick_update_handler.new_task(stock_code=stock_code)
 
     def start_task(self, task):
         return self._worker_manager.send_command("update_factor",
@@ -117,10 +148,21 @@ class UpdateFactorTaskHandler(TaskHandler):
         stock_code = kwargs['stock_code']
         df = kwargs['data_frame']
         day = kwargs['date']
+        state = kwargs.get('state', None)
+
+        # a day skipped by a stateful generator carries the state of the day before, it's not logged as updated
+        if df is None:
+            if state is None:
+                return Error.ERROR_INVALID_FACTOR_RESULT
+            err, link_id = self.factor_dao.get_linkage_id(factor, version, stock_code)
+            if err:
+                return err
+            return self.factor_dao.save_factor_state(link_id, day.date(), state)
 
         # check result data frame format
         if df.shape[0] != FactorConf.FACTOR_LENGTH:
             return Error.ERROR_INVALID_FACTOR_RESULT
+        df = TickGrid.attach_time_columns(df, day)
 
         df.info()
 
@@ -128,6 +170,7 @@ class UpdateFactorTaskHandler(TaskHandler):
         if err:
             return err
 
+        cached_factors = [factor]
         if is_group_factor:
             err, sub_factors = self.factor_dao.get_sub_factors(factor, version)
             if err:
@@ -135,9 +178,11 @@ class UpdateFactorTaskHandler(TaskHandler):
             data_columns = set(df.columns) - {"datetime", "date"}
             if data_columns != set(sub_factors):
                 return Error.ERROR_GROUP_FACTOR_SIGNATURE_NOT_MATCHED
+            cached_factors = sub_factors
 
         # save result
         err, link_id = self.factor_dao.get_linkage_id(factor, version, stock_code)
+        self._invalidate_cached_result(cached_factors, version, stock_code, day)
         err = self.factor_dao.clean_old_factor_data(factor, version, stock_code, day.date())
         if err:
             return err
@@ -159,6 +204,15 @@ class UpdateFactorTaskHandler(TaskHandler):
             finally:
                 conn.close()
 
+            self._invalidate_cached_result(cached_factors, version, stock_code, day)
+
+            # state of stateful generators is saved before the day is logged as updated
+            if state is not None:
+                err = self.factor_dao.save_factor_state(link_id, day.date(), state)
+                if err:
+                    self._logger.log_error("failed to save factor state")
+                    return err
+
             err = self.factor_dao.finish_update_log(log_id)
             if err:
                 self._logger.log_error("failed to finish update log")
@@ -205,3 +259,177 @@ class UpdateFactorTask(BaseTask):
         task_str = "<br>" + "_" * 100 + "<br>|" + task_str + "<br>|" + "_" * 100
 
         return task_str
+
+
+class UpdateStockFactorsTaskHandler(UpdateFactorTaskHandler):
+    """
+        Update all factors linked to a stock in fused mode: workers load each day of tick data once, run every
+        pending generator on it and call back results of a day with one request.
+    """
+    TASK_TYPE = "UPDATE_STOCK_FACTORS"
+
+    @classmethod
+    def gen_task_desc(cls, *args, **kwargs):
+        stock_code = kwargs['stock_code']
+        return Error.SUCCESS, "UpdateStockFactors$$" + stock_code
+
+    def new_task(self, *args, **kwargs):
+        stock_code = kwargs['stock_code']
+
+        err, linkages = self.factor_dao.list_stock_linkages(stock_code)
+        if err:
+            return err, None
+
+        if len(linkages) == 0:
+            return Error.ERROR_LINKAGE_NOT_EXISTS, None
+
+        for factor, version in linkages:
+            err, _ = self._prepare_linkage_table(factor, version, stock_code)
+            if err:
+                return err, None
+
+        _, task_desc = self.gen_task_desc(stock_code=stock_code)
+        update_factor_task = UpdateStockFactorsTask(task_desc, stock_code, linkages, None)
+
+        err, is_newest_version = self.tick_dao.is_tick_data_newest_version(stock_code)
+        if err:
+            return err, None
+
+        if not is_newest_version:
+            err, tick_update_task = self._new_tick_update_task(stock_code)
+            if err:
+                return err, None
+
+            update_factor_task.add_dependency(tick_update_task)
+
+        return Error.SUCCESS, update_factor_task
+
+    def start_task(self, task):
+        return self._worker_manager.send_command("update_stock_factors",
+                                                 data={'task_id': task.task_id,
+                                                       'stock_code': task.stock_code,
+                                                       'linkages': json.dumps(task.linkages)})
+
+
+class UpdateStockFactorsTask(BaseTask):
+    """
+        Used to identify a fused factor update task of a stock
+    """
+    TASK_TYPE = UpdateStockFactorsTaskHandler.TASK_TYPE
+
+    def __init__(self, task_desc, stock_code, linkages, worker_info):
+        super().__init__(task_desc, worker_info)
+        self.stock_code = stock_code
+        self.linkages = [list(linkage) for linkage in linkages]
+
+    def task_str(self, deps_status):
+        task_str = "Task Id: {0} <br>" +\
+                "Stock Code: {1} <br>" +\
+                "Factors: {2} <br>" +\
+                "Status: {3} <br>" +\
+                "Worker Id: {4} <br>" +\
+                "Dependencies: <br>" +\
+                "&nbsp" * 10 + "[{5} <br>" +\
+                "&nbsp" * 10 + "]"
+
+        task_str = task_str.format(self.task_id, self.stock_code,
+                                   ", ".join(["{0}:{1}".format(factor, version) for factor, version in self.linkages]),
+                                   self.status_desc,
+                                   self.worker_info.id if self.worker_info is not None else "Not Assigned",
+                                   deps_status)
+
+        task_str = task_str.replace("<br>", "<br>|")
+        task_str = "<br>" + "_" * 100 + "<br>|" + task_str + "<br>|" + "_" * 100
+
+        return task_str
+
+
+class UpdateFactorXSTaskHandler(UpdateFactorTaskHandler):
+    """
+        Update factor of all linked stocks of a factor version with a cross-sectional generator
+        ("factor_generator_xs"). Workers schedule unit tasks by date and call back per stock, so callbacks
+        are stored to each linkage the same way as single stock updates.
+    """
+    TASK_TYPE = "UPDATE_FACTOR_XS"
+
+    @classmethod
+    def gen_task_desc(cls, *args, **kwargs):
+        factor = kwargs['factor']
+        version = kwargs['version']
+        return Error.SUCCESS, "UpdateFactorXS$${0}$${1}".format(factor, version)
+
+    def new_task(self, *args, **kwargs):
+        factor = kwargs['factor']
+        version = kwargs['version']
+
+        err, stock_codes = self.factor_dao.list_linked_stocks(factor, version)
+        if err:
+            return err, None
+
+        if len(stock_codes) == 0:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+        group_factor = factor
+        for stock_code in stock_codes:
+            err, group_factor = self._prepare_linkage_table(factor, version, stock_code)
+            if err:
+                return err, None
+
+        _, task_desc = self.gen_task_desc(factor=group_factor, version=version)
+        update_factor_task = UpdateFactorXSTask(task_desc, group_factor, stock_codes, version, None)
+
+        # tick data of all stocks are updated before the cross section is computed
+        for stock_code in stock_codes:
+            err, is_newest_version = self.tick_dao.is_tick_data_newest_version(stock_code)
+            if err:
+                return err, None
+
+            if not is_newest_version:
+                err, tick_update_task = self._new_tick_update_task(stock_code)
+                if err:
+                    return err, None
+
+                update_factor_task.add_dependency(tick_update_task)
+
+        return Error.SUCCESS, update_factor_task
+
+    def start_task(self, task):
+        return self._worker_manager.send_command("update_factor_xs",
+                                                 data={'task_id': task.task_id,
+                                                       'factor': task.factor,
+                                                       'version': task.version,
+                                                       'stock_codes': json.dumps(task.stock_codes)})
+
+
+class UpdateFactorXSTask(BaseTask):
+    """
+        Used to identify a cross-sectional factor update task
+    """
+    TASK_TYPE = UpdateFactorXSTaskHandler.TASK_TYPE
+
+    def __init__(self, task_desc, factor, stock_codes, version, worker_info):
+        super().__init__(task_desc, worker_info)
+        self.factor = factor
+        self.stock_codes = list(stock_codes)
+        self.version = version
+
+    def task_str(self, deps_status):
+        task_str = "Task Id: {0} <br>" +\
+                "Factor: {1} <br>" +\
+                "Version: {2} <br>" +\
+                "Stock Num: {3} <br>" +\
+                "Status: {4} <br>" +\
+                "Worker Id: {5} <br>" +\
+                "Dependencies: <br>" +\
+                "&nbsp" * 10 + "[{6} <br>" +\
+                "&nbsp" * 10 + "]"
+
+        task_str = task_str.format(self.task_id, self.factor, self.version, len(self.stock_codes),
+                                   self.status_desc,
+                                   self.worker_info.id if self.worker_info is not None else "Not Assigned",
+                                   deps_status)
+
+        task_str = task_str.replace("<br>", "<br>|")
+        task_str = "<br>" + "_" * 100 + "<br>|" + task_str + "<br>|" + "_" * 100
+
+        return task_str
@@ -3,9 +3,9 @@ from Core.Error.Error import Error
 from Core.DAO.FactorDao.FactorDao import FactorDao
 from Core.DAO.TickDataDao import TickDataDao
 from Core.DAO.TableMakerDao import TableMaker
-from Core.Conf.DatabaseConf import Schemas, Tables
 from Core.Conf.TickDataConf import TickDataConf
-import traceback
+from Util.TimeUtil.TickGrid import TickGrid
+import json, hashlib
 
 
 class TickDataUpdateTaskHandler(TaskHandler):
@@ -42,10 +42,17 @@ class TickDataUpdateTaskHandler(TaskHandler):
                 if err:
                     return err, None
         else:
-            err, is_table_exists = self.tick_dao.is_stock_view_table_exists(stock_code)
+            err, is_virtual = self.tick_dao.is_virtual_stock_view(stock_code)
             if err:
                 return err, None
 
+            # virtual views have no table, they are assembled from stocks on read
+            is_table_exists = is_virtual
+            if not is_virtual:
+                err, is_table_exists = self.tick_dao.is_stock_view_table_exists(stock_code)
+                if err:
+                    return err, None
+
             if not is_table_exists:
                 err, relation = self.tick_dao.get_stock_view_relation(stock_code)
                 if err:
@@ -76,6 +83,15 @@ class TickDataUpdateTaskHandler(TaskHandler):
         return Error.SUCCESS, update_task
 
     def start_task(self, task):
+        if TickDataConf.is_stock_view(task.stock_code):
+            err, is_virtual = self.tick_dao.is_virtual_stock_view(task.stock_code)
+            if err:
+                return err, None, None
+
+            # stocks of a virtual view are updated by dependency tasks, nothing is left to be done
+            if is_virtual:
+                return Error.ERROR_TASK_HAS_NOTHING_TO_BE_DONE, None, None
+
         return self._worker_manager.send_command("update_tick_data",
                                                  data={
                                                      "task_id": task.task_id,
@@ -101,28 +117,9 @@ class TickDataUpdateTaskHandler(TaskHandler):
 
         if df.shape[0] != TickDataConf.TICK_LENGTH:
             return Error.ERROR_TICK_RESULT_INCORRECT
+        df = TickGrid.attach_time_columns(df, day)
 
-        err, log_id = self.tick_dao.create_new_update_log(stock_code, day)
-        if err:
-            return err
-
-        conn = self.db_engine.connect()
-        try:
-            if not TickDataConf.is_stock_view(stock_code):
-                df.to_sql(Tables.TABLE_TICK_STOCK_PREFIX + stock_code, schema=Schemas.SCHEMA_TICK_DATA,
-                          if_exists='append', index=False, con=conn)
-            else:
-                df.to_sql(Tables.TABLE_TICK_STOCK_VIEW_PREFIX + stock_code, schema=Schemas.SCHEMA_STOCK_VIEW_DATA,
-                          if_exists='append', index=False, con=conn)
-        except:
-            self._logger.log_error(traceback.format_exc())
-            return Error.ERROR_DB_EXECUTION_FAILED
-        finally:
-            conn.close()
-
-        err = self.tick_dao.finish_update_log(log_id)
-
-        return err
+        return self.tick_dao.save_day_tick_data(stock_code, day, df)
 
     def stop_all(self):
         pass
@@ -156,3 +153,78 @@ class TickDataUpdateTask(BaseTask):
         task_str = "<br>" + "_" * 100 + "<br>|" + task_str + "<br>|" + "_" * 100
 
         return task_str
+
+
+class TickDataUniverseUpdateTaskHandler(TickDataUpdateTaskHandler):
+    """
+        Update tick data of many stocks on one day. Workers fetch the day for a chunk of stocks with one query
+        and call back per stock, so callbacks are handled the same way as single stock updates.
+    """
+    TASK_TYPE = "UPDATE_TICK_DATA_UNIVERSE"
+
+    @classmethod
+    def gen_task_desc(cls, *args, **kwargs):
+        day = kwargs['day']
+        stock_codes = kwargs['stock_codes']
+
+        # requests of different stock lists on the same day are different tasks
+        stocks_hash = hashlib.sha1(",".join(sorted(set(stock_codes))).encode("utf-8")).hexdigest()
+        return Error.SUCCESS, "UpdateTickDataUniverse$${0}$${1}".format(day, stocks_hash)
+
+    def new_task(self, *args, **kwargs):
+        stock_codes = kwargs['stock_codes']
+        day = kwargs['day']
+
+        if len(stock_codes) == 0:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+        for stock_code in stock_codes:
+            # stock views are derived from other stocks rather than imported
+            if TickDataConf.is_stock_view(stock_code):
+                return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+            err, is_table_exists = self.tick_dao.is_stock_table_exists_in_factor_keeper_db(stock_code)
+            if err:
+                return err, None
+
+            if not is_table_exists:
+                err = self.table_maker.create_tick_data_table(stock_code)
+                if err:
+                    return err, None
+
+        _, task_desc = self.gen_task_desc(day=day, stock_codes=stock_codes)
+
+        return Error.SUCCESS, TickDataUniverseUpdateTask(task_desc, stock_codes, day)
+
+    def start_task(self, task):
+        return self._worker_manager.send_command("update_tick_data_universe",
+                                                 data={
+                                                     "task_id": task.task_id,
+                                                     "stock_codes": json.dumps(task.stock_codes),
+                                                     "date": str(task.day)
+                                                 })
+
+
+class TickDataUniverseUpdateTask(BaseTask):
+    TASK_TYPE = TickDataUniverseUpdateTaskHandler.TASK_TYPE
+
+    def __init__(self, task_desc, stock_codes, day, worker_info=None):
+        super().__init__(task_desc, worker_info)
+
+        self.stock_codes = list(stock_codes)
+        self.day = day
+
+    def task_str(self, deps_status):
+        task_str = "Task Id: {0} <br>" + \
+                   "Date: {1} <br>" + \
+                   "Stock Num: {2} <br>" + \
+                   "Status: {3} <br>" + \
+                   "Worker Id: {4} <br>"
+
+        task_str = task_str.format(self.task_id, self.day, len(self.stock_codes), self.status_desc,
+                                   self.worker_info.id if self.worker_info is not None else "Not Assigned")
+
+        task_str = task_str.replace("<br>", "<br>|")
+        task_str = "<br>" + "_" * 100 + "<br>|" + task_str + "<br>|" + "_" * 100
+
+        return task_str
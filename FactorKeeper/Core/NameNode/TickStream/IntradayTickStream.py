@@ -0,0 +1,268 @@
+"""
+    This file defines intraday streaming ingestion of tick data. Ticks of the current trading day are
+    appended to a per stock buffer aligned to the tick grid, so the partial day is queryable while it is
+    being filled. A sealed day is written to factor keeper database the same way as a batch imported one.
+"""
+
+
+from Core.DAO.TickDataDao import TickDataDao
+from Core.DAO.TableMakerDao import TableMaker
+from Core.DAO.ComplicatedTables.TickDataTable import TickDataTable
+from Core.Conf.TickDataConf import TickDataConf
+from Core.Error.Error import Error
+from Util.TimeUtil.TickGrid import TickGrid
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+
+class IntradayTickBuffer(object):
+    """
+        Ticks are aggregated into grid slots with the same rules as batch normalization(see TickGridNormalizer).
+        A slot is filled once a tick at or after its grid point has arrived, no later tick can change it.
+        Ticks not later than the latest received one are dropped as late or duplicated ticks.
+    """
+    def __init__(self, day, columns):
+        self.day = day
+        self.grid = TickGrid.grid_for_day(day)
+        self.columns = list(columns)
+        self.dropped_ticks = 0
+
+        self.__grid_ns = self.grid.astype(np.int64)
+        self.__last_tick_time = None
+        self.__values = {}
+        for col in self.columns:
+            if self.__is_sum_column(col):
+                self.__values[col] = np.zeros(self.grid.shape[0])
+            else:
+                self.__values[col] = np.full(self.grid.shape[0], np.nan)
+
+    @staticmethod
+    def __is_sum_column(column):
+        return TickDataConf.TICK_COLUMN_AGGREGATIONS.get(column, TickDataConf.DEFAULT_TICK_COLUMN_AGGREGATION) == \
+               "sum"
+
+    def append(self, ticks_df):
+        """
+        Append ticks of the day
+        :param ticks_df: dataframe with "datetime" column and tick columns
+        :return: number of ticks accepted
+        """
+        times = ticks_df['datetime'].values.astype('datetime64[ns]').astype(np.int64)
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+
+        is_accepted = np.empty(times.shape[0], dtype=bool)
+        is_accepted[:1] = True
+        is_accepted[1:] = times[1:] != times[:-1]
+        if self.__last_tick_time is not None:
+            is_accepted &= times > self.__last_tick_time
+        self.dropped_ticks += int(times.shape[0] - is_accepted.sum())
+
+        rows = order[is_accepted]
+        times = times[is_accepted]
+        if times.shape[0] == 0:
+            return 0
+
+        buckets = np.searchsorted(self.__grid_ns, times, side='left')
+        in_grid = buckets < self.grid.shape[0]
+        for col in self.columns:
+            if col not in ticks_df.columns:
+                continue
+
+            values = ticks_df[col].values[rows].astype(np.float64)
+            if self.__is_sum_column(col):
+                np.add.at(self.__values[col], buckets[in_grid], np.nan_to_num(values[in_grid]))
+            else:
+                is_valid = in_grid & ~np.isnan(values)
+                valid_buckets = buckets[is_valid]
+                valid_values = values[is_valid]
+                # ticks are sorted, the last one of each slot is kept
+                is_last = np.empty(valid_buckets.shape[0], dtype=bool)
+                is_last[:-1] = valid_buckets[1:] != valid_buckets[:-1]
+                is_last[-1:] = True
+                self.__values[col][valid_buckets[is_last]] = valid_values[is_last]
+
+        self.__last_tick_time = int(times[-1])
+        return int(times.shape[0])
+
+    def filled_num(self):
+        """
+        :return: number of filled slots, slots are filled in grid order
+        """
+        if self.__last_tick_time is None:
+            return 0
+        return int(np.searchsorted(self.__grid_ns, self.__last_tick_time, side='right'))
+
+    def get_slots(self, since=0, fill_all=False):
+        """
+        :param since: index of the first slot returned
+        :param fill_all: return all slots of the day as if every slot were filled, used when day is sealed
+        :return: dataframe of slots with tick columns, "datetime" and "date"
+        """
+        end = self.grid.shape[0] if fill_all else self.filled_num()
+        since = min(max(since, 0), end)
+
+        ret = {}
+        for col in self.columns:
+            values = self.__values[col][:end]
+            if not self.__is_sum_column(col):
+                values = self.__fill_last(values)
+            ret[col] = values[since:]
+
+        ret_df = pd.DataFrame(ret, columns=self.columns)
+        ret_df['datetime'] = self.grid[since: end]
+        ret_df['date'] = self.day
+        return ret_df
+
+    @staticmethod
+    def __fill_last(values):
+        # slots without ticks take the previous slot, slots before the first tick take the first one
+        positions = np.where(np.isnan(values), -1, np.arange(values.shape[0]))
+        positions = np.maximum.accumulate(positions) if positions.shape[0] > 0 else positions
+        valid = np.flatnonzero(positions >= 0)
+        if valid.shape[0] == 0:
+            return values.copy()
+        positions[:valid[0]] = valid[0]
+        return values[positions]
+
+
+class IntradayTickStreamManager(object):
+    """
+        Keeps one buffer per stock for the latest streamed day. A buffer of an earlier day is dropped
+        if it is not sealed before ticks of a later day arrive.
+        Buffers hold every column of tick data table, so sealed days are saved with the same columns whatever
+        columns are pushed, pushes with columns out of tick data table are rejected.
+    """
+    def __init__(self, db_engine, logger):
+        self.logger = logger.sub_logger(self.__class__.__name__)
+        self.tick_dao = TickDataDao(db_engine, logger)
+        self.table_maker = TableMaker(db_engine, logger)
+        self.tick_columns = [col for col in TickDataTable().get_column_name_list(without_quote=True)
+                             if col != "id" and col not in TickGrid.TIME_COLUMNS]
+        self.__buffers = {}
+        # stocks being sealed, a day is checked and saved by one seal at a time
+        self.__sealing_stocks = set()
+        self.__lock = Lock()
+
+    def append_ticks(self, stock_code, ticks_df):
+        """
+        Append streamed ticks of a stock
+        :param stock_code: stock code, stock views are not supported
+        :param ticks_df: dataframe with "datetime" column and tick columns, all ticks must be on the same day
+        :return: err_code, number of filled slots
+        """
+        if TickDataConf.is_stock_view(stock_code) or 'datetime' not in ticks_df.columns:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+        for col in ticks_df.columns:
+            if col in TickGrid.TIME_COLUMNS:
+                continue
+            if col not in self.tick_columns or ticks_df[col].dtype.kind not in 'biuf':
+                return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+        if ticks_df.shape[0] == 0:
+            return self.get_filled_num(stock_code)
+
+        days = pd.to_datetime(ticks_df['datetime']).dt.date.unique()
+        if len(days) != 1:
+            return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+        day = days[0]
+
+        self.__lock.acquire()
+        try:
+            buffer = self.__buffers.get(stock_code, None)
+            if buffer is not None and day < buffer.day:
+                return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+            if buffer is None or day > buffer.day:
+                if buffer is not None:
+                    self.logger.log_warn("unsealed stream of {0} on {1} dropped".format(stock_code, buffer.day))
+
+                buffer = IntradayTickBuffer(day, self.tick_columns)
+                self.__buffers[stock_code] = buffer
+
+            buffer.append(ticks_df)
+            return Error.SUCCESS, buffer.filled_num()
+        finally:
+            self.__lock.release()
+
+    def get_filled_num(self, stock_code):
+        self.__lock.acquire()
+        try:
+            buffer = self.__buffers.get(stock_code, None)
+            if buffer is None:
+                return Error.ERROR_TICK_STREAM_NOT_EXISTS, None
+            return Error.SUCCESS, buffer.filled_num()
+        finally:
+            self.__lock.release()
+
+    def load_ticks(self, stock_code, since=0):
+        """
+        Load filled slots of the streamed day
+        :param stock_code:
+        :param since: index of the first slot to load, consumers pass the number of slots they have got
+        :return: err_code, dataframe of slots
+        """
+        self.__lock.acquire()
+        try:
+            buffer = self.__buffers.get(stock_code, None)
+            if buffer is None:
+                return Error.ERROR_TICK_STREAM_NOT_EXISTS, None
+            return Error.SUCCESS, buffer.get_slots(since)
+        finally:
+            self.__lock.release()
+
+    def seal(self, stock_code):
+        """
+        Seal the streamed day after close, unfilled slots are filled as if no more tick arrived and
+        the whole day is saved like a batch imported one
+        :param stock_code:
+        :return: err_code
+        """
+        self.__lock.acquire()
+        try:
+            buffer = self.__buffers.get(stock_code, None)
+            if buffer is None:
+                return Error.ERROR_TICK_STREAM_NOT_EXISTS
+            if stock_code in self.__sealing_stocks:
+                return Error.ERROR_TICK_STREAM_BEING_SEALED
+            self.__sealing_stocks.add(stock_code)
+            day_df = buffer.get_slots(fill_all=True)
+        finally:
+            self.__lock.release()
+
+        is_saved = False
+        try:
+            err = self.__save_sealed_day(stock_code, buffer.day, day_df)
+            is_saved = not err
+        finally:
+            self.__lock.acquire()
+            try:
+                self.__sealing_stocks.discard(stock_code)
+                if is_saved and self.__buffers.get(stock_code, None) is buffer:
+                    self.__buffers.pop(stock_code)
+            finally:
+                self.__lock.release()
+
+        if err:
+            return err
+
+        self.logger.log_info("stream of {0} on {1} sealed, {2} late ticks dropped".
+                             format(stock_code, buffer.day, buffer.dropped_ticks))
+        return Error.SUCCESS
+
+    def __save_sealed_day(self, stock_code, day, day_df):
+        err, updated_stocks = self.tick_dao.list_stocks_updated_on_day([stock_code], day)
+        if err:
+            return err
+        if stock_code in updated_stocks:
+            return Error.ERROR_TICK_DATA_ALREADY_UPDATED_ON_DAY
+
+        err, is_table_exists = self.tick_dao.is_stock_table_exists_in_factor_keeper_db(stock_code)
+        if err:
+            return err
+        if not is_table_exists:
+            err = self.table_maker.create_tick_data_table(stock_code)
+            if err:
+                return err
+
+        return self.tick_dao.save_day_tick_data(stock_code, day, day_df)
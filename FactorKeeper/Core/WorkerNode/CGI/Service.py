@@ -36,6 +36,59 @@ def define_worker_node_service(app, worker_node):
         else:
             return resp_maker.make_response(err, "{} days of factors updating...".format(update_item_num))
 
+    @app.route("/update_factor_xs", methods=['POST'])
+    @ServiceDebugger.debug()
+    def update_factor_xs():
+        """
+        start update factor result of linked stocks with cross-sectional factor generator
+        :return: return message
+        """
+        import json
+
+        header = request.form.get("HEADER")
+        if header != ProtoConf.COMMAND_HEADER:
+            return resp_maker.make_response(Error.ERROR_UNRECOGNIZED_HEADER, "unrecognized header '{}'".format(header))
+
+        factor = request.form.get("factor")
+        version = request.form.get("version")
+        task_id = request.form.get("task_id")
+        try:
+            stock_codes = json.loads(request.form.get("stock_codes"))
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, update_item_num = worker_node.update_factor_xs(factor, version, stock_codes, task_id)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, "{} days of factors updating...".format(update_item_num))
+
+    @app.route("/update_stock_factors", methods=['POST'])
+    @ServiceDebugger.debug()
+    def update_stock_factors():
+        """
+        start update all factors linked to a stock, each day of tick data is loaded once for all factors
+        :return: return message
+        """
+        import json
+
+        header = request.form.get("HEADER")
+        if header != ProtoConf.COMMAND_HEADER:
+            return resp_maker.make_response(Error.ERROR_UNRECOGNIZED_HEADER, "unrecognized header '{}'".format(header))
+
+        stock_code = request.form.get("stock_code")
+        task_id = request.form.get("task_id")
+        try:
+            linkages = [tuple(linkage) for linkage in json.loads(request.form.get("linkages"))]
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+
+        err, update_item_num = worker_node.update_stock_factors(stock_code, linkages, task_id)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, "{} days of factors updating...".format(update_item_num))
+
     @app.route("/update_tick_data", methods=['POST'])
     @ServiceDebugger.debug()
     def update_tick_data_result():
@@ -57,6 +110,32 @@ def define_worker_node_service(app, worker_node):
         else:
             return resp_maker.make_response(err, "{} days of tick data updating...".format(update_item_num))
 
+    @app.route("/update_tick_data_universe", methods=['POST'])
+    @ServiceDebugger.debug()
+    def update_tick_data_universe():
+        """
+        start update tick data of many stocks on a day
+        :return: return message
+        """
+        import json, datetime
+
+        header = request.form.get("HEADER")
+        if header != ProtoConf.COMMAND_HEADER:
+            return resp_maker.make_response(Error.ERROR_UNRECOGNIZED_HEADER, "unrecognized header '{}'".format(header))
+
+        try:
+            stock_codes = json.loads(request.form.get("stock_codes"))
+            day = datetime.datetime.strptime(request.form.get("date"), "%Y-%m-%d").date()
+        except:
+            return resp_maker.make_response(Error.ERROR_PARAMETER_MISSING_OR_INVALID)
+        task_id = request.form.get("task_id")
+
+        err, update_item_num = worker_node.update_tick_data_universe(stock_codes, day, task_id)
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, "{} stocks of tick data updating...".format(update_item_num))
+
     @app.route("/update_factor/status", methods=['POST'])
     @ServiceDebugger.debug()
     def get_factor_status():
@@ -107,6 +186,36 @@ def define_worker_node_service(app, worker_node):
                        status['finished_num'], status['aborted_num'])
             return resp_maker.make_response(err, status_string)
 
+    @app.route("/generator_stats", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_generator_stats():
+        """
+        import stats of factor generators in pool processes
+        :return: return message, json list of stats
+        """
+        import json
+
+        err, stats = worker_node.get_generator_stats()
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, json.dumps(stats))
+
+    @app.route("/tick_cache_stats", methods=['GET'])
+    @ServiceDebugger.debug()
+    def get_tick_cache_stats():
+        """
+        lookup counts and hit ratios of tick data caches in pool processes
+        :return: return message, json of stats
+        """
+        import json
+
+        err, stats = worker_node.get_tick_cache_stats()
+        if err:
+            return resp_maker.make_response(err)
+        else:
+            return resp_maker.make_response(err, json.dumps(stats))
+
     @app.route("/stop_all", methods=['POST'])
     @ServiceDebugger.debug()
     def stop_all_process():
@@ -8,6 +8,8 @@ from Core.WorkerNode.WorkerNodeImpl.Initializer import LogInitializer, Initializ
 from Core.WorkerNode.WorkerNodeImpl.FactorUpdateManager import FactorUpdateManager
 from Core.WorkerNode.WorkerNodeImpl.TickDataUpdateManager import TickDataUpdateManager
 from Core.WorkerNode.WorkerNodeImpl.WorkerTaskManager import WorkerTaskManager
+from Core.WorkerNode.WorkerNodeImpl.WorkerContext import WorkerContext
+from Core.WorkerNode.WorkerNodeImpl.SharedTickBlock import SharedTickBlockRegistry
 from Core.Error.Error import Error
 import time, threading, traceback
 
@@ -30,7 +32,12 @@ class Worker(object):
 
         # init dao
         self.dao = FactorDao(self.db_engine, self.logger)
-        self.task_manager = WorkerTaskManager(processes=WorkerConf.PROCESSOR_NUM)
+        self.shared_tick_blocks = SharedTickBlockRegistry() if WorkerConf.TICK_SHARED_MEMORY_ENABLED else None
+        self.task_manager = WorkerTaskManager(processes=WorkerConf.PROCESSOR_NUM,
+                                              initializer=WorkerContext.initialize,
+                                              initargs=(self.shared_tick_blocks,),
+                                              on_pool_terminated=self.shared_tick_blocks.clear
+                                              if self.shared_tick_blocks is not None else None)
         self.factor_update_manager = FactorUpdateManager(self.task_manager, self.db_engine, self.logger)
         self.tick_update_manager = TickDataUpdateManager(self.task_manager, self.db_engine, self.logger)
 
@@ -40,9 +47,24 @@ class Worker(object):
     def update_factor_result(self, factor, version, stock_code, task_id):
         return self.factor_update_manager.update_linkage(factor, version, stock_code, task_id)
 
+    def update_factor_xs(self, factor, version, stock_codes, task_id):
+        return self.factor_update_manager.update_cross_section(factor, version, stock_codes, task_id)
+
+    def update_stock_factors(self, stock_code, linkages, task_id):
+        return self.factor_update_manager.update_stock_factors(stock_code, linkages, task_id)
+
     def update_tick_data_result(self, stock_code, task_id):
         return self.tick_update_manager.update_stock_data(stock_code, task_id)
 
+    def update_tick_data_universe(self, stock_codes, day, task_id):
+        return self.tick_update_manager.update_universe_data(stock_codes, day, task_id)
+
+    def get_generator_stats(self):
+        return self.task_manager.get_generator_stats()
+
+    def get_tick_cache_stats(self):
+        return self.task_manager.get_tick_cache_stats()
+
     def query_update_status(self, task_id):
         return self.factor_update_manager.query_update_status(task_id)
 
@@ -1,20 +1,26 @@
 from Core.DAO.TickDataDao import TickDataDao
 from Core.DAO.FactorDao.FactorDao import FactorDao
 from Core.Conf.TickDataConf import TickDataConf
+from Core.Conf.WorkerConf import WorkerConf
 from Core.WorkerNode.WorkerNodeImpl.WorkerTaskManager import TaskGroup, TaskConst, Task
 from Core.Error.Error import Error
 from Core.Conf.PathConf import Path
-from Core.WorkerNode.WorkerNodeImpl.Message import FinishACKMessage, KillMessage, MessageLogger
+from Core.WorkerNode.WorkerNodeImpl.Message import FinishACKMessage, KillMessage
+from Core.WorkerNode.WorkerNodeImpl.WorkerContext import WorkerContext
+from Core.WorkerNode.WorkerNodeImpl.GeneratorRegistry import GeneratorRegistry
+from Core.WorkerNode.WorkerNodeImpl.TickPanel import TickPanel
+from Core.WorkerNode.WorkerNodeImpl.TickDataCache import TickDataCache
 from Core.WorkerNode.WorkerNodeImpl.FileSaver import FileSaver
 from Core.WorkerNode.WorkerNodeImpl.MessageSender import MessageSender
-import sys, os, traceback, datetime, threading
+import os, traceback, datetime, threading, json
 import pandas as pd
+import numpy as np
 
 
 class FactorUpdateManager(object):
     """
         FactorUpdateManager calculate to update dates and split a factor update task to unit tasks
-        which only update one day of factor data
+        which update a chunk of days of factor data
     """
 
     def __init__(self, task_manager, db_engine, logger):
@@ -31,18 +37,9 @@ class FactorUpdateManager(object):
         :return: err_code
         """
 
-        generator_path = "{0}/{1}/{2}".format(Path.FACTOR_GENERATOR_BASE, factor, version)
-
-        # download file if not exists
-        if not os.path.exists(generator_path):
-            # download script
-            err, code_file = self._factor_dao.get_factor_version_code(factor, version)
-            if err:
-                return err
-
-            err = FileSaver.save_code_to_fs(factor, version, bytes(code_file), self._logger)
-            if err:
-                return err, None
+        err = self.__download_generator(factor, version)
+        if err:
+            return err, None
 
         # fetch updated dates
         err, updated_days = self._factor_dao.list_updated_dates(factor, version, stock_code)
@@ -56,23 +53,256 @@ class FactorUpdateManager(object):
         to_update_days = sorted(list(set(tick_days) - set(updated_days)))
 
         # convert tick data to factors
-        var_list = [(factor, version, stock_code, day)
-                    for day in to_update_days]
+        update_item_num = len(to_update_days)
+        if update_item_num == 0:
+            return Error.ERROR_TASK_HAS_NOTHING_TO_BE_DONE, 0
+
+        err, functions = self.__list_generator_functions(factor, version)
+        if err:
+            return err, None
+        if self.__is_xs_only(functions):
+            self._logger.log_error("{0}/{1} only defines {2}, update it by cross section".format(
+                factor, version, GeneratorRegistry.XS_FUNCTION))
+            return Error.ERROR_FACTOR_GENERATOR_FUNCTION_NOT_DEFINED, None
+        stateful = GeneratorRegistry.STATEFUL_FUNCTION in functions
+        if stateful:
+            err, to_update_days = self.__list_stateful_update_days(factor, version, stock_code, tick_days,
+                                                                   updated_days)
+            if err:
+                return err, None
+            update_item_num = len(to_update_days)
 
-        update_item_num = len(var_list)
+        err, code_hash = self.__warm_up_generator(factor, version)
+        if err:
+            return err, None
+
+        # a unit task updates a chunk of days, chunks are kept small enough to keep all pool processes busy,
+        # days of stateful generators are updated in order by one unit task
+        chunk_size = max(1, min(WorkerConf.FACTOR_UPDATE_DAYS_PER_TASK,
+                                -(-update_item_num // WorkerConf.PROCESSOR_NUM)))
+        if stateful:
+            chunk_size = update_item_num
+        task_group = TaskGroup(TaskConst.TaskType.UPDATE_FACTOR_TASK, task_id)
+        for start in range(0, update_item_num, chunk_size):
+            days = to_update_days[start: start + chunk_size]
+            task = Task(TaskConst.TaskType.UPDATE_FACTOR_TASK,
+                        self.__make_task_sub_id(factor, version, stock_code, "{0}~{1}".format(days[0], days[-1])))
+            task.set_target(update_days_factor_in_async, args=(factor, version, stock_code, days, code_hash),
+                            kwargs={"stateful": stateful})
+            task_group.add_task(task)
+
+        self._task_manager.apply_task_group(task_group)
+
+        return Error.SUCCESS, update_item_num
+
+    def update_cross_section(self, factor, version, stock_codes, task_id):
+        """
+        update factor data of linked stocks with "factor_generator_xs", a unit task computes all stocks of a day
+        :param factor:
+        :param version:
+        :param stock_codes: linked stocks of factor version
+        :param task_id:
+        :return: err_code, number of days to update
+        """
+        err = self.__download_generator(factor, version)
+        if err:
+            return err, None
+
+        # stocks with tick data on a day make up the panel, results are only sent for stocks not updated
+        panel_stocks = {}
+        to_update_stocks = {}
+        for stock_code in stock_codes:
+            err, updated_days = self._factor_dao.list_updated_dates(factor, version, stock_code)
+            if err:
+                return err, None
+
+            err, tick_days = self._tick_dao.list_updated_dates(stock_code)
+            if err:
+                return err, None
+
+            for day in tick_days:
+                panel_stocks.setdefault(day, []).append(stock_code)
+            for day in set(tick_days) - set(updated_days):
+                to_update_stocks.setdefault(day, []).append(stock_code)
+
+        to_update_days = sorted(to_update_stocks.keys())
+        update_item_num = len(to_update_days)
         if update_item_num == 0:
             return Error.ERROR_TASK_HAS_NOTHING_TO_BE_DONE, 0
 
+        err, code_hash = self.__warm_up_generator(factor, version)
+        if err:
+            return err, None
+
+        task_group = TaskGroup(TaskConst.TaskType.UPDATE_FACTOR_TASK, task_id)
+        for day in to_update_days:
+            task = Task(TaskConst.TaskType.UPDATE_FACTOR_TASK, self.__make_task_sub_id(factor, version, "XS", day))
+            task.set_target(update_day_factor_xs_in_async,
+                            args=(factor, version, day, panel_stocks[day], to_update_stocks[day], code_hash))
+            task_group.add_task(task)
+
+        self._task_manager.apply_task_group(task_group)
+
+        return Error.SUCCESS, update_item_num
+
+    def update_stock_factors(self, stock_code, linkages, task_id):
+        """
+        update all factors linked to a stock in fused mode, a unit task loads each day of tick data once and
+        runs every generator which has not updated the day. Stateful generators are updated apart, days of
+        each of them are updated in order by one unit task
+        :param stock_code:
+        :param linkages: list of (factor, version) linked to the stock
+        :param task_id:
+        :return: err_code, number of (factor, day) items to update
+        """
+        err, tick_days = self._tick_dao.list_updated_dates(stock_code)
+        if err:
+            return err, None
+
+        # day -> list of (factor, version, code hash)
+        day_items = {}
+        stateful_items = []
+        update_item_num = 0
+        xs_only_num = 0
+        for factor, version in linkages:
+            err = self.__download_generator(factor, version)
+            if err:
+                return err, None
+
+            err, updated_days = self._factor_dao.list_updated_dates(factor, version, stock_code)
+            if err:
+                return err, None
+
+            to_update_days = set(tick_days) - set(updated_days)
+            if len(to_update_days) == 0:
+                continue
+
+            err, functions = self.__list_generator_functions(factor, version)
+            if err:
+                return err, None
+            if self.__is_xs_only(functions):
+                self._logger.log_warn("{0}/{1} only defines {2}, skipped by fused update of {3}".format(
+                    factor, version, GeneratorRegistry.XS_FUNCTION, stock_code))
+                xs_only_num += 1
+                continue
+            stateful = GeneratorRegistry.STATEFUL_FUNCTION in functions
+            if stateful:
+                err, stateful_days = self.__list_stateful_update_days(factor, version, stock_code, tick_days,
+                                                                      updated_days)
+                if err:
+                    return err, None
+                to_update_days = set(stateful_days)
+
+            err, code_hash = self.__warm_up_generator(factor, version)
+            if err:
+                return err, None
+
+            if stateful:
+                stateful_items.append((factor, version, sorted(to_update_days), code_hash))
+            else:
+                for day in to_update_days:
+                    day_items.setdefault(day, []).append((factor, version, code_hash))
+            update_item_num += len(to_update_days)
+
+        if update_item_num == 0:
+            if xs_only_num > 0:
+                return Error.ERROR_FACTOR_GENERATOR_FUNCTION_NOT_DEFINED, None
+            return Error.ERROR_TASK_HAS_NOTHING_TO_BE_DONE, 0
+
         task_group = TaskGroup(TaskConst.TaskType.UPDATE_FACTOR_TASK, task_id)
-        for var in var_list:
-            task = Task(TaskConst.TaskType.UPDATE_FACTOR_TASK, self.__make_task_sub_id(*var))
-            task.set_target(update_day_factor_in_async, args=var)
+        for factor, version, days, code_hash in stateful_items:
+            task = Task(TaskConst.TaskType.UPDATE_FACTOR_TASK,
+                        self.__make_task_sub_id(factor, version, stock_code, "{0}~{1}".format(days[0], days[-1])))
+            task.set_target(update_days_factor_in_async, args=(factor, version, stock_code, days, code_hash),
+                            kwargs={"stateful": True})
+            task_group.add_task(task)
+
+        to_update_days = sorted(day_items.keys())
+        chunk_size = max(1, min(WorkerConf.FACTOR_UPDATE_DAYS_PER_TASK,
+                                -(-len(to_update_days) // WorkerConf.PROCESSOR_NUM)))
+        for start in range(0, len(to_update_days), chunk_size):
+            days = to_update_days[start: start + chunk_size]
+            task = Task(TaskConst.TaskType.UPDATE_FACTOR_TASK,
+                        self.__make_task_sub_id(stock_code, "FUSED", "{0}~{1}".format(days[0], days[-1])))
+            task.set_target(update_stock_factors_in_async,
+                            args=(stock_code, [(day, day_items[day]) for day in days]))
             task_group.add_task(task)
 
         self._task_manager.apply_task_group(task_group)
 
         return Error.SUCCESS, update_item_num
 
+    def __download_generator(self, factor, version):
+        """
+        download generator code if not exists
+        :return: err_code
+        """
+        generator_path = "{0}/{1}/{2}".format(Path.FACTOR_GENERATOR_BASE, factor, version)
+        if os.path.exists(generator_path):
+            return Error.SUCCESS
+
+        err, code_file = self._factor_dao.get_factor_version_code(factor, version)
+        if err:
+            return err
+
+        return FileSaver.save_code_to_fs(factor, version, bytes(code_file), self._logger)
+
+    def __warm_up_generator(self, factor, version):
+        """
+        code hash is computed once per task group, generators are imported by pool processes before unit tasks
+        :return: err_code, code hash
+        """
+        try:
+            code_hash = GeneratorRegistry.compute_code_hash(factor, version)
+        except:
+            self._logger.log_error(traceback.format_exc())
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE, None
+
+        self._task_manager.apply_warm_up(warm_up_factor_generator_in_async, args=(factor, version, code_hash))
+        return Error.SUCCESS, code_hash
+
+    def __list_stateful_update_days(self, factor, version, stock_code, tick_days, updated_days):
+        """
+        States of days after a day inserted into the chain of a stateful generator(a day backfilled into tick data
+        or failed before) were computed without it, so every day after the first inserted day is updated again.
+        Days skipped for too few ticks have a state saved without being updated, they are not inserted days.
+        :return: err_code, sorted list of days to update
+        """
+        err, state_days = self._factor_dao.list_factor_state_dates(factor, version, stock_code)
+        if err:
+            return err, None
+
+        to_update_days = set(tick_days) - set(updated_days)
+        chained_days = set(updated_days) | set(state_days)
+        if len(chained_days) > 0:
+            last_chained_day = max(chained_days)
+            inserted_days = [day for day in to_update_days if day not in chained_days and day < last_chained_day]
+            if len(inserted_days) > 0:
+                first_inserted_day = min(inserted_days)
+                updated_again_days = [day for day in updated_days if day > first_inserted_day]
+                self._logger.log_info("{0} is inserted into states of {1}/{2}/{3}, {4} days after it are updated "
+                                      "again".format(first_inserted_day, factor, version, stock_code,
+                                                     len(updated_again_days)))
+                to_update_days.update(updated_again_days)
+
+        return Error.SUCCESS, sorted(to_update_days)
+
+    def __list_generator_functions(self, factor, version):
+        """
+        :return: err_code, set of generator functions defined by generator(see GeneratorRegistry.FUNCTIONS)
+        """
+        try:
+            return Error.SUCCESS, GeneratorRegistry.list_defined_functions(factor, version)
+        except:
+            self._logger.log_error(traceback.format_exc())
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE, None
+
+    @staticmethod
+    def __is_xs_only(functions):
+        # per stock unit tasks would fail on every day of generators defining only "factor_generator_xs"
+        return GeneratorRegistry.XS_FUNCTION in functions and \
+            functions.isdisjoint(GeneratorRegistry.PER_STOCK_FUNCTIONS)
+
     @staticmethod
     def __make_task_sub_id(*args):
         return "_".join([str(arg) for arg in args])
@@ -87,138 +317,658 @@ class FactorUpdateManager(object):
         return self._task_manager.stop_task_groups(task_type=TaskConst.TaskType.UPDATE_FACTOR_TASK)
 
 
-def update_day_factor_in_async(factor, version, stock_code, day, *args, **kwargs):
+def warm_up_factor_generator_in_async(factor, version, code_hash, barrier=None, **kwargs):
     """
-    update factor of a single day
+    在进程池的各个进程中预先导入因子生成器，每个进程执行一次(由barrier保证)
+    :param factor:
+    :param version:
+    :param code_hash: 因子生成器代码的hash
+    :param barrier: 进程池所有进程共享的barrier，为None时不等待其他进程
+    :param kwargs:
+    :return:
+    """
+    task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
+
+    context = WorkerContext.get()
+    context.bind_task("WARM_UP_{0}_{1}".format(factor, version), "WARM_UP", "WORK_RUNNER", task_queue)
+    context.get_factor_generator(factor, version, code_hash)
+
+    if barrier is not None:
+        try:
+            barrier.wait()
+        except Exception:
+            # barrier is broken if some processes are busy, they warm up when they are free
+            pass
+
+
+def update_days_factor_in_async(factor, version, stock_code, days, code_hash=None, stateful=False, *args, **kwargs):
+    """
+    update factor of a chunk of days, tick data of days are passed at once to "factor_generator_batch"
+    if the generator defines it, otherwise "factor_generator" is called day by day. Generators declaring a
+    lookback get previous tick days from the sliding window of the process. "factor_generator_stateful" is
+    called day by day in order starting from the state saved before the first day, states are sent with results,
+    days with too few ticks are sent with the state of the day before only
     :param factor:
     :param version:
     :param stock_code:
-    :param day:
+    :param days: list of days to update
+    :param code_hash: code hash of factor generator computed when task group is applied
+    :param stateful: True if all days to update of the linkage are given in order, stateful generators are only
+                     updated by such tasks
     :param args:
     :param kwargs:
     :return:
     """
-    
-    from Core.Conf.DatabaseConf import DBConfig
 
     # get task info
     task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
     task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
     task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
     log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
-    
-    # get global variable
-    db_engine = DBConfig.default_config().create_default_sa_engine_without_pool()
 
-    # add sys path if not exists
-    if Path.FACTOR_GENERATOR_BASE not in sys.path:
-        sys.path.append(Path.FACTOR_GENERATOR_BASE)
+    # get process context
+    context = WorkerContext.get()
+    tick_cache = context.tick_cache
+    tick_window = context.tick_window
+    factor_dao = context.factor_dao
 
     # set task status
     _task_aborted = False
 
     # set logger
-    logger = MessageLogger(task_id, task_group_id, log_stack, task_queue)
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
 
     # log start info
     logger.log_info("factor update task starting...")
 
     try:
-        # create database connection
-        tick_dao = TickDataDao(db_engine, logger)
-        factor_dao = FactorDao(db_engine, logger)
-
-        # fetch data of a day
-        daytime = datetime.datetime(year=day.year, month=day.month, day=day.day)
-        err, day_df = tick_dao.load_updated_tick_data(stock_code, daytime)
+        err, link_id = factor_dao.get_linkage_id(factor, version, stock_code)
+        if err:
+            _task_aborted = True
+            return err
 
+        # load factor generator, generators are imported once per process
+        err, generator_module = context.get_factor_generator(factor, version, code_hash)
         if err:
-            logger.log_error("({}) failed to fetch tick data".format(err))
             _task_aborted = True
             return err
 
-        if day_df.shape[0] < 1000:
-            logger.log_info("too few tick data({} ticks)".format(day_df.shape[0]))
-            return Error.SUCCESS
+        if not GeneratorRegistry.has_per_stock_function(generator_module):
+            logger.log_error("None of {} is defined by generator module".format(
+                ", ".join(GeneratorRegistry.PER_STOCK_FUNCTIONS)))
+            _task_aborted = True
+            return Error.ERROR_FACTOR_GENERATOR_FUNCTION_NOT_DEFINED
 
-        err, link_id = factor_dao.get_linkage_id(factor, version, stock_code)
+        err, signature = get_factor_signature(factor_dao, factor, version)
         if err:
             _task_aborted = True
             return err
 
-        # add factor generator script path to python sys path
-        generator_path = "{0}/{1}/{2}".format(Path.FACTOR_GENERATOR_BASE, factor, version)
+        # states of stateful generators are carried from day to day, days after a failed day are not updated
+        stateful_function = GeneratorRegistry.get_stateful_function(generator_module)
+        if stateful_function is not None and not stateful:
+            logger.log_error("{} is defined by generator module, but days are not updated in order".format(
+                GeneratorRegistry.STATEFUL_FUNCTION))
+            _task_aborted = True
+            return Error.ERROR_FACTOR_GENERATE_FAILED
+
+        # fetch tick data of days, only columns declared by generator are loaded
+        columns = GeneratorRegistry.get_required_columns(generator_module)
+        day_dfs = []
+        for day in days:
+            daytime = datetime.datetime(year=day.year, month=day.month, day=day.day)
+            err, day_df = tick_cache.load_updated_tick_data(stock_code, daytime, columns=columns)
+            if err:
+                logger.log_error("({0}) failed to fetch tick data of {1}".format(err, day))
+                _task_aborted = True
+                if stateful_function is not None:
+                    break
+                continue
+
+            if day_df.shape[0] < 1000:
+                logger.log_info("too few tick data({0} ticks) on {1}".format(day_df.shape[0], day))
+                if stateful_function is not None:
+                    # the state of the day before is carried over the day
+                    day_dfs.append((day, None))
+                continue
+
+            day_dfs.append((day, day_df))
+
+        # execute factor generator, previous tick days are passed if lookback is declared
+        lookback = GeneratorRegistry.get_lookback(generator_module)
+        batch_function = GeneratorRegistry.get_batch_function(generator_module)
+
+        def get_lookback(day, day_df):
+            # days are updated in order, the window slides by one day
+            err, window = tick_window.get_window(stock_code, day, lookback, columns)
+            if not err:
+                tick_window.put(stock_code, day, day_df, columns)
+            return err, window
+
+        day_states = {}
+        failed_days = set()
+        if stateful_function is not None:
+            err, tick_days = tick_cache.tick_dao.list_updated_dates(stock_code)
+            if err:
+                logger.log_error("({0}) failed to list tick days of {1}".format(err, stock_code))
+                _task_aborted = True
+                return err
+
+            def load_state(day):
+                return load_factor_state(factor_dao, factor, version, stock_code, day)
+
+            day_results = generate_factor_stateful(stateful_function, stock_code, day_dfs, load_state, logger,
+                                                   get_lookback=get_lookback if lookback > 0 else None,
+                                                   tick_days=tick_days)
+            if len(day_results) < len(day_dfs):
+                _task_aborted = True
+            day_dfs = day_dfs[:len(day_results)]
+            day_values = [factor_value for factor_value, _ in day_results]
+            day_states = {day: day_state for (day, _), (_, day_state) in zip(day_dfs, day_results)}
+        elif batch_function is not None and len(day_dfs) > 0:
+            window = None
+            if lookback > 0:
+                err, window = tick_window.get_window(stock_code, day_dfs[0][0], lookback, columns)
+                if err:
+                    logger.log_error("({0}) failed to fetch lookback of {1}".format(err, day_dfs[0][0]))
+                    _task_aborted = True
+                    return err
+
+            try:
+                day_values = generate_factor_batch(batch_function, stock_code, day_dfs, lookback=window)
+            except:
+                logger.log_error(traceback.format_exc())
+                _task_aborted = True
+                return Error.ERROR_FACTOR_GENERATE_FAILED
+        else:
+            day_values = []
+            for day, day_df in day_dfs:
+                try:
+                    generator_kwargs = {}
+                    if lookback > 0:
+                        err, generator_kwargs["lookback"] = get_lookback(day, day_df)
+                        if err:
+                            raise RuntimeError("({0}) failed to fetch lookback of {1}".format(err, day))
+
+                    day_values.append(generator_module.factor_generator(day_df, stock_code, day, **generator_kwargs))
+                except:
+                    logger.log_error(traceback.format_exc())
+                    _task_aborted = True
+                    failed_days.add(day)
+                    day_values.append(None)
 
-        # run python script
-        generator_module_name = [f for f in os.listdir(generator_path) if f != "__init__.py"][0]
-        generator_module_path = "{0}/{1}".format(generator_path, generator_module_name)
-        if not os.path.isdir(generator_module_path):
-            if generator_module_name.endswith(".py"):
-                generator_module_name = generator_module_name[:-3]
+        # send results day by day, so that storage and update logs of master are kept per day
+        # None returned by generators is sent to "make_day_factor_result" and rejected as an invalid result
+        for (day, day_df), factor_value in zip(day_dfs, day_values):
+            if day in failed_days:
+                continue
+
+            if day_df is not None:
+                err, factor_value = make_day_factor_result(factor, signature, factor_value, day_df, logger)
             else:
-                logger.log_error("Unrecognized file type: {}".format(generator_module_name))
+                # day skipped by stateful generator, only the state carried over it is saved
+                err = Error.SUCCESS
+            if not err:
+                err, msg = MessageSender.send_factor_result_to_master(factor, version, stock_code, day, factor_value,
+                                                                      task_group_id, logger,
+                                                                      state=day_states.get(day))
+                if err:
+                    logger.log_error("Error occurred during tick update callback: {0} {1}".format(err, msg))
+                    if err == Error.ERROR_TASK_NOT_EXISTS:
+                        task_queue.put(KillMessage(task_id))
+                        return
+
+            if err:
                 _task_aborted = True
-                return Error.ERROR_UNRECOGNIZED_FILE_TYPE
+                if stateful_function is not None:
+                    # states of later days would follow a day not saved by master
+                    break
+
+        return Error.SUCCESS
+
+    except:
+        _task_aborted = True
+        logger.log_error(traceback.format_exc())
+        return Error.ERROR_FACTOR_GENERATE_FAILED
+
+    finally:
+        tick_cache.release()
+        tick_window.release()
+        logger.log_info("task finished")
+        task_queue.put(FinishACKMessage(task_id, aborted=_task_aborted))
+
 
+def generate_factor_stateful(stateful_function, stock_code, day_dfs, load_state, logger, get_lookback=None,
+                             tick_days=None):
+    """
+    Call "factor_generator_stateful" day by day in order, each day starts from the state left by the day before.
+    States are passed on through their json form, so a day gets the same state whether the day before is updated
+    by the same unit task or not.
+    State is loaded before the first day, and again before days following tick days which are not given, those
+    days were updated by earlier tasks and their states were saved by master.
+    :param stateful_function: factor_generator_stateful(df, code, date, state)
+    :param stock_code:
+    :param day_dfs: list of (day, tick data dataframe of day) in order, dataframe is None if day is skipped, the
+                    state of the day before is carried over skipped days
+    :param load_state: function(day) returning err_code, state saved for the latest day before day
+    :param logger:
+    :param get_lookback: function(day, day_df) returning err_code, lookback of the day, lookbacks are not passed
+                         if None
+    :param tick_days: sorted list of tick days of stock, state is only loaded before the first day if None
+    :return: list of (factor value, json string of state left by the day) of days in order, factor value is None
+             for skipped days, days from the first failed day are not returned
+    """
+    previous_tick_days = dict(zip(tick_days[1:], tick_days[:-1])) if tick_days is not None else {}
+
+    day_results = []
+    state = None
+    previous_day = None
+    for day, day_df in day_dfs:
         try:
-            import importlib
-            generator_module = importlib.import_module("{0}.{1}.{2}".format(factor, version,
-                                                                            generator_module_name))
+            if previous_day is None or previous_tick_days.get(day, previous_day) != previous_day:
+                err, state = load_state(day)
+                if err:
+                    raise RuntimeError("({0}) failed to load factor state before {1}".format(err, day))
+
+            factor_value = None
+            if day_df is not None:
+                generator_kwargs = {}
+                if get_lookback is not None:
+                    err, generator_kwargs["lookback"] = get_lookback(day, day_df)
+                    if err:
+                        raise RuntimeError("({0}) failed to fetch lookback of {1}".format(err, day))
+
+                factor_value, state = stateful_function(day_df, stock_code, day, state, **generator_kwargs)
+            day_state = dump_factor_state(state)
+            state = json.loads(day_state)
         except:
             logger.log_error(traceback.format_exc())
-            _task_aborted = True
-            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE
+            break
 
-        factor_generator = generator_module.factor_generator
+        day_results.append((factor_value, day_state))
+        previous_day = day
 
-        # execute factor generator
-        try:
-            factor_value = factor_generator(day_df, stock_code, day)
+    return day_results
 
-            if isinstance(factor_value, pd.DataFrame):
-                signature = [factor]
-                if factor_dao.is_group_factor(factor):
-                    err, signature = factor_dao.get_sub_factors(factor, version)
-                    if err:
-                        _task_aborted = True
-                        return err
 
-                if not set(factor_value.columns).issuperset(set(signature)):
-                    _task_aborted = True
-                    return Error.ERROR_GROUP_FACTOR_SIGNATURE_NOT_MATCHED
+def generate_factor_batch(batch_function, stock_code, day_dfs, lookback=None):
+    """
+    Call "factor_generator_batch" with tick data of days concatenated in order and split its result by day.
+    Results are accepted as:
+        -a dataframe or a 1-D sequence with as many rows as the concatenated tick data
+        -a 2-D array(or list of per day results) with one row per day
+    :param batch_function: factor_generator_batch(days_df, code, dates)
+    :param stock_code:
+    :param day_dfs: list of (day, tick data dataframe of day)
+    :param lookback: list of (day, tick data dataframe) of tick days before the first day, passed as keyword
+                     "lookback" if not None, lookbacks of later days are made of it and days_df
+    :return: list of factor values of days, in the format returned by "factor_generator"
+    """
+    dates = [day for day, _ in day_dfs]
+    days_df = pd.concat([day_df for _, day_df in day_dfs], ignore_index=True)
+    bounds = np.cumsum([0] + [day_df.shape[0] for _, day_df in day_dfs])
+
+    if lookback is not None:
+        batch_value = batch_function(days_df, stock_code, dates, lookback=lookback)
+    else:
+        batch_value = batch_function(days_df, stock_code, dates)
+
+    if isinstance(batch_value, pd.DataFrame):
+        if batch_value.shape[0] != bounds[-1]:
+            raise ValueError("factor_generator_batch returned {0} rows, {1} expected".format(
+                batch_value.shape[0], bounds[-1]))
+        batch_value = batch_value.reset_index(drop=True)
+        return [batch_value.iloc[bounds[i]: bounds[i + 1]].reset_index(drop=True) for i in range(len(dates))]
+
+    if isinstance(batch_value, (list, tuple)) and len(batch_value) == len(dates) != bounds[-1]:
+        return [value if isinstance(value, pd.DataFrame) else list(value) for value in batch_value]
+
+    batch_value = np.asarray(batch_value)
+    if batch_value.ndim == 2 and batch_value.shape[0] == len(dates):
+        return [row.tolist() for row in batch_value]
+
+    if batch_value.ndim == 1 and batch_value.shape[0] == bounds[-1]:
+        return [batch_value[bounds[i]: bounds[i + 1]].tolist() for i in range(len(dates))]
+
+    raise ValueError("factor_generator_batch returned unrecognized shape {0} for {1} days".format(
+        batch_value.shape, len(dates)))
+
+
+def make_day_factor_result(factor, signature, factor_value, day_df, logger):
+    """
+    Check factor value of a day and convert it to the dataframe sent to master
+    :param factor:
+    :param signature: factor names of result, sub factors of group factors
+    :param factor_value: dataframe or list returned by factor generator
+    :param day_df: tick data of the day
+    :param logger:
+    :return: err_code, dataframe with factor columns, "date" and "datetime"
+    """
+    if isinstance(factor_value, pd.DataFrame):
+        if not set(factor_value.columns).issuperset(set(signature)):
+            return Error.ERROR_GROUP_FACTOR_SIGNATURE_NOT_MATCHED, None
+
+        factor_value = factor_value[signature]
+        factor_value['date'] = day_df['date'].tolist()
+        factor_value['datetime'] = day_df['datetime'].tolist()
+        return Error.SUCCESS, factor_value
+
+    if not isinstance(factor_value, list) or len(factor_value) != TickDataConf.TICK_LENGTH:
+        logger.log_error("invalid factor result format:\n" + str(factor_value))
+        return Error.ERROR_INVALID_FACTOR_RESULT, None
+
+    return Error.SUCCESS, pd.DataFrame({"datetime": day_df['datetime'], factor: factor_value,
+                                        "date": day_df['date']})
+
+
+def update_stock_factors_in_async(stock_code, day_items, *args, **kwargs):
+    """
+    update all pending factors of a stock on a chunk of days, tick data of a day is loaded once and passed to
+    every generator, results of a day are sent back with one request
+    :param stock_code:
+    :param day_items: list of (day, list of (factor, version, code hash) to update on day)
+    :param args:
+    :param kwargs:
+    :return:
+    """
+
+    # get task info
+    task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
+    task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
+    task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
+    log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
 
-                factor_value = factor_value[signature]
-                factor_value['date'] = day_df['date'].tolist()
-                factor_value['datetime'] = day_df['datetime'].tolist()
+    # get process context
+    context = WorkerContext.get()
+    tick_cache = context.tick_cache
+    tick_window = context.tick_window
+    factor_dao = context.factor_dao
+
+    # set task status
+    _task_aborted = False
+
+    # set logger
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
 
-            elif not isinstance(factor_value, list) or len(factor_value) != TickDataConf.TICK_LENGTH:
+    # log start info
+    logger.log_info("fused factor update task starting...")
+
+    try:
+        # generators and signatures are fetched once per factor version
+        generators = {}
+        signatures = {}
+        required_columns = {}
+        lookbacks = {}
+        for _, items in day_items:
+            for factor, version, code_hash in items:
+                if (factor, version) in generators:
+                    continue
+
+                err, generator_module = context.get_factor_generator(factor, version, code_hash)
+                if not err and not GeneratorRegistry.has_per_stock_function(generator_module):
+                    err = Error.ERROR_FACTOR_GENERATOR_FUNCTION_NOT_DEFINED
+                if not err and GeneratorRegistry.get_stateful_function(generator_module) is not None:
+                    # days of fused tasks are not updated in order
+                    err = Error.ERROR_FACTOR_GENERATE_FAILED
+                if not err:
+                    err, signatures[(factor, version)] = get_factor_signature(factor_dao, factor, version)
+                if err:
+                    logger.log_error("({0}) failed to load factor generator {1}/{2}".format(err, factor, version))
+                    _task_aborted = True
+                    generator_module = None
+
+                generators[(factor, version)] = generator_module
+                required_columns[(factor, version)] = GeneratorRegistry.get_required_columns(generator_module) \
+                    if generator_module is not None else []
+                lookbacks[(factor, version)] = GeneratorRegistry.get_lookback(generator_module) \
+                    if generator_module is not None else 0
+
+        for day, items in day_items:
+            items = [item for item in items if generators[(item[0], item[1])] is not None]
+            if len(items) == 0:
+                continue
+
+            # a day is loaded once with columns required by all generators of the day
+            columns = GeneratorRegistry.merge_required_columns(
+                [required_columns[(factor, version)] for factor, version, _ in items])
+            daytime = datetime.datetime(year=day.year, month=day.month, day=day.day)
+            err, day_df = tick_cache.load_updated_tick_data(stock_code, daytime, columns=columns)
+            if err:
+                logger.log_error("({0}) failed to fetch tick data of {1}".format(err, day))
                 _task_aborted = True
-                logger.log_error("invalid factor result format:\n" + str(factor_value))
-                return Error.ERROR_INVALID_FACTOR_RESULT
+                continue
+
+            if day_df.shape[0] < 1000:
+                logger.log_info("too few tick data({0} ticks) on {1}".format(day_df.shape[0], day))
+                continue
+
+            # the window of the longest lookback of the day is shared by generators
+            window = []
+            max_lookback = max(lookbacks[(factor, version)] for factor, version, _ in items)
+            if max_lookback > 0:
+                err, window = tick_window.get_window(stock_code, day, max_lookback, columns)
+                if err:
+                    logger.log_error("({0}) failed to fetch lookback of {1}".format(err, day))
+                    _task_aborted = True
+                    continue
+                tick_window.put(stock_code, day, day_df, columns)
+
+            results = []
+            for factor, version, _ in items:
+                generator_module = generators[(factor, version)]
+
+                # generators get their own frame, so changes made by one generator are not seen by others
+                generator_columns = required_columns[(factor, version)]
+                generator_df = TickDataCache.writable_copy(day_df, columns=generator_columns)
+                generator_kwargs = {}
+                lookback = lookbacks[(factor, version)]
+                if lookback > 0:
+                    generator_kwargs["lookback"] = [
+                        (window_day, TickDataCache.writable_copy(window_df, columns=generator_columns))
+                        for window_day, window_df in window[-lookback:]]
+                try:
+                    if callable(getattr(generator_module, GeneratorRegistry.SINGLE_DAY_FUNCTION, None)):
+                        factor_value = generator_module.factor_generator(generator_df, stock_code, day,
+                                                                         **generator_kwargs)
+                    else:
+                        batch_function = GeneratorRegistry.get_batch_function(generator_module)
+                        factor_value = generate_factor_batch(batch_function, stock_code, [(day, generator_df)],
+                                                             lookback=generator_kwargs.get("lookback", None))[0]
+                except:
+                    logger.log_error("{0}/{1}:\n{2}".format(factor, version, traceback.format_exc()))
+                    _task_aborted = True
+                    continue
 
-            else:
-                factor_value = pd.DataFrame({"datetime": day_df['datetime'], factor: factor_value, "date": day_df['date']})
+                err, factor_value = make_day_factor_result(factor, signatures[(factor, version)], factor_value,
+                                                           day_df, logger)
+                if err:
+                    _task_aborted = True
+                    continue
 
-            err, msg = MessageSender.send_factor_result_to_master(factor, version, stock_code, day, factor_value,
-                                                                  task_group_id, logger)
+                results.append((factor, version, stock_code, day, factor_value))
+
+            if len(results) == 0:
+                continue
+
+            err, msg = MessageSender.send_factor_result_batch_to_master(results, task_group_id, logger)
             if err:
-                logger.log_error("Error occurred during tick update callback: {0} {1}".format(err, msg))
+                logger.log_error("Error occurred during factor update callback: {0} {1}".format(err, msg))
                 if err == Error.ERROR_TASK_NOT_EXISTS:
                     task_queue.put(KillMessage(task_id))
                     return
 
                 _task_aborted = True
+
+        return Error.SUCCESS
+
+    except:
+        _task_aborted = True
+        logger.log_error(traceback.format_exc())
+        return Error.ERROR_FACTOR_GENERATE_FAILED
+
+    finally:
+        tick_cache.release()
+        tick_window.release()
+        logger.log_info("task finished")
+        task_queue.put(FinishACKMessage(task_id, aborted=_task_aborted))
+
+
+def load_factor_state(factor_dao, factor, version, stock_code, day):
+    """
+    :return: err_code, state saved by stateful generator for the latest day updated before day, None if no state
+    """
+    err, _, state = factor_dao.get_factor_state(factor, version, stock_code, day)
+    if err:
+        return err, None
+
+    return Error.SUCCESS, json.loads(state) if state is not None else None
+
+
+def dump_factor_state(state):
+    """
+    :return: json string of state returned by stateful generator, numpy values are converted to python values
+    """
+    def to_json(value):
+        if isinstance(value, (np.generic, np.ndarray)):
+            return value.tolist()
+        raise TypeError("factor state is not json serializable: {}".format(value.__class__))
+
+    return json.dumps(state, default=to_json)
+
+
+def get_factor_signature(factor_dao, factor, version):
+    """
+    :return: err_code, factor names of results, sub factors of group factors
+    """
+    err, is_group_factor = factor_dao.is_group_factor(factor)
+    if err:
+        return err, None
+
+    if is_group_factor:
+        return factor_dao.get_sub_factors(factor, version)
+
+    return Error.SUCCESS, [factor]
+
+
+def update_day_factor_xs_in_async(factor, version, day, panel_stocks, to_update_stocks, code_hash=None,
+                                  *args, **kwargs):
+    """
+    update factor of stocks on a day with "factor_generator_xs", tick data of all stocks are passed at once
+    as a TickPanel and results are sent back stock by stock
+    :param factor:
+    :param version:
+    :param day:
+    :param panel_stocks: stocks with tick data on day
+    :param to_update_stocks: stocks whose factor data of day are not updated
+    :param code_hash: code hash of factor generator computed when task group is applied
+    :param args:
+    :param kwargs:
+    :return:
+    """
+
+    # get task info
+    task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
+    task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
+    task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
+    log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
+
+    # get process context
+    context = WorkerContext.get()
+    tick_cache = context.tick_cache
+    factor_dao = context.factor_dao
+
+    # set task status
+    _task_aborted = False
+
+    # set logger
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
+
+    # log start info
+    logger.log_info("cross-sectional factor update task starting...")
+
+    try:
+        # load factor generator, generators are imported once per process
+        err, generator_module = context.get_factor_generator(factor, version, code_hash)
+        if err:
+            _task_aborted = True
+            return err
+
+        xs_function = GeneratorRegistry.get_xs_function(generator_module)
+        if xs_function is None:
+            logger.log_error("{} is not defined by generator module".format(GeneratorRegistry.XS_FUNCTION))
+            _task_aborted = True
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE
+
+        err, signature = get_factor_signature(factor_dao, factor, version)
+        if err:
+            _task_aborted = True
+            return err
+
+        # fetch tick data of stocks, only columns declared by generator are loaded
+        columns = GeneratorRegistry.get_required_columns(generator_module)
+        daytime = datetime.datetime(year=day.year, month=day.month, day=day.day)
+        stock_codes = []
+        day_dfs = []
+        for stock_code in panel_stocks:
+            err, day_df = tick_cache.load_updated_tick_data(stock_code, daytime, columns=columns)
+            if err:
+                logger.log_error("({0}) failed to fetch tick data of {1}".format(err, stock_code))
+                _task_aborted = True
                 return err
+
+            if day_df.shape[0] != TickDataConf.TICK_LENGTH:
+                logger.log_info("{0} is excluded from panel({1} ticks)".format(stock_code, day_df.shape[0]))
+                continue
+
+            stock_codes.append(stock_code)
+            day_dfs.append(day_df)
+
+        if len(stock_codes) == 0:
+            logger.log_info("no tick data on {}".format(day))
+            return Error.SUCCESS
+
+        # execute factor generator
+        panel = TickPanel(day, stock_codes, day_dfs)
+        try:
+            stock_values = panel.split_result(xs_function(panel, day), signature)
         except:
             logger.log_error(traceback.format_exc())
             _task_aborted = True
             return Error.ERROR_FACTOR_GENERATE_FAILED
 
+        # fan out results to linkages of stocks
+        for stock_code, day_df in zip(stock_codes, day_dfs):
+            if stock_code not in to_update_stocks:
+                continue
+
+            if stock_code not in stock_values:
+                logger.log_error("no factor result of {}".format(stock_code))
+                _task_aborted = True
+                continue
+
+            err, factor_value = make_day_factor_result(factor, signature, stock_values[stock_code], day_df, logger)
+            if err:
+                _task_aborted = True
+                continue
+
+            err, msg = MessageSender.send_factor_result_to_master(factor, version, stock_code, day, factor_value,
+                                                                  task_group_id, logger)
+            if err:
+                logger.log_error("Error occurred during tick update callback: {0} {1}".format(err, msg))
+                if err == Error.ERROR_TASK_NOT_EXISTS:
+                    task_queue.put(KillMessage(task_id))
+                    return
+
+                _task_aborted = True
+
+        return Error.SUCCESS
+
     except:
         _task_aborted = True
         logger.log_error(traceback.format_exc())
         return Error.ERROR_FACTOR_GENERATE_FAILED
 
     finally:
+        tick_cache.release()
         logger.log_info("task finished")
         task_queue.put(FinishACKMessage(task_id, aborted=_task_aborted))
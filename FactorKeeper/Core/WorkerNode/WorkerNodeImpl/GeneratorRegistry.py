@@ -0,0 +1,261 @@
+from Core.Conf.PathConf import Path
+from Core.Error.Error import Error
+from Util.TimeUtil.TickGrid import TickGrid
+import sys, os, traceback, importlib, hashlib, time, ast
+
+
+class GeneratorRegistry(object):
+    """
+        Factor generators imported by current process, keyed by (factor, version). Each entry keeps the code hash
+        of the generator directory it was imported from, a generator is imported again when a different code hash
+        is required(e.g. code is downloaded again after a failed upload). Code hashes are computed by the worker
+        process once per task group, so pool processes don't touch generator directories once imported.
+        A generator module defines "factor_generator(df, code, date)" computing one day per call, and/or
+        "factor_generator_batch(days_df, code, dates)" computing several days per call, and/or
+        "factor_generator_xs(panel, date)" computing all linked stocks of a day per call, and/or
+        "factor_generator_stateful(df, code, date, state)" computing one day from the state left by the previous
+        updated day(None for the first day) and returning (factor value, new state), states must be json
+        serializable and days of a linkage are updated in order.
+        Linkages of a single stock are updated by the per stock functions, a module defining only
+        "factor_generator_xs" is updated by cross section tasks only.
+        A module may also define "REQUIRES", a dict checked on import:
+            -columns: list of tick columns used by the generator, only these columns(and time columns) are loaded
+            -lookback: number of previous tick days passed to "factor_generator" and "factor_generator_batch"
+             as keyword "lookback", a list of (date, tick data dataframe) in order. "factor_generator" gets the
+             days before its date, "factor_generator_batch" gets the days before the first of its dates only,
+             the lookback of a later date is made of these days and the days before it in "days_df"
+    """
+    SINGLE_DAY_FUNCTION = "factor_generator"
+    BATCH_FUNCTION = "factor_generator_batch"
+    XS_FUNCTION = "factor_generator_xs"
+    STATEFUL_FUNCTION = "factor_generator_stateful"
+    FUNCTIONS = (SINGLE_DAY_FUNCTION, BATCH_FUNCTION, XS_FUNCTION, STATEFUL_FUNCTION)
+    PER_STOCK_FUNCTIONS = (SINGLE_DAY_FUNCTION, BATCH_FUNCTION, STATEFUL_FUNCTION)
+    REQUIRES = "REQUIRES"
+    REQUIRES_KEYS = ("columns", "lookback")
+
+    def __init__(self):
+        self.__entries = {}
+
+    @staticmethod
+    def get_generator_path(factor, version):
+        return "{0}/{1}/{2}".format(Path.FACTOR_GENERATOR_BASE, factor, version)
+
+    @staticmethod
+    def compute_code_hash(factor, version):
+        """
+        :param factor:
+        :param version:
+        :return: sha1 hex digest of relative paths and contents of source files of a generator
+        """
+        generator_path = GeneratorRegistry.get_generator_path(factor, version)
+        code_hash = hashlib.sha1()
+        for root, dirs, files in os.walk(generator_path):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for name in sorted(files):
+                if name.endswith(".pyc"):
+                    continue
+
+                file_path = os.path.join(root, name)
+                code_hash.update(os.path.relpath(file_path, generator_path).encode("utf-8"))
+                with open(file_path, 'rb') as f:
+                    code_hash.update(f.read())
+
+        return code_hash.hexdigest()
+
+    def get_code_hash(self, factor, version):
+        """
+        :return: code hash of the imported generator, None if not imported
+        """
+        entry = self.__entries.get((factor, version), None)
+        return entry[0] if entry is not None else None
+
+    def get(self, factor, version, logger, code_hash=None):
+        """
+        Get a factor generator module, it is imported if not imported yet or imported from different code
+        :param factor:
+        :param version:
+        :param logger:
+        :param code_hash: code hash required, any imported code is accepted if None
+        :return: err_code, factor generator module, seconds spent on importing(0 if not imported)
+        """
+        entry = self.__entries.get((factor, version), None)
+        if entry is not None and (code_hash is None or entry[0] == code_hash):
+            return Error.SUCCESS, entry[1], 0.0
+
+        started = time.time()
+        try:
+            if code_hash is None:
+                code_hash = self.compute_code_hash(factor, version)
+            err, generator_module = self.__import(factor, version, logger, reload=entry is not None)
+        except:
+            logger.log_error(traceback.format_exc())
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE, None, None
+
+        if err:
+            return err, None, None
+
+        self.__entries[(factor, version)] = (code_hash, generator_module)
+        return Error.SUCCESS, generator_module, time.time() - started
+
+    @staticmethod
+    def list_defined_functions(factor, version):
+        """
+        List generator functions defined by a generator by parsing its source, used by the worker process
+        which schedules unit tasks but doesn't import generators
+        :return: set of names of FUNCTIONS defined or imported at top level of generator module
+        """
+        generator_path = GeneratorRegistry.get_generator_path(factor, version)
+        generator_module_name = GeneratorRegistry.__find_module_name(generator_path)
+        source_path = "{0}/{1}".format(generator_path, generator_module_name)
+        if os.path.isdir(source_path):
+            source_path = "{}/__init__.py".format(source_path)
+
+        with open(source_path, 'rb') as f:
+            tree = ast.parse(f.read())
+
+        functions = set()
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                names = [node.name]
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                names = [alias.asname or alias.name for alias in node.names]
+            elif isinstance(node, ast.Assign):
+                names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+            else:
+                continue
+
+            functions.update(name for name in names if name in GeneratorRegistry.FUNCTIONS)
+
+        return functions
+
+    @staticmethod
+    def __find_module_name(generator_path):
+        return [f for f in os.listdir(generator_path) if f not in ("__init__.py", "__pycache__")][0]
+
+    @staticmethod
+    def __import(factor, version, logger, reload=False):
+        generator_path = GeneratorRegistry.get_generator_path(factor, version)
+        generator_module_name = GeneratorRegistry.__find_module_name(generator_path)
+        generator_module_path = "{0}/{1}".format(generator_path, generator_module_name)
+        if not os.path.isdir(generator_module_path):
+            if generator_module_name.endswith(".py"):
+                generator_module_name = generator_module_name[:-3]
+            else:
+                logger.log_error("Unrecognized file type: {}".format(generator_module_name))
+                return Error.ERROR_UNRECOGNIZED_FILE_TYPE, None
+
+        package_name = "{0}.{1}".format(factor, version)
+        if reload:
+            for module_name in [name for name in sys.modules
+                                if name == package_name or name.startswith(package_name + ".")]:
+                sys.modules.pop(module_name)
+            importlib.invalidate_caches()
+
+        try:
+            generator_module = importlib.import_module("{0}.{1}".format(package_name, generator_module_name))
+        except:
+            logger.log_error(traceback.format_exc())
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE, None
+
+        if not any(callable(getattr(generator_module, name, None)) for name in GeneratorRegistry.FUNCTIONS):
+            logger.log_error("None of {} is defined by generator module".format(", ".join(GeneratorRegistry.FUNCTIONS)))
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE, None
+
+        err_msg = GeneratorRegistry.__check_requires(getattr(generator_module, GeneratorRegistry.REQUIRES, None))
+        if err_msg is not None:
+            logger.log_error("Invalid {0} of generator module: {1}".format(GeneratorRegistry.REQUIRES, err_msg))
+            return Error.ERROR_FAILED_TO_LOAD_FACTOR_GENERATOR_MODULE, None
+
+        return Error.SUCCESS, generator_module
+
+    @staticmethod
+    def __check_requires(requires):
+        """
+        :return: error message, None if requires is valid or not defined
+        """
+        if requires is None:
+            return None
+
+        if not isinstance(requires, dict):
+            return "dict expected, but {} found".format(requires.__class__)
+
+        unknown_keys = set(requires.keys()) - set(GeneratorRegistry.REQUIRES_KEYS)
+        if len(unknown_keys) > 0:
+            return "unknown keys {}".format(sorted(unknown_keys))
+
+        columns = requires.get("columns", None)
+        if columns is not None and (not isinstance(columns, (list, tuple)) or
+                                    not all(isinstance(col, str) for col in columns)):
+            return "columns must be a list of column names, but {} found".format(columns)
+
+        lookback = requires.get("lookback", 0)
+        if not isinstance(lookback, int) or isinstance(lookback, bool) or lookback < 0:
+            return "lookback must be a non-negative integer, but {} found".format(lookback)
+
+        return None
+
+    @staticmethod
+    def get_required_columns(generator_module):
+        """
+        :return: tick columns declared by "REQUIRES" of generator module with time columns, None if all columns
+                 are required
+        """
+        requires = getattr(generator_module, GeneratorRegistry.REQUIRES, None) or {}
+        columns = requires.get("columns", None)
+        if columns is None:
+            return None
+
+        return list(TickGrid.TIME_COLUMNS) + [col for col in columns if col not in TickGrid.TIME_COLUMNS]
+
+    @staticmethod
+    def get_lookback(generator_module):
+        """
+        :return: number of previous tick days declared by "REQUIRES" of generator module, 0 if not declared
+        """
+        requires = getattr(generator_module, GeneratorRegistry.REQUIRES, None) or {}
+        return requires.get("lookback", 0)
+
+    @staticmethod
+    def merge_required_columns(columns_list):
+        """
+        :param columns_list: required columns of several generators
+        :return: union of columns in order of appearance, None if any generator requires all columns
+        """
+        merged = []
+        for columns in columns_list:
+            if columns is None:
+                return None
+            merged.extend(col for col in columns if col not in merged)
+        return merged
+
+    @staticmethod
+    def get_batch_function(generator_module):
+        """
+        :return: "factor_generator_batch" of generator module, None if it is not defined
+        """
+        batch_function = getattr(generator_module, GeneratorRegistry.BATCH_FUNCTION, None)
+        return batch_function if callable(batch_function) else None
+
+    @staticmethod
+    def get_stateful_function(generator_module):
+        """
+        :return: "factor_generator_stateful" of generator module, None if it is not defined
+        """
+        stateful_function = getattr(generator_module, GeneratorRegistry.STATEFUL_FUNCTION, None)
+        return stateful_function if callable(stateful_function) else None
+
+    @staticmethod
+    def has_per_stock_function(generator_module):
+        """
+        :return: True if generator module defines any of PER_STOCK_FUNCTIONS
+        """
+        return any(callable(getattr(generator_module, name, None)) for name in GeneratorRegistry.PER_STOCK_FUNCTIONS)
+
+    @staticmethod
+    def get_xs_function(generator_module):
+        """
+        :return: "factor_generator_xs" of generator module, None if it is not defined
+        """
+        xs_function = getattr(generator_module, GeneratorRegistry.XS_FUNCTION, None)
+        return xs_function if callable(xs_function) else None
@@ -56,6 +56,30 @@ class KillMessage(Message):
                                                MessageConst.MessageType.KILL)
 
 
+class GeneratorImportMessage(Message):
+    def __init__(self, task_id, factor, version, code_hash, import_seconds):
+        super(GeneratorImportMessage, self).__init__(MessageConst.MessageTarget.TARGET_TASK_MANAGER,
+                                                     MessageConst.MessageTargetType.TARGET_TYPE_MANAGER,
+                                                     task_id,
+                                                     MessageConst.MessageType.GENERATOR_IMPORT)
+        import os
+
+        self.factor = factor
+        self.version = version
+        self.code_hash = code_hash
+        self.import_seconds = import_seconds
+        self.pid = os.getpid()
+
+
+class TickCacheMessage(Message):
+    def __init__(self, task_id, result):
+        super(TickCacheMessage, self).__init__(MessageConst.MessageTarget.TARGET_TASK_MANAGER,
+                                               MessageConst.MessageTargetType.TARGET_TYPE_MANAGER,
+                                               task_id,
+                                               MessageConst.MessageType.TICK_CACHE)
+        self.result = result
+
+
 class MessageLogger(object):
     def __init__(self, task_id, task_group_id, log_stack, task_queue):
         self.task_id = task_id
@@ -76,6 +100,39 @@ class MessageLogger(object):
         return LoggerProxy(self, "/".join([self.log_stack, sub_module_name]))
 
 
+class TaskMessageLogger(MessageLogger):
+    """
+        A MessageLogger of a pool process which is rebound to each unit task. Loggers of long-lived
+        objects(see WorkerContext) are created from it, so their messages are sent to the running task.
+    """
+    def __init__(self):
+        super(TaskMessageLogger, self).__init__(None, None, "", None)
+
+    def bind(self, task_id, task_group_id, log_stack, task_queue):
+        self.task_id = task_id
+        self.log_stack = "{0}/{1}/{2}".format(log_stack, task_group_id, task_id)
+        self.task_queue = task_queue
+        return self
+
+    def log_error(self, content, log_stack=None):
+        super(TaskMessageLogger, self).log_error(content, log_stack=self.__make_log_stack(log_stack))
+
+    def log_warn(self, content, log_stack=None):
+        super(TaskMessageLogger, self).log_warn(content, log_stack=self.__make_log_stack(log_stack))
+
+    def log_info(self, content, log_stack=None):
+        super(TaskMessageLogger, self).log_info(content, log_stack=self.__make_log_stack(log_stack))
+
+    def sub_logger(self, sub_module_name):
+        from Core.Logger.Logger import LoggerProxy
+        return LoggerProxy(self, sub_module_name)
+
+    def __make_log_stack(self, sub_log_stack):
+        if sub_log_stack is None:
+            return self.log_stack
+        return "/".join([self.log_stack, sub_log_stack])
+
+
 class MessageConst(object):
     class MessageTarget(object):
         TARGET_TASK_MANAGER = "task_manager"
@@ -91,6 +148,8 @@ class MessageConst(object):
         FINISH = 3
         LOG = 4
         KILL = 5
+        GENERATOR_IMPORT = 6
+        TICK_CACHE = 7
 
     class MessageLogLevel(object):
         ERROR = "ERROR"
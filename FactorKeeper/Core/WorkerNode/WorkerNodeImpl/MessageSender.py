@@ -1,6 +1,7 @@
 from Core.Conf.MasterConf import MasterConf
 from Core.Conf.ProtoConf import ProtoConf
 from Core.Error.Error import Error
+from Util.TimeUtil.TickGrid import TickGrid
 import requests, datetime, traceback
 
 
@@ -8,6 +9,20 @@ class MessageSender(object):
     """
         MessageSend is used to send messages to master node, usually used in callbacks
     """
+    __http_session = None
+
+    @staticmethod
+    def set_http_session(http_session):
+        """
+        Send messages of current process through a session so that connections to master are reused
+        :param http_session: a requests session
+        """
+        MessageSender.__http_session = http_session
+
+    @staticmethod
+    def _http():
+        return MessageSender.__http_session if MessageSender.__http_session is not None else requests
+
     @staticmethod
     def _get_result(response):
         response = response
@@ -22,17 +37,64 @@ class MessageSender(object):
         return int(ret_code), ret_msg
 
     @staticmethod
-    def send_factor_result_to_master(factor, version, stock_code, day, df, task_id, logger):
+    def send_factor_result_to_master(factor, version, stock_code, day, df, task_id, logger, state=None):
         url = "http://{0}:{1}/worker/call_back/update_factor/update".format(MasterConf.SERVER_HOST, MasterConf.SERVER_PORT)
 
+        data = {
+            "HEADER": ProtoConf.CALLBACK_HEADER,
+            "factor": factor,
+            "version": version,
+            "stock_code": stock_code,
+            "date": day,
+            "task_id": task_id
+        }
+        if df is not None:
+            # time columns are rebuilt from tick grid by master
+            data["data_frame"] = TickGrid.drop_time_columns(df).to_json()
+        if state is not None:
+            # serialized state of stateful factor generator, saved by master with factor data
+            data["state"] = state
+
         try:
-            resp = requests.post(url, data={
+            resp = MessageSender._http().post(url, data=data).text
+        except:
+            logger.log_error(traceback.format_exc())
+            return Error.ERROR_HTTP_CONNECTION_FAILED, None
+
+        if resp.startswith(ProtoConf.RET_MSG_HEADER):
+            resp = resp[len(ProtoConf.RET_MSG_HEADER):]
+            err, msg = MessageSender._get_result(resp)
+            return err, msg
+
+        else:
+            logger.log_error("Unrecognized return message:\n" + resp)
+            return Error.ERROR_SERVER_INTERNAL_ERROR, None
+
+    @staticmethod
+    def send_factor_result_batch_to_master(items, task_id, logger):
+        """
+        Send factor results of several (factor, version, stock, day) items with one request
+        :param items: list of (factor, version, stock_code, day, dataframe)
+        :param task_id:
+        :param logger:
+        :return: err_code, message
+        """
+        import json
+
+        url = "http://{0}:{1}/worker/call_back/update_factor/update_batch".format(MasterConf.SERVER_HOST,
+                                                                                  MasterConf.SERVER_PORT)
+
+        try:
+            resp = MessageSender._http().post(url, data={
                 "HEADER": ProtoConf.CALLBACK_HEADER,
-                "factor": factor,
-                "version": version,
-                "stock_code": stock_code,
-                "date": day,
-                "data_frame": df.to_json(),
+                "data_frames": json.dumps([{
+                    "factor": factor,
+                    "version": version,
+                    "stock_code": stock_code,
+                    "date": str(day),
+                    # time columns are rebuilt from tick grid by master
+                    "data_frame": TickGrid.drop_time_columns(df).to_json()
+                } for factor, version, stock_code, day, df in items]),
                 "task_id": task_id
             }).text
         except:
@@ -54,11 +116,50 @@ class MessageSender(object):
                                                                                MasterConf.SERVER_PORT)
 
         try:
-            resp = requests.post(url, data={
+            resp = MessageSender._http().post(url, data={
                 "HEADER": ProtoConf.CALLBACK_HEADER,
                 "stock_code": stock_code,
                 "date": day,
-                "data_frame": df.to_json(),
+                # time columns are rebuilt from tick grid by master
+                "data_frame": TickGrid.drop_time_columns(df).to_json(),
+                "task_id": task_id
+            }).text
+        except:
+            logger.log_error(traceback.format_exc())
+            return Error.ERROR_HTTP_CONNECTION_FAILED, None
+
+        if resp.startswith(ProtoConf.RET_MSG_HEADER):
+            resp = resp[len(ProtoConf.RET_MSG_HEADER):]
+            err, msg = MessageSender._get_result(resp)
+            return err, msg
+
+        else:
+            logger.log_error("Unrecognized return message:\n" + resp)
+            return Error.ERROR_SERVER_INTERNAL_ERROR, None
+
+    @staticmethod
+    def send_tick_data_batch_to_master(items, task_id, logger):
+        """
+        Send normalized tick data of several (stock, day) pairs with one request
+        :param items: list of (stock_code, day, dataframe)
+        :param task_id:
+        :param logger:
+        :return: err_code, message
+        """
+        import json
+
+        url = "http://{0}:{1}/worker/call_back/update_tick_data/update_batch".format(MasterConf.SERVER_HOST,
+                                                                                     MasterConf.SERVER_PORT)
+
+        try:
+            resp = MessageSender._http().post(url, data={
+                "HEADER": ProtoConf.CALLBACK_HEADER,
+                "data_frames": json.dumps([{
+                    "stock_code": stock_code,
+                    "date": str(day),
+                    # time columns are rebuilt from tick grid by master
+                    "data_frame": TickGrid.drop_time_columns(df).to_json()
+                } for stock_code, day, df in items]),
                 "task_id": task_id
             }).text
         except:
@@ -84,7 +185,7 @@ class MessageSender(object):
         data.update(task_status)
 
         try:
-            resp = requests.post(url, data).text
+            resp = MessageSender._http().post(url, data).text
         except:
             logger.log_error(traceback.format_exc())
             return Error.ERROR_HTTP_CONNECTION_FAILED, None
@@ -103,7 +204,7 @@ class MessageSender(object):
         url = "http://{0}:{1}/worker".format(MasterConf.SERVER_HOST, MasterConf.SERVER_PORT)
 
         try:
-            resp = requests.post(url, data={
+            resp = MessageSender._http().post(url, data={
                 "HEADER": ProtoConf.WORKER_HEADER,
                 "host": host,
                 "port": port,
@@ -128,7 +229,7 @@ class MessageSender(object):
         url = "http://{0}:{1}/worker".format(MasterConf.SERVER_HOST, MasterConf.SERVER_PORT)
 
         try:
-            resp = requests.put(url, data={
+            resp = MessageSender._http().put(url, data={
                 "HEADER": ProtoConf.WORKER_HEADER,
                 "host": host,
                 "port": port,
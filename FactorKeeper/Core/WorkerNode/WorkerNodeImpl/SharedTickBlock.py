@@ -0,0 +1,256 @@
+"""
+    This file defines tick data days kept in shared memory, so that pool processes computing different
+    factors on the same (stock, day) read a single copy of tick data.
+"""
+
+
+from Core.Error.Error import Error
+from multiprocessing import shared_memory
+from collections import OrderedDict
+import multiprocessing
+import traceback
+import numpy as np
+import pandas as pd
+
+
+def _attach_shared_memory(name=None, size=0):
+    """
+    Create(name is None) or attach a shared memory block which is not tracked by resource tracker, blocks are
+    unlinked by the last consumer or by SharedTickBlockRegistry.clear
+    """
+    shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _unlink_shared_memory(name):
+    """
+    Unlink a block without notifying resource tracker, memory is freed when all processes close it.
+    Blocks are freed on close on platforms without posix shared memory.
+    """
+    try:
+        from multiprocessing.shared_memory import _posixshmem
+    except ImportError:
+        return
+
+    try:
+        _posixshmem.shm_unlink(name if name.startswith("/") else "/" + name)
+    except FileNotFoundError:
+        pass
+
+
+class SharedTickBlockRegistry(object):
+    """
+        Entries of shared tick blocks of a worker host keyed by (stock code, day), kept by a manager process
+        so that all pool processes see the same entries. An entry is a dict:
+            -name: shared memory name
+            -version: tick data version(see TickDataDao.get_tick_data_version)
+            -rows: row number
+            -columns: list of (column name, numpy dtype string, offset), "date" column has no dtype
+            -refs: number of unit tasks using the block
+    """
+    def __init__(self):
+        self.manager = multiprocessing.Manager()
+        self.entries = self.manager.dict()
+        self.lock = self.manager.Lock()
+
+    def __getstate__(self):
+        # the manager stays in the worker process, pool processes only use its proxies
+        return {"entries": self.entries, "lock": self.lock}
+
+    def __setstate__(self, state):
+        self.manager = None
+        self.entries = state["entries"]
+        self.lock = state["lock"]
+
+    def clear(self):
+        """
+        Unlink all blocks, called when pool processes are terminated so that blocks of killed tasks are not leaked
+        """
+        self.lock.acquire()
+        try:
+            for entry in self.entries.values():
+                _unlink_shared_memory(entry["name"])
+            self.entries.clear()
+        finally:
+            self.lock.release()
+
+
+class SharedTickBlockStore(object):
+    """
+        Shared tick blocks used by a pool process. A unit task acquires days from the store and gets dataframes
+        whose columns are read only views of shared memory, blocks acquired are released when the task finishes
+        and a block is unlinked once no task uses it.
+    """
+    def __init__(self, registry, logger):
+        """
+        :param registry: SharedTickBlockRegistry of the worker
+        :param logger: task message logger of the process
+        """
+        self.registry = registry
+        self.logger = logger
+        self.__acquired = OrderedDict()
+        self.__closing = []
+
+    def acquire(self, key, version, loader):
+        """
+        :param key: (stock code, day)
+        :param version: tick data version
+        :param loader: function returning err_code, dataframe of tick data, called if the block is not shared yet
+        :return: err_code, dataframe, True if the block was shared by another task
+        """
+        if key in self.__acquired and self.__acquired[key][0] == version:
+            return Error.SUCCESS, self.__acquired[key][2], True
+
+        err, df, shared = self.__acquire_registered(key, version)
+        if err or df is not None:
+            return err, df, shared
+
+        err, df = loader()
+        if err:
+            return err, None, False
+
+        meta, shm = self.__create_block(df, version)
+        if meta is None:
+            # columns which can't be shared, use private copy
+            return Error.SUCCESS, df, False
+
+        self.registry.lock.acquire()
+        try:
+            entry = self.registry.entries.get(key, None)
+            if entry is None or entry["version"] != version:
+                meta["refs"] = 1
+                self.registry.entries[key] = meta
+                registered = True
+            else:
+                registered = False
+        finally:
+            self.registry.lock.release()
+
+        if not registered:
+            # another task shared the same day meanwhile
+            shm.close()
+            _unlink_shared_memory(shm.name)
+            return self.__acquire_registered(key, version)
+
+        shared_df = self.__make_view(shm, meta, key[1])
+        self.__acquired[key] = (version, shm, shared_df)
+        return Error.SUCCESS, shared_df, False
+
+    def release(self):
+        """
+        Release blocks acquired by current task
+        """
+        acquired = self.__acquired
+        self.__acquired = OrderedDict()
+
+        if len(acquired) > 0:
+            self.registry.lock.acquire()
+            try:
+                for key, (version, shm, _) in acquired.items():
+                    entry = self.registry.entries.get(key, None)
+                    if entry is None or entry["name"] != shm.name:
+                        continue
+
+                    entry["refs"] -= 1
+                    if entry["refs"] > 0:
+                        self.registry.entries[key] = entry
+                    else:
+                        self.registry.entries.pop(key)
+                        _unlink_shared_memory(shm.name)
+            except:
+                self.logger.log_error(traceback.format_exc())
+            finally:
+                self.registry.lock.release()
+
+        # blocks are closed after views are released, views kept by factor generators delay closing
+        self.__closing.extend(shm for _, shm, _ in acquired.values())
+        acquired.clear()
+        closing = []
+        for shm in self.__closing:
+            try:
+                shm.close()
+            except BufferError:
+                closing.append(shm)
+        self.__closing = closing
+
+    def __acquire_registered(self, key, version):
+        """
+        :return: err_code, dataframe view of registered block(None if not registered), True if it's shared
+        """
+        self.registry.lock.acquire()
+        try:
+            entry = self.registry.entries.get(key, None)
+            if entry is None:
+                return Error.SUCCESS, None, False
+
+            if entry["version"] != version:
+                # tick data were updated again, tasks using the block keep their mappings
+                self.registry.entries.pop(key)
+                _unlink_shared_memory(entry["name"])
+                return Error.SUCCESS, None, False
+
+            try:
+                shm = _attach_shared_memory(entry["name"])
+            except FileNotFoundError:
+                self.registry.entries.pop(key)
+                return Error.SUCCESS, None, False
+
+            entry["refs"] += 1
+            self.registry.entries[key] = entry
+        finally:
+            self.registry.lock.release()
+
+        shared_df = self.__make_view(shm, entry, key[1])
+        self.__acquired[key] = (version, shm, shared_df)
+        return Error.SUCCESS, shared_df, True
+
+    @staticmethod
+    def __create_block(df, version):
+        """
+        Copy columns of a dataframe into a new shared memory block
+        :return: block entry, shared memory object, (None, None) if some columns can't be shared
+        """
+        columns = []
+        offset = 0
+        for col in df.columns:
+            if col == "date":
+                # "date" is restored from key
+                columns.append((col, None, None))
+                continue
+
+            dtype = df[col].dtype
+            if not isinstance(dtype, np.dtype) or dtype == object:
+                return None, None
+
+            columns.append((col, dtype.str, offset))
+            offset += -(-df.shape[0] * dtype.itemsize // 8) * 8
+
+        shm = _attach_shared_memory(size=max(offset, 1))
+        for col, dtype, col_offset in columns:
+            if dtype is not None:
+                block = np.ndarray((df.shape[0],), dtype=np.dtype(dtype), buffer=shm.buf, offset=col_offset)
+                block[:] = df[col].values
+                del block
+
+        return {"name": shm.name, "version": version, "rows": df.shape[0], "columns": columns, "refs": 0}, shm
+
+    @staticmethod
+    def __make_view(shm, entry, day):
+        arrays = OrderedDict()
+        for col, dtype, offset in entry["columns"]:
+            if dtype is None:
+                continue
+            array = np.ndarray((entry["rows"],), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            array.setflags(write=False)
+            arrays[col] = array
+
+        df = pd.DataFrame(arrays, copy=False)
+        for i, (col, dtype, _) in enumerate(entry["columns"]):
+            if dtype is None:
+                df.insert(i, col, day)
+        return df
@@ -0,0 +1,306 @@
+"""
+    This file defines the tick data cache of a worker host, so that factors linked to the same stock
+    don't load the same day of tick data from database again and again.
+"""
+
+
+from Core.Error.Error import Error
+from Core.Conf.WorkerConf import WorkerConf
+from Core.Conf.PathConf import Path
+from Core.WorkerNode.WorkerNodeImpl.Message import TickCacheMessage
+from collections import OrderedDict
+import traceback, datetime, os
+import numpy as np
+import pandas as pd
+
+
+class TickDataCache(object):
+    """
+        Days of tick data keyed by (stock code, day) are cached at two levels:
+            -an in-memory LRU of each pool process, limited by TICK_CACHE_MEMORY_MAX_BYTES. It is replaced by
+             shared memory blocks if shared blocks are given, days used by running tasks are then kept once
+             per host and tasks must call "release" when they finish
+            -columnar npz files shared by all pool processes of the host, limited by TICK_CACHE_DISK_MAX_BYTES,
+             least recently used files are removed first
+        Callers always get dataframes they can change(see "writable_copy").
+        Entries are tagged with the tick data version taken from tick update logs, an entry is dropped once
+        the version changes. Every lookup is reported to worker task manager which keeps hit ratios.
+        Misses load whole days so that entries serve any columns, columns requested by a task are read alone
+        from cache files on disk hits, and from database if the cache is disabled.
+    """
+    HIT_MEMORY = "memory_hits"
+    HIT_SHARED = "shared_hits"
+    HIT_DISK = "disk_hits"
+    MISS = "misses"
+
+    def __init__(self, tick_dao, logger, cache_dir=None, shared_blocks=None):
+        """
+        :param tick_dao: TickDataDao used on cache misses
+        :param logger: task message logger of the process
+        :param cache_dir: root directory of cache files, Path.TICK_CACHE_BASE if None
+        :param shared_blocks: SharedTickBlockStore of the process, the in-memory LRU is used if None
+        """
+        self.tick_dao = tick_dao
+        self.logger = logger
+        self.shared_blocks = shared_blocks
+        self.cache_dir = cache_dir if cache_dir is not None else Path.TICK_CACHE_BASE
+        self.__entries = OrderedDict()
+        self.__memory_bytes = 0
+        self.__writes_since_check = 0
+
+    def load_updated_tick_data(self, stock_code, day, columns=None, start_time=None, end_time=None):
+        """
+        Cached version of TickDataDao.load_updated_tick_data, whole days are cached and columns or time windows
+        are selected from them
+        :return: err_code, dataframe of tick data
+        """
+        if not WorkerConf.TICK_CACHE_ENABLED:
+            return self.tick_dao.load_updated_tick_data(stock_code, day, columns=columns, start_time=start_time,
+                                                        end_time=end_time)
+
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+
+        load_columns = columns
+        if columns is not None and (start_time is not None or end_time is not None) and "datetime" not in columns:
+            load_columns = list(columns) + ["datetime"]
+
+        err, df = self.__load_day(stock_code, day, load_columns)
+        if err:
+            return err, None
+
+        if columns is not None:
+            missing_columns = [col for col in columns if col not in df.columns]
+            if len(missing_columns) > 0:
+                self.logger.log_error("columns not exist in tick data of {0}: {1}".format(stock_code,
+                                                                                        missing_columns))
+                return Error.ERROR_PARAMETER_MISSING_OR_INVALID, None
+
+        if start_time is not None or end_time is not None:
+            times = df['datetime'].dt.time
+            mask = np.ones(df.shape[0], dtype=bool)
+            if start_time is not None:
+                mask &= (times >= start_time).values
+            if end_time is not None:
+                mask &= (times <= end_time).values
+            df = df[mask].reset_index(drop=True)
+
+        return Error.SUCCESS, self.writable_copy(df, columns=columns)
+
+    @staticmethod
+    def writable_copy(df, columns=None):
+        """
+        Copy a cached dataframe before it's passed to factor generators, which may change it in place. Shared views
+        are read only and memory entries are reused, so a shallow copy is only enough if pandas copies on write
+        (see "enable_copy_on_write").
+        :param columns: columns to keep, all columns if None
+        :return: dataframe which can be changed without changing df
+        """
+        copy_on_write = TickDataCache.is_copy_on_write()
+        if columns is not None:
+            # selected columns are already copied unless pandas copies on write
+            df = df[list(columns)]
+            return df if copy_on_write else df.copy()
+
+        return df.copy(deep=not copy_on_write)
+
+    @staticmethod
+    def is_copy_on_write():
+        if int(pd.__version__.split(".")[0]) >= 3:
+            return True
+
+        try:
+            return pd.get_option("mode.copy_on_write") is True
+        except Exception:
+            # option is not defined by pandas before 1.5
+            return False
+
+    @staticmethod
+    def enable_copy_on_write():
+        """
+        Enable copy on write of pandas in current process, called by pool initializer. Copy on write of pandas 1.5
+        is incomplete, so it's only enabled since pandas 2.0, frames are deep copied before.
+        :return: True if pandas copies on write
+        """
+        if not TickDataCache.is_copy_on_write() and int(pd.__version__.split(".")[0]) >= 2:
+            pd.set_option("mode.copy_on_write", True)
+
+        return TickDataCache.is_copy_on_write()
+
+    def release(self):
+        """
+        Release shared tick days used by current task, called when a unit task finishes
+        """
+        if self.shared_blocks is not None:
+            self.shared_blocks.release()
+
+    def __load_day(self, stock_code, day, columns=None):
+        """
+        :param columns: columns required by caller, whole day is returned if it's cached in memory
+        :return: err_code, dataframe of the day containing at least required columns
+        """
+        err, version = self.tick_dao.get_tick_data_version(stock_code, day)
+        if err:
+            return err, None
+
+        if version is None:
+            return self.tick_dao.load_updated_tick_data(stock_code, day, columns=columns)
+
+        key = (stock_code, day)
+        if self.shared_blocks is not None:
+            err, df, shared = self.shared_blocks.acquire(key, version,
+                                                         lambda: self.__load_uncached(stock_code, day, version))
+            if shared:
+                self.__report(TickDataCache.HIT_SHARED)
+            return err, df
+
+        entry = self.__entries.get(key, None)
+        if entry is not None:
+            if entry[0] == version:
+                self.__entries.move_to_end(key)
+                self.__report(TickDataCache.HIT_MEMORY)
+                return Error.SUCCESS, entry[1]
+            self.__pop_entry(key)
+
+        if columns is not None:
+            # projected days are not kept in memory, entries must serve any columns
+            df = self.__read_file(stock_code, day, version, columns)
+            if df is not None:
+                self.__report(TickDataCache.HIT_DISK)
+                return Error.SUCCESS, df
+
+        err, df = self.__load_uncached(stock_code, day, version)
+        if err:
+            return err, None
+
+        self.__put_entry(key, version, df)
+        return Error.SUCCESS, df
+
+    def __load_uncached(self, stock_code, day, version):
+        """
+        load a day from cache files, or from database if not cached on disk
+        :return: err_code, dataframe
+        """
+        df = self.__read_file(stock_code, day, version)
+        if df is not None:
+            self.__report(TickDataCache.HIT_DISK)
+            return Error.SUCCESS, df
+
+        err, df = self.tick_dao.load_updated_tick_data(stock_code, day)
+        if err:
+            return err, None
+
+        self.__report(TickDataCache.MISS)
+        self.__write_file(stock_code, day, version, df)
+        return Error.SUCCESS, df
+
+    def __put_entry(self, key, version, df):
+        nbytes = int(df.memory_usage(index=False, deep=False).sum())
+        if nbytes > WorkerConf.TICK_CACHE_MEMORY_MAX_BYTES:
+            return
+
+        self.__entries[key] = (version, df, nbytes)
+        self.__memory_bytes += nbytes
+        while self.__memory_bytes > WorkerConf.TICK_CACHE_MEMORY_MAX_BYTES:
+            self.__pop_entry(next(iter(self.__entries)))
+
+    def __pop_entry(self, key):
+        _, _, nbytes = self.__entries.pop(key)
+        self.__memory_bytes -= nbytes
+
+    def __day_files(self, stock_code, day):
+        stock_dir = os.path.join(self.cache_dir, stock_code)
+        if not os.path.isdir(stock_dir):
+            return stock_dir, []
+        prefix = "{}.".format(day)
+        # temp files are being written by other processes
+        return stock_dir, [name for name in os.listdir(stock_dir) if name.startswith(prefix) and
+                           not name.endswith(".tmp")]
+
+    def __read_file(self, stock_code, day, version, columns=None):
+        """
+        :param columns: columns to read, all columns are read if None
+        :return: dataframe of cache file of current version, None if not cached
+        """
+        try:
+            stock_dir, names = self.__day_files(stock_code, day)
+            file_name = "{0}.{1}.npz".format(day, version)
+            for name in names:
+                if name != file_name:
+                    # tick data were updated again
+                    os.remove(os.path.join(stock_dir, name))
+
+            if file_name not in names:
+                return None
+
+            path = os.path.join(stock_dir, file_name)
+            with np.load(path, allow_pickle=False) as npz:
+                # arrays of npz files are read on access, so columns not selected are not read
+                selected = [(i, col) for i, col in enumerate(npz['__columns__'].tolist())
+                            if columns is None or col in columns]
+                df = pd.DataFrame(OrderedDict((col, npz["c{}".format(i)]) for i, col in selected
+                                              if "c{}".format(i) in npz.files))
+                selected_columns = [col for _, col in selected]
+                date_index = selected_columns.index("date") if "date" in selected_columns else None
+            if date_index is not None:
+                df.insert(date_index, "date", day)
+            os.utime(path)
+            return df
+        except:
+            self.logger.log_warn("failed to read tick cache of {0} on {1}:\n{2}".format(
+                stock_code, day, traceback.format_exc()))
+            return None
+
+    def __write_file(self, stock_code, day, version, df):
+        # "date" is restored from key, other object columns can't be stored without pickling
+        arrays = {}
+        for i, col in enumerate(df.columns):
+            if col == "date":
+                continue
+            if df[col].dtype == object:
+                return
+            arrays["c{}".format(i)] = df[col].values
+
+        try:
+            stock_dir = os.path.join(self.cache_dir, stock_code)
+            os.makedirs(stock_dir, exist_ok=True)
+            path = os.path.join(stock_dir, "{0}.{1}.npz".format(day, version))
+            temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(temp_path, 'wb') as f:
+                np.savez(f, __columns__=np.array([str(col) for col in df.columns]), **arrays)
+            os.replace(temp_path, path)
+        except:
+            self.logger.log_warn("failed to write tick cache of {0} on {1}:\n{2}".format(
+                stock_code, day, traceback.format_exc()))
+            return
+
+        self.__writes_since_check += 1
+        if self.__writes_since_check >= WorkerConf.TICK_CACHE_DISK_CHECK_WRITES:
+            self.__writes_since_check = 0
+            self.__shrink_disk()
+
+    def __shrink_disk(self):
+        """
+        remove least recently used cache files until disk budget is met
+        """
+        try:
+            files = []
+            total_bytes = 0
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    stat = os.stat(os.path.join(root, name))
+                    files.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+                    total_bytes += stat.st_size
+
+            for _, size, path in sorted(files):
+                if total_bytes <= WorkerConf.TICK_CACHE_DISK_MAX_BYTES:
+                    break
+                os.remove(path)
+                total_bytes -= size
+        except:
+            # files may be removed by other processes at the same time
+            self.logger.log_warn("failed to shrink tick cache:\n{}".format(traceback.format_exc()))
+
+    def __report(self, result):
+        if self.logger.task_queue is not None:
+            self.logger.task_queue.put(TickCacheMessage(self.logger.task_id, result))
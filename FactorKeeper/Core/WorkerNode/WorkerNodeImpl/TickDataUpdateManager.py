@@ -1,9 +1,14 @@
 from Core.DAO.TickDataDao import TickDataDao
 from Core.Error.Error import Error
 from Core.WorkerNode.WorkerNodeImpl.WorkerTaskManager import Task, TaskGroup, TaskConst
-from Core.WorkerNode.WorkerNodeImpl.Message import FinishACKMessage, KillMessage, MessageLogger
+from Core.WorkerNode.WorkerNodeImpl.Message import FinishACKMessage, KillMessage
+from Core.WorkerNode.WorkerNodeImpl.WorkerContext import WorkerContext
 from Core.Conf.TickDataConf import TickDataConf
+from Core.Conf.WorkerConf import WorkerConf
 from Core.WorkerNode.WorkerNodeImpl.MessageSender import MessageSender
+from Core.WorkerNode.WorkerNodeImpl.TickNormalizer import TickGridNormalizer
+from Core.WorkerNode.WorkerNodeImpl.TickUpdatePipeline import TickUpdatePipeline
+from Util.TimeUtil.TickGrid import TickGrid
 import traceback
 import pandas as pd
 
@@ -39,15 +44,81 @@ class TickDataUpdateManager(object):
             return Error.ERROR_TASK_HAS_NOTHING_TO_BE_DONE, 0
 
         task_group = TaskGroup(TaskConst.TaskType.UPDATE_TICK_DATA_TASK, task_id)
-        for day in dates_to_update:
-            task = Task(TaskConst.TaskType.UPDATE_TICK_DATA_TASK, "{0}:{1}".format(stock_code, day))
-            task.set_target(update_stock_data_async, args=(stock_code, day))
+        if WorkerConf.STOCK_VIEW_SQL_MATERIALIZE and TickDataConf.is_stock_view(stock_code):
+            chunk_size = WorkerConf.TICK_BULK_IMPORT_MAX_DAYS
+            for start in range(0, update_item_num, chunk_size):
+                days = dates_to_update[start: start + chunk_size]
+                task = Task(TaskConst.TaskType.UPDATE_TICK_DATA_TASK,
+                            "{0}:{1}~{2}".format(stock_code, days[0], days[-1]))
+                task.set_target(materialize_stock_view_async, args=(stock_code, days))
+                task_group.add_task(task)
+        elif WorkerConf.TICK_BULK_IMPORT and not TickDataConf.is_stock_view(stock_code):
+            for days in self._split_consecutive_days(dates_to_update, available_dates,
+                                                     WorkerConf.TICK_BULK_IMPORT_MAX_DAYS):
+                task = Task(TaskConst.TaskType.UPDATE_TICK_DATA_TASK,
+                            "{0}:{1}~{2}".format(stock_code, days[0], days[-1]))
+                task.set_target(update_stock_data_by_range_async, args=(stock_code, days))
+                task_group.add_task(task)
+        else:
+            for day in dates_to_update:
+                task = Task(TaskConst.TaskType.UPDATE_TICK_DATA_TASK, "{0}:{1}".format(stock_code, day))
+                task.set_target(update_stock_data_async, args=(stock_code, day))
+                task_group.add_task(task)
+
+        self.task_manager.apply_task_group(task_group)
+
+        return Error.SUCCESS, update_item_num
+
+    def update_universe_data(self, stock_codes, day, task_id):
+        """
+        Update tick data of many stocks on a day, each unit task fetches a chunk of stocks with one query
+        :param stock_codes: list of stock codes, stock views are not supported
+        :param day:
+        :param task_id:
+        :return: err_code, number of stocks to update
+        """
+        err, updated_stocks = self.tick_dao.list_stocks_updated_on_day(stock_codes, day)
+        if err:
+            return err, None
+
+        stocks_to_update = sorted(set(stock_codes) - set(updated_stocks))
+        update_item_num = len(stocks_to_update)
+        if update_item_num == 0:
+            return Error.ERROR_TASK_HAS_NOTHING_TO_BE_DONE, 0
+
+        task_group = TaskGroup(TaskConst.TaskType.UPDATE_TICK_DATA_TASK, task_id)
+        chunk_size = WorkerConf.TICK_UNIVERSE_IMPORT_STOCKS_PER_TASK
+        for start in range(0, update_item_num, chunk_size):
+            stocks = stocks_to_update[start: start + chunk_size]
+            task = Task(TaskConst.TaskType.UPDATE_TICK_DATA_TASK, "{0}~{1}:{2}".format(stocks[0], stocks[-1], day))
+            task.set_target(update_universe_data_async, args=(stocks, day))
             task_group.add_task(task)
 
         self.task_manager.apply_task_group(task_group)
 
         return Error.SUCCESS, update_item_num
 
+    @staticmethod
+    def _split_consecutive_days(dates_to_update, available_dates, max_days):
+        """
+        Split dates to update into runs which are consecutive in available dates of data source,
+        so that a range query of a run fetches no day which has already been updated
+        :param dates_to_update: sorted dates
+        :param available_dates: dates available in data source
+        :param max_days: max days of a run
+        :return: list of runs, each run is a list of dates
+        """
+        date_index = {day: index for index, day in enumerate(sorted(available_dates))}
+
+        runs = []
+        for day in dates_to_update:
+            if runs and len(runs[-1]) < max_days and date_index[day] == date_index[runs[-1][-1]] + 1:
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+
+        return runs
+
     def query_update_status(self, task_id):
         return self.task_manager.query_group_progress(task_id)
 
@@ -61,33 +132,34 @@ class TickDataUpdateManager(object):
         return self.task_manager.stop_task_groups(task_type=TaskConst.TaskType.UPDATE_TICK_DATA_TASK)
 
 
-def update_stock_data_progress(stock_code, day, logger, db_engine):
-    tick_dao = TickDataDao(db_engine, logger)
-
+def update_stock_data_progress(stock_code, day, logger, tick_dao):
     try:
         err, stock_df = tick_dao.load_data_from_outer_source(stock_code, day)
 
         if err:
             logger.log_error("failed to load stock data from old database on {}".format(day))
             return err, None
-        stock_df = stock_df.drop(['index', 'windcode'], axis=1)
     except:
         logger.log_error(traceback.format_exc())
-        return Error.ERROR_SERVER_INTERNAL_ERROR
-
-    stock_df.set_index('datetime', inplace=True)
-    stock_df = stock_df[~stock_df.index.duplicated()]
-    stock_df = stock_df.resample('s').sum()
-    stock_df.fillna(method="ffill", inplace=True)
-
-    day_str = str(day)
-    stock_df = pd.DataFrame(stock_df,
-                            index=pd.date_range(day_str + ' 09:30:03', day_str + ' 11:30:00', freq='3s').append(
-                                pd.date_range(day_str + ' 13:00:00', day_str + ' 14:56:57', freq='3s'))). \
-        fillna(method='ffill')
-    stock_df.fillna(method='bfill', inplace=True)
-    stock_df['date'] = day
-    stock_df['datetime'] = stock_df.index
+        return Error.ERROR_SERVER_INTERNAL_ERROR, None
+
+    return normalize_stock_data(stock_df, day, logger)
+
+
+def normalize_stock_data(stock_df, day, logger):
+    """
+    Align raw tick data of a day imported from data source to the 3 seconds tick grid
+    :param stock_df: raw tick data of a day
+    :param day:
+    :param logger:
+    :return: err_code, normalized tick data
+    """
+    try:
+        stock_df = stock_df.drop(['index', 'windcode'], axis=1, errors='ignore')
+        stock_df = TickGridNormalizer.normalize(stock_df, day)
+    except:
+        logger.log_error(traceback.format_exc())
+        return Error.ERROR_SERVER_INTERNAL_ERROR, None
 
     if stock_df.shape[0] != TickDataConf.TICK_LENGTH:
         logger.log_error("tick data result format incorrect, {} rows found".format(stock_df.shape[0]))
@@ -96,20 +168,19 @@ def update_stock_data_progress(stock_code, day, logger, db_engine):
     return Error.SUCCESS, stock_df
 
 
-def update_stock_view_progress(stock_code, day, logger, db_engine):
-    tick_dao = TickDataDao(db_engine, logger)
-
+def update_stock_view_progress(stock_code, day, logger, tick_dao):
     try:
         err, relation = tick_dao.get_stock_view_relation(stock_code)
         if err:
             return err, None
 
-        ret_df = None
+        ret_columns = {}
 
         stocks = relation.keys()
         for dep_stock in stocks:
             columns = relation[dep_stock]
-            err, dep_stock_df = tick_dao.load_updated_tick_data(dep_stock, day, columns=(columns + ["datetime"]))
+            # stored ticks are ordered by datetime, rows of a full day are matched by grid index
+            err, dep_stock_df = tick_dao.load_updated_tick_data(dep_stock, day, columns=columns)
             if err:
                 return err, None
 
@@ -117,21 +188,220 @@ def update_stock_view_progress(stock_code, day, logger, db_engine):
                 logger.log_error("tick data result format incorrect, {} rows found".format(dep_stock_df.shape[0]))
                 return Error.ERROR_TICK_RESULT_INCORRECT, None
 
-            if ret_df is None:
-                ret_df = dep_stock_df[['datetime']]
-            ret_columns = ["{0}_{1}".format(col, dep_stock) for col in columns]
-            ret_df[ret_columns] = dep_stock_df[columns]
-
-        ret_df['date'] = day
-        print("set date:{}".format(day))
+            for col in columns:
+                ret_columns["{0}_{1}".format(col, dep_stock)] = dep_stock_df[col].values
     except:
         logger.log_error(traceback.format_exc())
         return Error.ERROR_SERVER_INTERNAL_ERROR, None
 
-    if ret_df is None:
+    if len(ret_columns) == 0:
         return Error.ERROR_SERVER_INTERNAL_ERROR, None
 
-    return Error.SUCCESS, ret_df
+    return Error.SUCCESS, TickGrid.attach_time_columns(pd.DataFrame(ret_columns), day)
+
+
+def make_range_read_job(tick_dao, stock_code, days, days_to_update):
+    """
+    Make a read job of TickUpdatePipeline fetching consecutive days of a stock with one range query
+    :param tick_dao:
+    :param stock_code:
+    :param days: consecutive days to fetch
+    :param days_to_update: set of days not fetched yet, shared by read jobs of a task
+    :return: read job
+    """
+    def read_job():
+        for err, day, raw_df in tick_dao.iter_data_from_outer_source_by_range(stock_code, days[0], days[-1]):
+            if err:
+                yield err, None, None, None
+                return
+
+            if day not in days_to_update:
+                continue
+            days_to_update.discard(day)
+
+            yield Error.SUCCESS, stock_code, day, raw_df
+
+    return read_job
+
+
+def make_universe_read_job(tick_dao, stock_codes, day, stocks_to_update):
+    """
+    Make a read job of TickUpdatePipeline fetching many stocks on a day with one query
+    :param tick_dao:
+    :param stock_codes: stocks to fetch
+    :param day:
+    :param stocks_to_update: set of stocks not fetched yet, shared by read jobs of a task
+    :return: read job
+    """
+    def read_job():
+        for err, stock_code, raw_df in tick_dao.import_day_for_universe(stock_codes, day):
+            if err:
+                yield err, None, None, None
+                return
+
+            if stock_code not in stocks_to_update:
+                continue
+            stocks_to_update.discard(stock_code)
+
+            yield Error.SUCCESS, stock_code, day, raw_df
+
+    return read_job
+
+
+def update_stock_data_by_range_async(stock_code, days, *args, **kwargs):
+    """
+    批量更新连续多日的tick数据，按TICK_PIPELINE_READ_DAYS天一次查询数据源，读取、规整和回调流水线并行执行
+    :param stock_code:
+    :param days: 连续的待更新日期
+    :param args:
+    :param kwargs:
+    :return:
+    """
+
+    # get task info
+    task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
+    task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
+    task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
+    log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
+
+    # get process context
+    context = WorkerContext.get()
+    tick_dao = context.tick_dao
+
+    # set task status
+    _task_aborted = False
+
+    # set logger
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
+
+    # log start info
+    logger.log_info("bulk tick data update task starting({0} days)...".format(len(days)))
+
+    try:
+        days_to_update = set(days)
+        chunk_size = WorkerConf.TICK_PIPELINE_READ_DAYS
+        read_jobs = [make_range_read_job(tick_dao, stock_code, days[start: start + chunk_size], days_to_update)
+                     for start in range(0, len(days), chunk_size)]
+
+        pipeline = TickUpdatePipeline(normalize_stock_data, task_group_id, logger)
+        err = pipeline.run(read_jobs)
+        _task_aborted = pipeline.aborted
+        if err == Error.ERROR_TASK_NOT_EXISTS:
+            task_queue.put(KillMessage(task_id))
+            return err
+        elif err:
+            logger.log_error("failed to load stock data from old database between {0} and {1}".
+                             format(days[0], days[-1]))
+            return err
+
+        if len(days_to_update) > 0:
+            logger.log_error("tick data not found in old database on {}".format(sorted(days_to_update)))
+            _task_aborted = True
+
+    except:
+        logger.log_error(traceback.format_exc())
+        _task_aborted = True
+    finally:
+        task_queue.put(FinishACKMessage(task_id, aborted=_task_aborted))
+
+
+def update_universe_data_async(stock_codes, day, *args, **kwargs):
+    """
+    更新多只股票某日的tick数据，按TICK_PIPELINE_READ_STOCKS只一次查询数据源，读取、规整和回调流水线并行执行
+    :param stock_codes:
+    :param day:
+    :param args:
+    :param kwargs:
+    :return:
+    """
+
+    # get task info
+    task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
+    task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
+    task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
+    log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
+
+    # get process context
+    context = WorkerContext.get()
+    tick_dao = context.tick_dao
+
+    # set task status
+    _task_aborted = False
+
+    # set logger
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
+
+    # log start info
+    logger.log_info("universe tick data update task starting({0} stocks on {1})...".format(len(stock_codes), day))
+
+    try:
+        stocks_to_update = set(stock_codes)
+        chunk_size = WorkerConf.TICK_PIPELINE_READ_STOCKS
+        read_jobs = [make_universe_read_job(tick_dao, stock_codes[start: start + chunk_size], day, stocks_to_update)
+                     for start in range(0, len(stock_codes), chunk_size)]
+
+        pipeline = TickUpdatePipeline(normalize_stock_data, task_group_id, logger)
+        err = pipeline.run(read_jobs)
+        _task_aborted = pipeline.aborted
+        if err == Error.ERROR_TASK_NOT_EXISTS:
+            task_queue.put(KillMessage(task_id))
+            return err
+        elif err:
+            logger.log_error("failed to load data of {0} stocks from old database on {1}".
+                             format(len(stock_codes), day))
+            return err
+
+        # stocks suspended on day have no tick data, which is not an error
+        if len(stocks_to_update) > 0:
+            logger.log_warn("tick data not found in old database on {0}: {1}".format(day, sorted(stocks_to_update)))
+
+    except:
+        logger.log_error(traceback.format_exc())
+        _task_aborted = True
+    finally:
+        task_queue.put(FinishACKMessage(task_id, aborted=_task_aborted))
+
+
+def materialize_stock_view_async(stock_code, days, *args, **kwargs):
+    """
+    在数据库内通过关联成分股票表生成stock view数据，数据不经过worker和master
+    :param stock_code:
+    :param days: 待更新日期
+    :param args:
+    :param kwargs:
+    :return:
+    """
+
+    # get task info
+    task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
+    task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
+    task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
+    log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
+
+    # get process context
+    context = WorkerContext.get()
+    tick_dao = context.tick_dao
+
+    # set task status
+    _task_aborted = False
+
+    # set logger
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
+
+    # log start info
+    logger.log_info("stock view materialize task starting({0} days)...".format(len(days)))
+
+    try:
+        err = tick_dao.materialize_stock_view(stock_code, days)
+        if err:
+            logger.log_error("failed to materialize stock view between {0} and {1}".format(days[0], days[-1]))
+            _task_aborted = True
+            return err
+    except:
+        logger.log_error(traceback.format_exc())
+        _task_aborted = True
+    finally:
+        task_queue.put(FinishACKMessage(task_id, aborted=_task_aborted))
 
 
 def update_stock_data_async(stock_code, day, *args, **kwargs):
@@ -144,31 +414,30 @@ def update_stock_data_async(stock_code, day, *args, **kwargs):
     :return:
     """
 
-    from Core.Conf.DatabaseConf import DBConfig
-
     # get task info
     task_id = kwargs.get(TaskConst.TaskParam.TASK_ID)
     task_queue = kwargs.get(TaskConst.TaskParam.TASK_MANAGER_QUEUE)
     task_group_id = kwargs.get(TaskConst.TaskParam.TASK_GROUP_ID)
     log_stack = kwargs.get(TaskConst.TaskParam.LOG_STACK)
 
-    # get global variable
-    db_engine = DBConfig.default_config().create_default_sa_engine_without_pool()
+    # get process context
+    context = WorkerContext.get()
+    tick_dao = context.tick_dao
 
     # set task status
     _task_aborted = False
 
     # set logger
-    logger = MessageLogger(task_id, task_group_id, log_stack, task_queue)
+    logger = context.bind_task(task_id, task_group_id, log_stack, task_queue)
 
     # log start info
     logger.log_info("factor update task starting...")
 
     try:
         if TickDataConf.is_stock_view(stock_code):
-            err, stock_df = update_stock_view_progress(stock_code, day, logger, db_engine)
+            err, stock_df = update_stock_view_progress(stock_code, day, logger, tick_dao)
         else:
-            err, stock_df = update_stock_data_progress(stock_code, day, logger, db_engine)
+            err, stock_df = update_stock_data_progress(stock_code, day, logger, tick_dao)
 
         if err:
             _task_aborted = True
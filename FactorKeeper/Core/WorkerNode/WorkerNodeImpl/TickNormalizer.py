@@ -0,0 +1,84 @@
+"""
+    This file defines alignment of raw tick data of a day onto the fixed 3 seconds tick grid.
+"""
+
+
+from Core.Conf.TickDataConf import TickDataConf
+from Util.TimeUtil.TickGrid import TickGrid
+import numpy as np
+import pandas as pd
+
+
+class TickGridNormalizer(object):
+    """
+        Raw ticks are aligned onto the grid(see TickGrid) with NumPy "searchsorted" instead of resampling
+        a whole day per second. The value of a grid point covers ticks in (previous grid point, grid point]:
+            -"last" columns(prices, sizes) take the last tick at or before the grid point, grid points
+             before the first tick take the first tick
+            -"sum" columns(volume) sum ticks of the interval, ticks before the first grid point and during
+             the noon break are added to the first grid point of the following session
+        Ticks with duplicated timestamps are deduplicated keeping the first one, ticks after the last grid
+        point are dropped.
+    """
+    AGGREGATIONS = ("last", "sum")
+
+    @staticmethod
+    def get_aggregation(column):
+        return TickDataConf.TICK_COLUMN_AGGREGATIONS.get(column, TickDataConf.DEFAULT_TICK_COLUMN_AGGREGATION)
+
+    @classmethod
+    def normalize(cls, stock_df, day):
+        """
+        Align raw ticks of a day onto the tick grid
+        :param stock_df: raw ticks with "datetime" column and numeric tick columns, other columns are ignored
+        :param day: date object
+        :return: dataframe of TickDataConf.TICK_LENGTH rows with aligned tick columns, "date" and "datetime"
+        """
+        ticks = stock_df['datetime'].values.astype('datetime64[ns]')
+        order = np.argsort(ticks, kind='stable')
+        ticks = ticks[order]
+        is_first = np.empty(ticks.shape[0], dtype=bool)
+        is_first[:1] = True
+        is_first[1:] = ticks[1:] != ticks[:-1]
+        rows = order[is_first]
+        ticks = ticks[is_first]
+
+        grid = TickGrid.grid_for_day(day)
+        # index of the last tick at or before each grid point, -1 if there is none
+        last_index = np.searchsorted(ticks, grid, side='right') - 1
+        # index of the grid point each tick is aggregated into, len(grid) if after the last one
+        bucket_index = np.searchsorted(grid, ticks, side='left')
+        in_grid = bucket_index < grid.shape[0]
+
+        ret = {}
+        for column in stock_df.columns:
+            if column in TickGrid.TIME_COLUMNS or stock_df[column].dtype.kind not in 'biuf':
+                continue
+
+            values = stock_df[column].values[rows].astype(np.float64)
+            if cls.get_aggregation(column) == "sum":
+                values = np.where(np.isnan(values), 0.0, values)
+                ret[column] = np.bincount(bucket_index[in_grid], weights=values[in_grid],
+                                          minlength=grid.shape[0])
+            else:
+                ret[column] = cls._take_last(values, last_index)
+
+        ret_df = pd.DataFrame(ret)
+        ret_df['date'] = day
+        ret_df['datetime'] = grid
+        return ret_df
+
+    @staticmethod
+    def _take_last(values, last_index):
+        if values.shape[0] == 0:
+            return np.full(last_index.shape[0], np.nan)
+
+        # missing values of a tick are filled by the previous valid tick, or the first valid one if none
+        positions = np.where(np.isnan(values), -1, np.arange(values.shape[0]))
+        positions = np.maximum.accumulate(positions)
+        valid = np.flatnonzero(positions >= 0)
+        if valid.shape[0] == 0:
+            return np.full(last_index.shape[0], np.nan)
+        positions[:valid[0]] = positions[valid[0]]
+
+        return values[positions[np.maximum(last_index, 0)]]
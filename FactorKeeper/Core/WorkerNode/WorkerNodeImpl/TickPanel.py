@@ -0,0 +1,78 @@
+"""
+    This file defines the panel of tick data passed to cross-sectional factor generators("factor_generator_xs").
+"""
+
+
+from Util.TimeUtil.TickGrid import TickGrid
+import numpy as np
+import pandas as pd
+
+
+class TickPanel(object):
+    """
+        Tick data of many stocks on a day, aligned on tick grid:
+            -stock_codes: stocks of the panel, in the order of the first axis of values
+            -columns: numeric tick columns shared by all stocks, in the order of the last axis of values
+            -values: float array of shape (stocks, ticks, columns)
+            -datetime: datetime of ticks
+    """
+    def __init__(self, day, stock_codes, day_dfs):
+        """
+        :param day: date of tick data
+        :param stock_codes: list of stock codes
+        :param day_dfs: list of tick data dataframes of stocks, all of TICK_LENGTH rows
+        """
+        shared_columns = set.intersection(*[set(df.columns) for df in day_dfs])
+        self.day = day
+        self.stock_codes = list(stock_codes)
+        self.columns = [col for col in day_dfs[0].columns if col in shared_columns and
+                        col not in TickGrid.TIME_COLUMNS and pd.api.types.is_numeric_dtype(day_dfs[0][col])]
+        self.values = np.stack([df[self.columns].to_numpy(dtype=np.float64) for df in day_dfs])
+        self.datetime = day_dfs[0]['datetime'].reset_index(drop=True)
+
+    def field(self, column):
+        """
+        :param column: tick column name
+        :return: 2-D array of shape (stocks, ticks)
+        """
+        return self.values[:, :, self.columns.index(column)]
+
+    def frame(self, stock_code):
+        """
+        :param stock_code:
+        :return: tick data dataframe of a stock with "datetime" column
+        """
+        df = pd.DataFrame(self.values[self.stock_codes.index(stock_code)], columns=self.columns)
+        df['datetime'] = self.datetime
+        return df
+
+    def split_result(self, xs_value, signature):
+        """
+        Split result of "factor_generator_xs" by stock. Results are accepted as:
+            -a dict of stock code -> factor value in the format returned by "factor_generator"
+            -a 2-D array of shape (stocks, ticks) for a single factor
+            -a 3-D array of shape (stocks, ticks, factors) with factors ordered as signature
+        :param xs_value: result of "factor_generator_xs"
+        :param signature: factor names of result, sub factors of group factors
+        :return: dict of stock code -> factor value, stocks not computed are omitted
+        """
+        if isinstance(xs_value, dict):
+            return {stock_code: value if isinstance(value, pd.DataFrame) else list(value)
+                    for stock_code, value in xs_value.items()}
+
+        xs_value = np.asarray(xs_value)
+        if xs_value.shape[0] != len(self.stock_codes):
+            raise ValueError("factor_generator_xs returned {0} stocks, {1} expected".format(
+                xs_value.shape[0], len(self.stock_codes)))
+
+        if xs_value.ndim == 2:
+            return {stock_code: xs_value[i].tolist() for i, stock_code in enumerate(self.stock_codes)}
+
+        if xs_value.ndim == 3 and xs_value.shape[2] == len(signature):
+            return {stock_code: pd.DataFrame(xs_value[i], columns=signature)
+                    for i, stock_code in enumerate(self.stock_codes)}
+
+        raise ValueError("factor_generator_xs returned unrecognized shape {}".format(xs_value.shape))
+
+    def __len__(self):
+        return len(self.stock_codes)
@@ -0,0 +1,184 @@
+"""
+    This file defines the staged pipeline used by tick data update unit tasks, so that fetching from
+    data source, normalizing and posting results to master overlap instead of running one after another.
+"""
+
+
+from Core.Error.Error import Error
+from Core.Conf.WorkerConf import WorkerConf
+from Core.WorkerNode.WorkerNodeImpl.MessageSender import MessageSender
+from threading import Thread, Event, Lock
+import traceback, time, queue
+
+
+class PipelineStageStats(object):
+    """
+        Items processed by a stage and time its threads spent on them, time blocked on queues is excluded.
+    """
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = concurrency
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.lock = Lock()
+
+    def add(self, items, seconds):
+        self.lock.acquire()
+        try:
+            self.items += items
+            self.busy_seconds += seconds
+        finally:
+            self.lock.release()
+
+    def __str__(self):
+        throughput = self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+        return "{0}(x{1}): {2} days, {3:.2f}s busy, {4:.2f} days/s per thread".format(
+            self.name, self.concurrency, self.items, self.busy_seconds, throughput)
+
+
+class TickUpdatePipeline(object):
+    """
+        Tick data of a unit task flows through three stages connected by bounded queues:
+            -reader threads run read jobs, each read job is one source query yielding raw ticks day by day
+            -the normalizer aligns raw ticks onto tick grid in the task process, pool processes can not start
+             child processes so normalizing is parallelized by the worker process pool(PROCESSOR_NUM)
+            -writer threads encode normalized days and post them to master in batches
+        Errors of a single day mark the task aborted, read errors and removed tasks stop the pipeline.
+    """
+    def __init__(self, normalize_func, task_group_id, logger, post_func=None):
+        """
+        :param normalize_func: function(raw_df, day, logger) returning err_code, normalized dataframe
+        :param task_group_id: task id of master
+        :param logger:
+        :param post_func: function(batch, task_group_id, logger) returning err_code, message, posts batches of
+                          (stock_code, day, dataframe) to master by MessageSender if None
+        """
+        self.normalize_func = normalize_func
+        self.post_func = post_func if post_func is not None else MessageSender.send_tick_data_batch_to_master
+        self.task_group_id = task_group_id
+        self.logger = logger
+        self.aborted = False
+
+        self.__err = Error.SUCCESS
+        self.__stopped = Event()
+        self.__stats = []
+
+    def run(self, read_jobs):
+        """
+        Run read jobs through the pipeline and wait until all days are posted
+        :param read_jobs: list of functions returning iterators of (err_code, stock_code, day, raw dataframe)
+        :return: err_code of the error which stopped the pipeline
+        """
+        start_time = time.time()
+        reader_num = max(1, min(WorkerConf.TICK_PIPELINE_READER_THREADS, len(read_jobs)))
+        writer_num = max(1, WorkerConf.TICK_PIPELINE_WRITER_THREADS)
+        read_stats = PipelineStageStats("read", reader_num)
+        normalize_stats = PipelineStageStats("normalize", 1)
+        write_stats = PipelineStageStats("write", writer_num)
+        self.__stats = [read_stats, normalize_stats, write_stats]
+
+        job_queue = queue.Queue()
+        for read_job in read_jobs:
+            job_queue.put(read_job)
+        raw_queue = queue.Queue(WorkerConf.TICK_PIPELINE_QUEUE_SIZE)
+        write_queue = queue.Queue(WorkerConf.TICK_PIPELINE_QUEUE_SIZE)
+
+        readers = [Thread(target=self.__read_routine, args=(job_queue, raw_queue, read_stats))
+                   for _ in range(reader_num)]
+        writers = [Thread(target=self.__write_routine, args=(write_queue, write_stats))
+                   for _ in range(writer_num)]
+        for thread in readers + writers:
+            thread.daemon = True
+            thread.start()
+
+        finished_readers = 0
+        while finished_readers < reader_num:
+            item = raw_queue.get()
+            if item is None:
+                finished_readers += 1
+                continue
+            if self.__stopped.is_set():
+                continue
+
+            stock_code, day, raw_df = item
+            started = time.time()
+            err, stock_df = self.normalize_func(raw_df, day, self.logger)
+            normalize_stats.add(1, time.time() - started)
+            if err:
+                self.aborted = True
+                continue
+
+            write_queue.put((stock_code, day, stock_df))
+
+        for _ in writers:
+            write_queue.put(None)
+        for thread in readers + writers:
+            thread.join()
+
+        self.logger.log_info("tick update pipeline finished in {0:.2f}s, {1}".format(
+            time.time() - start_time, "; ".join([str(stats) for stats in self.__stats])))
+        return self.__err
+
+    def __stop(self, err):
+        if not self.__err:
+            self.__err = err
+        self.aborted = True
+        self.__stopped.set()
+
+    def __read_routine(self, job_queue, raw_queue, stats):
+        try:
+            while not self.__stopped.is_set():
+                try:
+                    read_job = job_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                started = time.time()
+                for err, stock_code, day, raw_df in read_job():
+                    if err:
+                        self.__stop(err)
+                        break
+
+                    stats.add(1, time.time() - started)
+                    raw_queue.put((stock_code, day, raw_df))
+                    if self.__stopped.is_set():
+                        break
+                    started = time.time()
+        except:
+            self.logger.log_error(traceback.format_exc())
+            self.__stop(Error.ERROR_SERVER_INTERNAL_ERROR)
+        finally:
+            raw_queue.put(None)
+
+    def __write_routine(self, write_queue, stats):
+        batch = []
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            if self.__stopped.is_set():
+                continue
+
+            batch.append(item)
+            # post as soon as nothing else is waiting, so that batches never delay the normalizer
+            if len(batch) >= WorkerConf.TICK_PIPELINE_WRITE_BATCH or write_queue.empty():
+                self.__post_batch(batch, stats)
+                batch = []
+
+        if len(batch) > 0 and not self.__stopped.is_set():
+            self.__post_batch(batch, stats)
+
+    def __post_batch(self, batch, stats):
+        started = time.time()
+        try:
+            err, msg = self.post_func(batch, self.task_group_id, self.logger)
+        except:
+            self.logger.log_error(traceback.format_exc())
+            err, msg = Error.ERROR_SERVER_INTERNAL_ERROR, None
+        stats.add(len(batch), time.time() - started)
+
+        if err == Error.ERROR_TASK_NOT_EXISTS:
+            self.__stop(err)
+        elif err:
+            self.logger.log_error("Error occurred during tick update callback: {0} {1}".format(err, msg))
+            self.aborted = True
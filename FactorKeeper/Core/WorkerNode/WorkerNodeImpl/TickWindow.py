@@ -0,0 +1,132 @@
+"""
+    This file defines the sliding window of previous tick days passed to factor generators declaring a lookback.
+"""
+
+
+from Core.Error.Error import Error
+from collections import OrderedDict
+import bisect, datetime
+
+
+class TickWindowCache(object):
+    """
+        Previous tick days of a stock kept by a pool process. Unit tasks update days in order, so when the window
+        slides to the next day only the day leaving the window is dropped and the day just updated is kept, each
+        day is loaded once per stock instead of once per window it belongs to.
+        Entries are tagged with tick data versions, versions are checked once per unit task(see "release").
+    """
+    def __init__(self, tick_cache):
+        """
+        :param tick_cache: TickDataCache of the process
+        """
+        self.tick_cache = tick_cache
+        self.__stock_code = None
+        self.__tick_days = None
+        # day -> (version, dataframe, True if only some columns are loaded)
+        self.__entries = OrderedDict()
+        self.__checked_days = set()
+
+    def get_window(self, stock_code, day, lookback, columns=None):
+        """
+        :param stock_code:
+        :param day: date object of the day being updated
+        :param lookback: number of previous tick days
+        :param columns: columns required, all columns if None
+        :return: err_code, list of (day, dataframe) of previous tick days in order, fewer than lookback days are
+                 returned at the beginning of tick data
+        """
+        err, window_days = self.__list_window_days(stock_code, day, lookback)
+        if err:
+            return err, None
+
+        # slide window, the day being updated is kept as it enters the window of the next day
+        for cached_day in list(self.__entries.keys()):
+            if cached_day not in window_days and cached_day != day:
+                self.__entries.pop(cached_day)
+
+        window = []
+        for window_day in window_days:
+            err, df = self.__get_day(stock_code, window_day, columns)
+            if err:
+                return err, None
+            # generators get their own frames, so changes made by generators are not kept by entries
+            window.append((window_day, self.tick_cache.writable_copy(df, columns=columns)))
+
+        return Error.SUCCESS, window
+
+    def put(self, stock_code, day, df, columns=None):
+        """
+        Keep a day loaded by a unit task, so that it's not loaded again by the window of next day
+        :param columns: columns df was loaded with, all columns if None
+        """
+        if stock_code != self.__stock_code or day in self.__entries:
+            return
+
+        err, version = self.tick_cache.tick_dao.get_tick_data_version(stock_code, day)
+        if err or version is None:
+            return
+
+        # df is passed to generators which may change it
+        self.__entries[day] = (version, df.copy(), columns is not None)
+        self.__checked_days.add(day)
+
+    def release(self):
+        """
+        Called when a unit task finishes, versions and tick days are checked again by next task
+        """
+        self.__tick_days = None
+        self.__checked_days = set()
+
+    def __list_window_days(self, stock_code, day, lookback):
+        if stock_code != self.__stock_code:
+            self.__stock_code = stock_code
+            self.__tick_days = None
+            self.__entries = OrderedDict()
+            self.__checked_days = set()
+
+        if self.__tick_days is None:
+            err, tick_days = self.tick_cache.tick_dao.list_updated_dates(stock_code)
+            if err:
+                return err, None
+            self.__tick_days = sorted(tick_days)
+
+        index = bisect.bisect_left(self.__tick_days, day)
+        return Error.SUCCESS, self.__tick_days[max(0, index - lookback): index]
+
+    def __get_day(self, stock_code, day, columns):
+        entry = self.__entries.get(day, None)
+        version = None
+        if entry is not None and day not in self.__checked_days:
+            err, version = self.tick_cache.tick_dao.get_tick_data_version(stock_code, day)
+            if err:
+                return err, None
+            if version != entry[0]:
+                entry = None
+            else:
+                self.__checked_days.add(day)
+
+        # entries loaded with fewer columns are loaded again
+        if entry is not None and (columns is None and entry[2] or
+                                  columns is not None and not set(columns).issubset(entry[1].columns)):
+            entry = None
+
+        if entry is None:
+            if version is None:
+                err, version = self.tick_cache.tick_dao.get_tick_data_version(stock_code, day)
+                if err:
+                    return err, None
+
+            daytime = datetime.datetime(year=day.year, month=day.month, day=day.day)
+            err, df = self.tick_cache.load_updated_tick_data(stock_code, daytime, columns=columns)
+            if err:
+                return err, None
+
+            entry = (version, self.__own(df), columns is not None)
+            self.__entries[day] = entry
+            self.__checked_days.add(day)
+
+        return Error.SUCCESS, entry[1]
+
+    def __own(self, df):
+        # shared tick views are released when unit task finishes, entries outlive tasks
+        return df.copy() if self.tick_cache.shared_blocks is not None else df
@@ -0,0 +1,99 @@
+from Core.DAO.TickDataDao import TickDataDao
+from Core.DAO.FactorDao.FactorDao import FactorDao
+from Core.Conf.DatabaseConf import DBConfig
+from Core.Conf.WorkerConf import WorkerConf
+from Core.Conf.PathConf import Path
+from Core.Error.Error import Error
+from Core.WorkerNode.WorkerNodeImpl.Message import TaskMessageLogger, GeneratorImportMessage
+from Core.WorkerNode.WorkerNodeImpl.GeneratorRegistry import GeneratorRegistry
+from Core.WorkerNode.WorkerNodeImpl.MessageSender import MessageSender
+from Core.WorkerNode.WorkerNodeImpl.TickDataCache import TickDataCache
+from Core.WorkerNode.WorkerNodeImpl.SharedTickBlock import SharedTickBlockStore
+from Core.WorkerNode.WorkerNodeImpl.TickWindow import TickWindowCache
+import sys
+import requests
+
+
+class WorkerContext(object):
+    """
+        Long-lived objects of a worker pool process. The context is built once by the pool initializer
+        and reused by every unit task executed by the process:
+            -a pooled sqlalchemy engine
+            -tick data and factor daos, their loggers send messages to the running task
+            -the tick data cache of the process, backed by cache files and shared memory blocks of the host
+            -the sliding window of previous tick days used by generators declaring a lookback
+            -an http session keeping connections to master alive
+            -the registry of factor generators imported by the process
+    """
+    __context = None
+
+    def __init__(self, shared_tick_blocks=None):
+        """
+        :param shared_tick_blocks: SharedTickBlockRegistry of the worker, tick days are not shared if None
+        """
+        self.db_engine = DBConfig.create_default_sa_engine(pool_size=WorkerConf.DB_POOL_SIZE,
+                                                           max_overflow=WorkerConf.DB_MAX_OVERFLOW)
+        self.logger = TaskMessageLogger()
+        self.tick_dao = TickDataDao(self.db_engine, self.logger)
+        self.factor_dao = FactorDao(self.db_engine, self.logger)
+        shared_blocks = SharedTickBlockStore(shared_tick_blocks, self.logger) \
+            if shared_tick_blocks is not None else None
+        self.tick_cache = TickDataCache(self.tick_dao, self.logger, shared_blocks=shared_blocks)
+        self.tick_window = TickWindowCache(self.tick_cache)
+        self.http_session = requests.Session()
+        self.generator_registry = GeneratorRegistry()
+
+        MessageSender.set_http_session(self.http_session)
+
+        # add sys path if not exists
+        if Path.FACTOR_GENERATOR_BASE not in sys.path:
+            sys.path.append(Path.FACTOR_GENERATOR_BASE)
+
+    @classmethod
+    def initialize(cls, shared_tick_blocks=None):
+        """
+        Initializer of worker pool processes
+        :param shared_tick_blocks: SharedTickBlockRegistry of the worker
+        """
+        if WorkerConf.PANDAS_COPY_ON_WRITE:
+            TickDataCache.enable_copy_on_write()
+        cls.__context = WorkerContext(shared_tick_blocks)
+
+    @classmethod
+    def get(cls):
+        """
+        :return: context of current process, built on first use if the process is not initialized by a pool
+        """
+        if cls.__context is None:
+            cls.initialize()
+        return cls.__context
+
+    def bind_task(self, task_id, task_group_id, log_stack, task_queue):
+        """
+        Bind context logger to a unit task, a pool process executes one unit task at a time
+        :return: logger of the task
+        """
+        return self.logger.bind(task_id, task_group_id, log_stack, task_queue)
+
+    def get_factor_generator(self, factor, version, code_hash=None):
+        """
+        Get factor generator module of a factor version from generator registry of the process, import time
+        is reported to worker task manager if it is imported
+        :param factor:
+        :param version:
+        :param code_hash: code hash of generator directory computed when task group is applied
+        :return: err_code, factor generator module
+        """
+        err, generator_module, import_seconds = self.generator_registry.get(factor, version, self.logger,
+                                                                            code_hash=code_hash)
+        if err:
+            return err, None
+
+        if import_seconds > 0:
+            self.logger.log_info("factor generator {0}/{1} imported in {2:.3f}s".format(factor, version,
+                                                                                       import_seconds))
+            self.logger.task_queue.put(GeneratorImportMessage(
+                self.logger.task_id, factor, version, self.generator_registry.get_code_hash(factor, version),
+                import_seconds))
+
+        return Error.SUCCESS, generator_module
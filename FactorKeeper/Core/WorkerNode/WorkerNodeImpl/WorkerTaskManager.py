@@ -1,8 +1,9 @@
-from Core.WorkerNode.WorkerNodeImpl.Message import MessageConst
+from Core.WorkerNode.WorkerNodeImpl.Message import MessageConst, MessageLogger
 from Core.WorkerNode.WorkerNodeImpl.MessageSender import MessageSender
 from Core.Error.Error import Error
 from Core.Logger.Logger import TSLogger
 from Core.Conf.PathConf import Path
+from Core.Conf.WorkerConf import WorkerConf
 import multiprocessing
 import threading
 import traceback
@@ -101,17 +102,100 @@ class WorkerTaskManager(threading.Thread):
         WorkerTaskManager manage all unit tasks and task groups.
         You should not modify this class.
     """
-    def __init__(self, processes=1):
+    def __init__(self, processes=1, initializer=None, initargs=(), on_pool_terminated=None):
+        """
+        :param processes: number of pool processes
+        :param initializer: function called once by each pool process before executing unit tasks
+        :param initargs: arguments of initializer
+        :param on_pool_terminated: function called after pool processes are terminated, e.g. to free resources
+                                   shared by killed tasks
+        """
         super(WorkerTaskManager, self).__init__()
         self.__process_num = processes
+        self.__initializer = initializer
+        self.__initargs = tuple(initargs)
+        self.__on_pool_terminated = on_pool_terminated
         self.__lock = threading.Lock()
-        self.__pool = multiprocessing.Pool(processes=processes)
-        self.__queue = multiprocessing.Manager().Queue()
+        self.__manager = multiprocessing.Manager()
+        self.__queue = self.__manager.Queue()
+        self.__warm_ups = []
+        self.__generator_stats = {}
+        self.__tick_cache_stats = {"memory_hits": 0, "shared_hits": 0, "disk_hits": 0, "misses": 0}
+        self.__pool = self.__create_pool()
         self.logger = TSLogger(Path.WORKERNODE_WORKER_LOG_PATH, "Workers")
 
         self.__tasks = {}
         self.__groups = {}
 
+    def __create_pool(self):
+        # warm ups applied recently are run again by processes of a restarted pool
+        return multiprocessing.Pool(processes=self.__process_num, initializer=initialize_pool_process,
+                                    initargs=(self.__initializer, self.__initargs, list(self.__warm_ups),
+                                              self.__queue))
+
+    def apply_warm_up(self, func, args=()):
+        """
+        Run a warm up function once in every pool process before tasks applied later, e.g. import factor generators
+        used by a task group. Processes busy with other tasks are not waited for more than
+        WorkerConf.WARM_UP_TIMEOUT seconds, they run the warm up when they are free.
+        A warm up is run once per pool, applying it again(e.g. by next task group of the same generator version)
+        queues nothing, so busy pools are not blocked by barriers again.
+        :param func: function(*args, barrier=None, **kwargs), kwargs include task manager queue
+        :param args:
+        :return: err_code
+        """
+        self.__lock.acquire()
+        try:
+            # kept warm ups are run by every process of current pool, either applied or run by pool initializer
+            is_applied = (func, args) in self.__warm_ups
+            if is_applied:
+                self.__warm_ups.remove((func, args))
+            self.__warm_ups.append((func, args))
+            self.__warm_ups = self.__warm_ups[-WorkerConf.WARM_UP_KEEP_NUM:]
+            if is_applied:
+                return Error.SUCCESS
+
+            barrier = self.__manager.Barrier(self.__process_num, timeout=WorkerConf.WARM_UP_TIMEOUT)
+            kwargs = {
+                "barrier": barrier,
+                TaskConst.TaskParam.TASK_MANAGER_QUEUE: self.__queue
+            }
+            for _ in range(self.__process_num):
+                self.__pool.apply_async(func, args=args, kwds=kwargs)
+        finally:
+            self.__lock.release()
+
+        return Error.SUCCESS
+
+    def get_generator_stats(self):
+        """
+        :return: err_code, list of import stats of factor generators in pool processes
+        """
+        self.__lock.acquire()
+        try:
+            return Error.SUCCESS, [dict(stats, factor=factor, version=version, processes=len(stats['processes']))
+                                   for (factor, version), stats in sorted(self.__generator_stats.items())]
+        finally:
+            self.__lock.release()
+
+    def get_tick_cache_stats(self):
+        """
+        :return: err_code, lookup counts and hit ratios of tick data caches of pool processes
+        """
+        self.__lock.acquire()
+        try:
+            stats = dict(self.__tick_cache_stats)
+        finally:
+            self.__lock.release()
+
+        hits = stats["memory_hits"] + stats["shared_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["lookups"] = lookups
+        memory_hits = stats["memory_hits"] + stats["shared_hits"]
+        stats["memory_hit_ratio"] = float(memory_hits) / lookups if lookups > 0 else 0.0
+        stats["hit_ratio"] = float(hits) / lookups if lookups > 0 else 0.0
+        return Error.SUCCESS, stats
+
     def apply_task(self, task, group_id=None):
         self.logger.log_info("apply task:{}".format(task.task_id))
         kwargs = task.kwargs.copy()
@@ -226,6 +310,31 @@ class WorkerTaskManager(threading.Thread):
             elif message.log_level == "INFO":
                 self.logger.log_info(message.log_content, log_stack=message.log_stack)
 
+        elif message.type == MessageConst.MessageType.GENERATOR_IMPORT:
+            self.__lock.acquire()
+            try:
+                stats = self.__generator_stats.setdefault((message.factor, message.version), {
+                    "imports": 0,
+                    "total_import_seconds": 0.0,
+                    "max_import_seconds": 0.0,
+                    "processes": set()
+                })
+                stats["code_hash"] = message.code_hash
+                stats["imports"] += 1
+                stats["last_import_seconds"] = message.import_seconds
+                stats["total_import_seconds"] += message.import_seconds
+                stats["max_import_seconds"] = max(stats["max_import_seconds"], message.import_seconds)
+                stats["processes"].add(message.pid)
+            finally:
+                self.__lock.release()
+
+        elif message.type == MessageConst.MessageType.TICK_CACHE:
+            self.__lock.acquire()
+            try:
+                self.__tick_cache_stats[message.result] = self.__tick_cache_stats.get(message.result, 0) + 1
+            finally:
+                self.__lock.release()
+
         elif message.type == MessageConst.MessageType.KILL:
             if message.task_id in self.__tasks:
                 task = self.__tasks[message.task_id]
@@ -322,6 +431,12 @@ class WorkerTaskManager(threading.Thread):
             except Exception as e:
                 self.logger.log_error(traceback.format_exc())
 
+            if self.__on_pool_terminated is not None:
+                try:
+                    self.__on_pool_terminated()
+                except Exception:
+                    self.logger.log_error(traceback.format_exc())
+
             try:
                 # clean queue
                 while not self.__queue.empty():
@@ -336,7 +451,7 @@ class WorkerTaskManager(threading.Thread):
                 self.__groups = {}
 
             # restart pool
-            self.__pool = multiprocessing.Pool(processes=self.__process_num)
+            self.__pool = self.__create_pool()
             if restart_groups:
                 for group_id in self.__groups:
                     group = self.__groups[group_id]
@@ -350,6 +465,24 @@ class WorkerTaskManager(threading.Thread):
         return Error.SUCCESS
 
 
+def initialize_pool_process(initializer, initargs, warm_ups, task_queue):
+    """
+    Initializer of pool processes
+    :param initializer: initializer given to WorkerTaskManager
+    :param initargs: arguments of initializer
+    :param warm_ups: list of (func, args) applied by "apply_warm_up"
+    :param task_queue:
+    """
+    if initializer is not None:
+        initializer(*initargs)
+
+    for func, args in warm_ups:
+        try:
+            func(*args, **{TaskConst.TaskParam.TASK_MANAGER_QUEUE: task_queue})
+        except:
+            MessageLogger("INITIALIZE", "INITIALIZE", "WORK_RUNNER", task_queue).log_error(traceback.format_exc())
+
+
 class TaskConst(object):
     """
         Some task relative consts
@@ -0,0 +1,119 @@
+"""
+    Tests of states chained by stateful factor generators: days updated by several unit tasks get the same states
+    and factors as days updated by one task, days with too few ticks carry states over, and days after a failed
+    day are not updated.
+"""
+
+
+import unittest
+from tick_fixtures import worker_dependencies, TaskLogger, RecordingLogger, make_day_df, STOCK_CODE, DAYS
+
+with worker_dependencies():
+    import numpy as np
+    from Core.Error.Error import Error
+    from Core.WorkerNode.WorkerNodeImpl.FactorUpdateManager import generate_factor_stateful, load_factor_state
+
+
+class MemoryFactorDao(object):
+    """
+        Factor dao keeping states sent with results of stateful generators
+    """
+    def __init__(self):
+        self.states = {}
+
+    def get_factor_state(self, factor, version, stock_code, day):
+        days = [state_day for state_day in self.states if state_day < day]
+        if len(days) == 0:
+            return Error.SUCCESS, None, None
+        return Error.SUCCESS, max(days), self.states[max(days)]
+
+
+def cumulative_generator(df, code, date, state):
+    """
+    Stateful generator carrying numpy values and tuples, which are changed to python values and lists by json
+    """
+    if state is None:
+        state = {"count": 0, "total": np.float64(0), "last": (0.0, 0.0)}
+    total = state["total"] + df['last'].sum()
+    count = state["count"] + 1
+    last = [float(df['last'].iloc[-1]), float(state["last"][0])]
+    return total / count, {"count": count, "total": total, "last": last}
+
+
+class FactorStateChainTest(unittest.TestCase):
+    def setUp(self):
+        self.day_dfs = [(day, make_day_df(day, base=10.0 * i)) for i, day in enumerate(DAYS)]
+        self.factor_dao = MemoryFactorDao()
+
+    def load_state(self, day):
+        return load_factor_state(self.factor_dao, "factor", "v1", STOCK_CODE, day)
+
+    def update_chunk(self, generator, day_dfs, logger=None):
+        """
+        Update a chunk of days the way unit tasks do, states are saved the way master does
+        :return: list of (factor value, state) of days updated
+        """
+        day_results = generate_factor_stateful(generator, STOCK_CODE, day_dfs, self.load_state,
+                                               logger if logger is not None else TaskLogger(), tick_days=DAYS)
+        for (day, _), (_, day_state) in zip(day_dfs, day_results):
+            self.factor_dao.states[day] = day_state
+        return day_results
+
+    def test_split_chunks_match_single_chunk(self):
+        single_results = self.update_chunk(cumulative_generator, self.day_dfs)
+        self.factor_dao.states = {}
+
+        split_results = self.update_chunk(cumulative_generator, self.day_dfs[:2])
+        split_results += self.update_chunk(cumulative_generator, self.day_dfs[2:])
+
+        self.assertEqual(len(single_results), len(DAYS))
+        self.assertEqual(split_results, single_results)
+
+    def test_low_tick_day_carries_state_across_runs(self):
+        # the day with too few ticks is skipped, it stays to update and comes back with the next new day
+        low_tick_dfs = [(day, df if day != DAYS[2] else None) for day, df in self.day_dfs]
+        single_results = self.update_chunk(cumulative_generator, low_tick_dfs)
+        self.assertIsNone(single_results[2][0])
+        self.assertEqual(single_results[2][1], single_results[1][1])
+        self.factor_dao.states = {}
+
+        first_results = self.update_chunk(cumulative_generator, low_tick_dfs[:-1])
+        second_results = self.update_chunk(cumulative_generator, [low_tick_dfs[2], low_tick_dfs[-1]])
+
+        self.assertEqual(first_results, single_results[:-1])
+        # the new day follows the days updated by the first run instead of the state carried over the skipped day
+        self.assertEqual(second_results, [single_results[2], single_results[-1]])
+
+    def test_chain_stops_at_failed_day(self):
+        def failing_generator(df, code, date, state):
+            if date == DAYS[2]:
+                raise ValueError("bad tick data")
+            return cumulative_generator(df, code, date, state)
+
+        logger = RecordingLogger()
+        day_results = self.update_chunk(failing_generator, self.day_dfs, logger=logger)
+
+        self.assertEqual(len(day_results), 2)
+        self.assertEqual(len(logger.errors), 1)
+        self.factor_dao.states = {}
+        self.assertEqual(day_results, self.update_chunk(cumulative_generator, self.day_dfs[:2]))
+
+    def test_lookback_error_stops_chain(self):
+        def get_lookback(day, day_df):
+            if day == DAYS[1]:
+                return Error.ERROR_DB_EXECUTION_FAILED, None
+            return Error.SUCCESS, []
+
+        def generator(df, code, date, state, lookback):
+            return cumulative_generator(df, code, date, state)
+
+        logger = RecordingLogger()
+        day_results = generate_factor_stateful(generator, STOCK_CODE, self.day_dfs, self.load_state, logger,
+                                               get_lookback=get_lookback)
+
+        self.assertEqual(len(day_results), 1)
+        self.assertEqual(len(logger.errors), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+    Tests of TickDataCache backed by shared tick blocks: frames handed to factor generators can be changed in place,
+    and shared blocks are reference counted across tasks and unlinked by the last one. Tick data are served by an
+    in-memory tick dao.
+"""
+
+
+import contextlib, shutil, tempfile, unittest
+from tick_fixtures import worker_dependencies, TaskLogger, MemoryTickDao, make_day_df, STOCK_CODE, DAYS
+
+with worker_dependencies():
+    import numpy as np
+    import pandas as pd
+    from Core.Error.Error import Error
+    from Core.WorkerNode.WorkerNodeImpl.TickDataCache import TickDataCache
+    from Core.WorkerNode.WorkerNodeImpl.SharedTickBlock import SharedTickBlockRegistry, SharedTickBlockStore, \
+        _attach_shared_memory
+
+
+DAY = DAYS[0]
+
+
+class SharedTickDataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.logger = TaskLogger()
+        self.day_df = make_day_df(DAY)
+        self.tick_dao = MemoryTickDao({(STOCK_CODE, DAY): self.day_df})
+        self.registry = SharedTickBlockRegistry()
+
+    def tearDown(self):
+        self.registry.clear()
+        self.registry.manager.shutdown()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def make_cache(self):
+        """
+        :return: tick data cache of a pool process
+        """
+        store = SharedTickBlockStore(self.registry, self.logger)
+        return TickDataCache(self.tick_dao, self.logger, cache_dir=self.cache_dir, shared_blocks=store)
+
+    def get_refs(self):
+        entry = self.registry.entries.get((STOCK_CODE, DAY), None)
+        return entry["refs"] if entry is not None else 0
+
+    def test_generator_changes_loaded_frame_in_place(self):
+        cache = self.make_cache()
+        err, df = cache.load_updated_tick_data(STOCK_CODE, DAY)
+        self.assertEqual(err, Error.SUCCESS)
+
+        # the way factor generators usually change their frames
+        df['last'] *= 2
+        df.loc[0, 'volume'] = -1.0
+        df['spread'] = df['last'] - df['volume']
+        df.sort_values('last', ascending=False, inplace=True)
+
+        other_cache = self.make_cache()
+        err, shared_df = other_cache.load_updated_tick_data(STOCK_CODE, DAY)
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertEqual(self.tick_dao.loads, 1)
+        self.assertEqual(list(shared_df.columns), list(self.day_df.columns))
+        np.testing.assert_array_equal(shared_df['last'].values, self.day_df['last'].values)
+        np.testing.assert_array_equal(shared_df['volume'].values, self.day_df['volume'].values)
+
+        cache.release()
+        other_cache.release()
+
+    def test_frames_of_same_task_are_independent(self):
+        cache = self.make_cache()
+        _, first_df = cache.load_updated_tick_data(STOCK_CODE, DAY)
+        _, second_df = cache.load_updated_tick_data(STOCK_CODE, DAY)
+
+        first_df['last'] += 1
+        np.testing.assert_array_equal(second_df['last'].values, self.day_df['last'].values)
+        cache.release()
+
+    @unittest.skipIf(int(pd.__version__.split(".")[0]) < 2,
+                     "copy on write is not enabled before pandas 2.0")
+    def test_frames_share_memory_with_copy_on_write(self):
+        # pool processes enable copy on write, it's always on since pandas 3.0
+        context = contextlib.nullcontext() if TickDataCache.is_copy_on_write() else \
+            pd.option_context("mode.copy_on_write", True)
+        with context:
+            cache = self.make_cache()
+            _, first_df = cache.load_updated_tick_data(STOCK_CODE, DAY)
+            _, second_df = cache.load_updated_tick_data(STOCK_CODE, DAY)
+            self.assertTrue(np.shares_memory(first_df['last'].to_numpy(), second_df['last'].to_numpy()))
+
+            first_df['last'] *= 2
+            first_df.loc[0, 'volume'] = -1.0
+            np.testing.assert_array_equal(second_df['last'].values, self.day_df['last'].values)
+            np.testing.assert_array_equal(second_df['volume'].values, self.day_df['volume'].values)
+            cache.release()
+
+    def test_blocks_are_counted_per_task_and_unlinked_by_last_one(self):
+        first_cache = self.make_cache()
+        second_cache = self.make_cache()
+
+        first_cache.load_updated_tick_data(STOCK_CODE, DAY)
+        # days acquired again by the same task are not counted again
+        first_cache.load_updated_tick_data(STOCK_CODE, DAY)
+        self.assertEqual(self.get_refs(), 1)
+
+        second_cache.load_updated_tick_data(STOCK_CODE, DAY)
+        self.assertEqual(self.get_refs(), 2)
+        block_name = self.registry.entries[(STOCK_CODE, DAY)]["name"]
+
+        first_cache.release()
+        self.assertEqual(self.get_refs(), 1)
+        shm = _attach_shared_memory(block_name)
+        shm.close()
+
+        second_cache.release()
+        self.assertNotIn((STOCK_CODE, DAY), self.registry.entries.keys())
+        with self.assertRaises(FileNotFoundError):
+            _attach_shared_memory(block_name)
+
+        # releasing again does nothing
+        second_cache.release()
+        self.assertEqual(self.get_refs(), 0)
+
+    def test_block_of_old_version_is_replaced(self):
+        first_cache = self.make_cache()
+        first_cache.load_updated_tick_data(STOCK_CODE, DAY)
+        old_name = self.registry.entries[(STOCK_CODE, DAY)]["name"]
+
+        self.tick_dao.versions[(STOCK_CODE, DAY)] = 2
+        second_cache = self.make_cache()
+        err, df = second_cache.load_updated_tick_data(STOCK_CODE, DAY)
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertEqual(self.tick_dao.loads, 2)
+        self.assertNotEqual(self.registry.entries[(STOCK_CODE, DAY)]["name"], old_name)
+        self.assertEqual(self.get_refs(), 1)
+
+        # the task using the old block keeps its mapping and doesn't release the new block
+        first_cache.release()
+        self.assertEqual(self.get_refs(), 1)
+        second_cache.release()
+        self.assertEqual(self.get_refs(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+    Tests of TickUpdatePipeline: days flow from read jobs to posted batches in order, and errors stop every
+    stage without leaving threads behind. Read jobs and posts are plain functions, no database or master is needed.
+"""
+
+
+import datetime, threading, unittest
+from tick_fixtures import worker_dependencies, RecordingLogger, STOCK_CODE
+
+with worker_dependencies():
+    from Core.Conf.WorkerConf import WorkerConf
+    from Core.Error.Error import Error
+    from Core.WorkerNode.WorkerNodeImpl.TickUpdatePipeline import TickUpdatePipeline
+
+
+def make_days(num):
+    return [datetime.date(2020, 1, 1) + datetime.timedelta(days=i) for i in range(num)]
+
+
+def make_read_job(stock_code, days, fail_after=None, err=None):
+    """
+    :return: read job yielding days of a stock, an error is yielded after "fail_after" days if not None
+    """
+    def read_job():
+        for i, day in enumerate(days):
+            if fail_after is not None and i == fail_after:
+                yield err, None, None, None
+                return
+            yield Error.SUCCESS, stock_code, day, (stock_code, day)
+
+    return read_job
+
+
+class TickUpdatePipelineTest(unittest.TestCase):
+    CONF_NAMES = ("TICK_PIPELINE_READER_THREADS", "TICK_PIPELINE_WRITER_THREADS", "TICK_PIPELINE_QUEUE_SIZE",
+                  "TICK_PIPELINE_WRITE_BATCH")
+
+    def setUp(self):
+        self.saved_conf = {name: getattr(WorkerConf, name) for name in self.CONF_NAMES}
+        WorkerConf.TICK_PIPELINE_READER_THREADS = 1
+        WorkerConf.TICK_PIPELINE_WRITER_THREADS = 1
+        WorkerConf.TICK_PIPELINE_QUEUE_SIZE = 1
+        WorkerConf.TICK_PIPELINE_WRITE_BATCH = 3
+
+        self.logger = RecordingLogger()
+        self.posted = []
+        self.post_lock = threading.Lock()
+
+    def tearDown(self):
+        for name, value in self.saved_conf.items():
+            setattr(WorkerConf, name, value)
+
+    def post(self, batch, task_group_id, logger):
+        with self.post_lock:
+            self.posted.extend((stock_code, day) for stock_code, day, _ in batch)
+        return Error.SUCCESS, None
+
+    @staticmethod
+    def normalize(raw_df, day, logger):
+        return Error.SUCCESS, raw_df
+
+    def run_pipeline(self, pipeline, read_jobs):
+        """
+        Run pipeline in a thread so that a deadlock fails the test instead of hanging it
+        :return: err_code returned by pipeline, threads started by pipeline still alive
+        """
+        threads_before = set(threading.enumerate())
+        result = []
+        runner = threading.Thread(target=lambda: result.append(pipeline.run(read_jobs)))
+        runner.daemon = True
+        runner.start()
+        runner.join(10)
+        self.assertFalse(runner.is_alive(), "pipeline did not finish")
+
+        leaked = [thread for thread in threading.enumerate() if thread not in threads_before and thread is not runner]
+        return result[0], leaked
+
+    def test_days_are_posted_in_read_order(self):
+        days = make_days(20)
+        pipeline = TickUpdatePipeline(self.normalize, "task", self.logger, post_func=self.post)
+
+        err, leaked = self.run_pipeline(pipeline, [make_read_job(STOCK_CODE, days)])
+
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertFalse(pipeline.aborted)
+        self.assertEqual(self.posted, [(STOCK_CODE, day) for day in days])
+        self.assertEqual(leaked, [])
+
+    def test_days_of_each_job_keep_order_with_concurrent_readers(self):
+        WorkerConf.TICK_PIPELINE_READER_THREADS = 3
+        stocks = [STOCK_CODE, "000002", "000003"]
+        days = make_days(10)
+        pipeline = TickUpdatePipeline(self.normalize, "task", self.logger, post_func=self.post)
+
+        err, leaked = self.run_pipeline(pipeline, [make_read_job(stock, days) for stock in stocks])
+
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertEqual(len(self.posted), len(stocks) * len(days))
+        for stock in stocks:
+            self.assertEqual([day for code, day in self.posted if code == stock], days)
+        self.assertEqual(leaked, [])
+
+    def test_normalize_error_aborts_task_and_skips_day(self):
+        days = make_days(6)
+
+        def normalize(raw_df, day, logger):
+            if day == days[2]:
+                return Error.ERROR_TICK_RESULT_INCORRECT, None
+            return Error.SUCCESS, raw_df
+
+        pipeline = TickUpdatePipeline(normalize, "task", self.logger, post_func=self.post)
+        err, leaked = self.run_pipeline(pipeline, [make_read_job(STOCK_CODE, days)])
+
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertTrue(pipeline.aborted)
+        self.assertEqual(self.posted, [(STOCK_CODE, day) for day in days if day != days[2]])
+        self.assertEqual(leaked, [])
+
+    def test_read_error_stops_pipeline(self):
+        WorkerConf.TICK_PIPELINE_READER_THREADS = 2
+        read_jobs = [make_read_job(STOCK_CODE, make_days(5), fail_after=2, err=Error.ERROR_DB_EXECUTION_FAILED),
+                     make_read_job("000002", make_days(1000))]
+        pipeline = TickUpdatePipeline(self.normalize, "task", self.logger, post_func=self.post)
+
+        err, leaked = self.run_pipeline(pipeline, read_jobs)
+
+        self.assertEqual(err, Error.ERROR_DB_EXECUTION_FAILED)
+        self.assertTrue(pipeline.aborted)
+        self.assertLess(len(self.posted), 1000)
+        self.assertEqual(leaked, [])
+
+    def test_read_exception_stops_pipeline(self):
+        def read_job():
+            yield Error.SUCCESS, STOCK_CODE, make_days(1)[0], None
+            raise RuntimeError("source closed")
+
+        pipeline = TickUpdatePipeline(self.normalize, "task", self.logger, post_func=self.post)
+        err, leaked = self.run_pipeline(pipeline, [read_job])
+
+        self.assertEqual(err, Error.ERROR_SERVER_INTERNAL_ERROR)
+        self.assertTrue(pipeline.aborted)
+        self.assertEqual(len(self.logger.errors), 1)
+        self.assertEqual(leaked, [])
+
+    def test_removed_task_stops_bounded_readers(self):
+        read_days = []
+
+        def read_job():
+            for day in make_days(1000):
+                read_days.append(day)
+                yield Error.SUCCESS, STOCK_CODE, day, None
+
+        def post(batch, task_group_id, logger):
+            return Error.ERROR_TASK_NOT_EXISTS, None
+
+        pipeline = TickUpdatePipeline(self.normalize, "task", self.logger, post_func=post)
+        err, leaked = self.run_pipeline(pipeline, [read_job])
+
+        self.assertEqual(err, Error.ERROR_TASK_NOT_EXISTS)
+        self.assertTrue(pipeline.aborted)
+        # queues are bounded, reader is stopped after a few days instead of reading all of them
+        self.assertLess(len(read_days), 1000)
+        self.assertEqual(leaked, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+    Tests of TickWindowCache: windows of previous tick days slide with the day being updated, each day is loaded
+    once while it stays in the window, and entries are dropped when tick data versions change.
+"""
+
+
+import datetime, shutil, tempfile, unittest
+from tick_fixtures import worker_dependencies, TaskLogger, MemoryTickDao, make_day_df, STOCK_CODE, DAYS
+
+with worker_dependencies():
+    import numpy as np
+    from Core.Error.Error import Error
+    from Core.WorkerNode.WorkerNodeImpl.TickDataCache import TickDataCache
+    from Core.WorkerNode.WorkerNodeImpl.TickWindow import TickWindowCache
+
+
+class CountingTickDataCache(TickDataCache):
+    """
+        Tick data cache recording days loaded through it
+    """
+    def __init__(self, *args, **kwargs):
+        super(CountingTickDataCache, self).__init__(*args, **kwargs)
+        self.loaded_days = []
+
+    def load_updated_tick_data(self, stock_code, day, columns=None, start_time=None, end_time=None):
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        self.loaded_days.append(day)
+        return super(CountingTickDataCache, self).load_updated_tick_data(stock_code, day, columns=columns,
+                                                                         start_time=start_time, end_time=end_time)
+
+
+class TickWindowCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.day_dfs = {day: make_day_df(day, base=100.0 * i) for i, day in enumerate(DAYS)}
+        self.tick_dao = MemoryTickDao({(STOCK_CODE, day): df for day, df in self.day_dfs.items()})
+        self.tick_cache = CountingTickDataCache(self.tick_dao, TaskLogger(), cache_dir=self.cache_dir)
+        self.tick_window = TickWindowCache(self.tick_cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def update_days(self, days, lookback, columns=None):
+        """
+        Get windows of days in order the way unit tasks do
+        :return: list of windows
+        """
+        windows = []
+        for day in days:
+            err, window = self.tick_window.get_window(STOCK_CODE, day, lookback, columns)
+            self.assertEqual(err, Error.SUCCESS)
+            windows.append(window)
+
+            err, day_df = self.tick_cache.load_updated_tick_data(STOCK_CODE, day, columns=columns)
+            self.assertEqual(err, Error.SUCCESS)
+            self.tick_window.put(STOCK_CODE, day, day_df, columns)
+        self.tick_window.release()
+        return windows
+
+    def assert_window(self, window, days):
+        self.assertEqual([day for day, _ in window], days)
+        for day, df in window:
+            np.testing.assert_array_equal(df['last'].values, self.day_dfs[day]['last'].values)
+
+    def test_window_slides_over_previous_tick_days(self):
+        windows = self.update_days(DAYS, 2)
+
+        self.assert_window(windows[0], [])
+        self.assert_window(windows[1], DAYS[:1])
+        for i in range(2, len(DAYS)):
+            self.assert_window(windows[i], DAYS[i - 2: i])
+
+    def test_days_are_loaded_once_while_in_window(self):
+        self.update_days(DAYS, 3)
+
+        # every day is loaded by the unit task itself, windows reuse days put by previous updates
+        self.assertEqual(sorted(self.tick_cache.loaded_days), DAYS)
+
+    def test_window_starting_in_the_middle_loads_previous_days(self):
+        windows = self.update_days(DAYS[3:], 2)
+
+        self.assert_window(windows[0], DAYS[1:3])
+        self.assert_window(windows[1], DAYS[2:4])
+        self.assertEqual(sorted(self.tick_cache.loaded_days), DAYS[1:])
+
+    def test_changes_made_by_generators_are_not_kept(self):
+        err, window = self.tick_window.get_window(STOCK_CODE, DAYS[2], 2)
+        self.assertEqual(err, Error.SUCCESS)
+        for _, df in window:
+            df['last'] *= -1
+            df['signal'] = 1.0
+
+        err, window = self.tick_window.get_window(STOCK_CODE, DAYS[2], 2)
+        self.assertEqual(err, Error.SUCCESS)
+        self.assert_window(window, DAYS[:2])
+        self.assertNotIn('signal', window[0][1].columns)
+
+    def test_entries_of_updated_tick_data_are_loaded_again(self):
+        self.update_days(DAYS[:3], 2)
+        self.tick_cache.loaded_days = []
+
+        self.tick_dao.versions[(STOCK_CODE, DAYS[1])] = 2
+        self.day_dfs[DAYS[1]] = make_day_df(DAYS[1], base=-1.0)
+        self.tick_dao.days[(STOCK_CODE, DAYS[1])] = self.day_dfs[DAYS[1]]
+        windows = self.update_days(DAYS[3:4], 2)
+
+        self.assert_window(windows[0], DAYS[1:3])
+        self.assertIn(DAYS[1], self.tick_cache.loaded_days)
+        self.assertNotIn(DAYS[2], self.tick_cache.loaded_days)
+
+    def test_entries_with_fewer_columns_are_loaded_again(self):
+        self.update_days(DAYS[:2], 1, columns=["datetime", "date", "last"])
+        self.tick_cache.loaded_days = []
+
+        err, window = self.tick_window.get_window(STOCK_CODE, DAYS[2], 1)
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertIn("volume", window[0][1].columns)
+        self.assertEqual(self.tick_cache.loaded_days, [DAYS[1]])
+
+    def test_window_of_another_stock_is_not_reused(self):
+        other_dfs = {day: make_day_df(day, base=-100.0) for day in DAYS[:2]}
+        self.tick_dao.days.update({("000002", day): df for day, df in other_dfs.items()})
+        self.tick_dao.versions.update({("000002", day): 1 for day in other_dfs})
+        self.update_days(DAYS[:2], 1)
+
+        err, window = self.tick_window.get_window("000002", DAYS[1], 1)
+        self.assertEqual(err, Error.SUCCESS)
+        self.assertEqual([day for day, _ in window], DAYS[:1])
+        np.testing.assert_array_equal(window[0][1]['last'].values, other_dfs[DAYS[0]]['last'].values)
+
+
+if __name__ == '__main__':
+    unittest.main()
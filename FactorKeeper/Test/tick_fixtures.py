@@ -0,0 +1,103 @@
+"""
+    Fixtures shared by worker tests: tick data served from memory, loggers and the stocks and days tests run on,
+    no database is needed. Test modules import worker modules inside "worker_dependencies", so that tests are
+    skipped where dependencies are not installed.
+
+    usage: python -m unittest discover -s Test (from FactorKeeper directory)
+"""
+
+
+import contextlib, datetime, unittest
+
+
+@contextlib.contextmanager
+def worker_dependencies():
+    """
+    Skip the test module importing worker modules in this context if some dependency is not installed
+    """
+    try:
+        yield
+    except ImportError as e:
+        raise unittest.SkipTest("worker dependencies not installed: {0}".format(e))
+
+
+with worker_dependencies():
+    from Core.Error.Error import Error
+    import numpy as np
+    import pandas as pd
+
+
+STOCK_CODE = "000001"
+# tick days skip weekends, windows and state chains are made of tick days instead of calendar days
+DAYS = [datetime.date(2020, 1, 2), datetime.date(2020, 1, 3), datetime.date(2020, 1, 6), datetime.date(2020, 1, 7),
+        datetime.date(2020, 1, 8), datetime.date(2020, 1, 9), datetime.date(2020, 1, 10)]
+
+
+class TaskLogger(object):
+    """
+        Logger of a pool process which is not bound to a task, lookups are not reported
+    """
+    task_id = None
+    task_queue = None
+
+    def log_info(self, content, log_stack=None):
+        pass
+
+    def log_warn(self, content, log_stack=None):
+        pass
+
+    def log_error(self, content, log_stack=None):
+        raise AssertionError(content)
+
+
+class RecordingLogger(TaskLogger):
+    """
+        Logger keeping errors instead of failing, used by tests expecting errors
+    """
+    def __init__(self):
+        self.errors = []
+
+    def log_error(self, content, log_stack=None):
+        self.errors.append(content)
+
+    def sub_logger(self, sub_module_name):
+        return self
+
+
+class MemoryTickDao(object):
+    """
+        Serves tick data of days kept in memory with the interfaces of TickDataDao used by worker caches
+    """
+    def __init__(self, days):
+        """
+        :param days: dict of (stock code, date object) -> tick data dataframe
+        """
+        self.days = days
+        self.versions = {key: 1 for key in days}
+        self.loads = 0
+
+    def get_tick_data_version(self, stock_code, day):
+        return Error.SUCCESS, self.versions.get((stock_code, day), None)
+
+    def list_updated_dates(self, stock_code):
+        return Error.SUCCESS, sorted(day for code, day in self.days if code == stock_code)
+
+    def load_updated_tick_data(self, stock_code, day, columns=None, start_time=None, end_time=None):
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        self.loads += 1
+        df = self.days[(stock_code, day)].copy()
+        return Error.SUCCESS, df[list(columns)] if columns is not None else df
+
+
+def make_day_df(day, rows=100, base=0.0):
+    """
+    :return: tick data of a day, "last" counts from base
+    """
+    start = datetime.datetime(day.year, day.month, day.day, 9, 30)
+    return pd.DataFrame({
+        "datetime": pd.date_range(start, periods=rows, freq="3s"),
+        "date": [day] * rows,
+        "last": base + np.arange(rows, dtype=np.float64),
+        "volume": np.ones(rows, dtype=np.float64)
+    })
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class ByteBudgetLRUCache(object):
+    """
+        A thread-safe LRU cache bounded by the total size(in bytes) of its entries instead of the entry count.
+        Size of an entry is given by the caller when the entry is put into cache.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__total_bytes = 0
+        self.__lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Get a cached value and mark it as the most recently used one
+        :param key:
+        :return: True and the cached value if hit, else False and None
+        """
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+        finally:
+            self.__lock.release()
+
+    def put(self, key, value, size):
+        """
+        Put a value into cache, least recently used entries are evicted until the cache fits its byte budget.
+        Values larger than the whole budget are not cached.
+        :param key:
+        :param value:
+        :param size: size of value in bytes
+        :return: True if value is cached else False
+        """
+        if size > self.max_bytes:
+            return False
+
+        self.__lock.acquire()
+        try:
+            self.__pop(key)
+            self.__entries[key] = (value, size)
+            self.__total_bytes += size
+
+            while self.__total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.__total_bytes -= evicted_size
+                self.evictions += 1
+        finally:
+            self.__lock.release()
+
+        return True
+
+    def invalidate(self, key):
+        """
+        Remove an entry from cache
+        :param key:
+        :return: True if entry existed else False
+        """
+        self.__lock.acquire()
+        try:
+            is_exists = self.__pop(key)
+            if is_exists:
+                self.invalidations += 1
+        finally:
+            self.__lock.release()
+
+        return is_exists
+
+    def invalidate_matching(self, predicate):
+        """
+        Remove entries whose keys match a predicate
+        :param predicate: function(key) returning True if entry should be removed
+        :return: number of entries removed
+        """
+        self.__lock.acquire()
+        try:
+            keys = [key for key in self.__entries if predicate(key)]
+            for key in keys:
+                self.__pop(key)
+            self.invalidations += len(keys)
+        finally:
+            self.__lock.release()
+
+        return len(keys)
+
+    def clear(self):
+        self.__lock.acquire()
+        try:
+            self.__entries = OrderedDict()
+            self.__total_bytes = 0
+        finally:
+            self.__lock.release()
+
+    def stats(self):
+        """
+        :return: a dict of cache counters
+        """
+        self.__lock.acquire()
+        try:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": float(self.hits) / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+        finally:
+            self.__lock.release()
+
+    def __pop(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return False
+
+        self.__total_bytes -= entry[1]
+        return True
@@ -0,0 +1,105 @@
+from Core.Conf.TickDataConf import TickDataConf
+import numpy as np
+import datetime, functools
+
+
+class TickGrid(object):
+    """
+        The intraday tick grid defined by TickDataConf.TICK_SESSIONS and TickDataConf.TICK_STEP_SECONDS.
+        Grid offsets from midnight are computed once per process, grids of recently used days are cached.
+    """
+    TIME_COLUMNS = ("datetime", "date")
+
+    __offsets = None
+
+    @classmethod
+    def offsets(cls):
+        """
+        :return: read only int64 array of grid point offsets from midnight in nanoseconds
+        """
+        if cls.__offsets is None:
+            step = TickDataConf.TICK_STEP_SECONDS
+            sessions = []
+            for start, end in TickDataConf.TICK_SESSIONS:
+                start_seconds = cls.__to_seconds(start)
+                end_seconds = cls.__to_seconds(end)
+                sessions.append(np.arange(start_seconds, end_seconds + 1, step, dtype=np.int64))
+
+            offsets = np.concatenate(sessions) * 10 ** 9
+            offsets.setflags(write=False)
+            assert offsets.shape[0] == TickDataConf.TICK_LENGTH, "tick sessions don't match tick length"
+            cls.__offsets = offsets
+
+        return cls.__offsets
+
+    @classmethod
+    def length(cls):
+        return cls.offsets().shape[0]
+
+    @classmethod
+    def grid_for_day(cls, day):
+        """
+        :param day: date or datetime object, time of a datetime object is ignored
+        :return: read only datetime64[ns] array of grid points of day
+        """
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+
+        return cls._grid_for_date(day)
+
+    @classmethod
+    def index_of(cls, timestamp):
+        """
+        :param timestamp: a timestamp(datetime, numpy datetime64 or pandas Timestamp) or an array of them
+        :return: grid index of timestamp, -1 if timestamp is not a grid point, an array if an array is given
+        """
+        timestamps = np.asarray(timestamp, dtype='datetime64[ns]')
+        offsets = (timestamps - timestamps.astype('datetime64[D]')).astype(np.int64)
+
+        grid_offsets = cls.offsets()
+        indices = np.searchsorted(grid_offsets, offsets, side='left')
+        clipped = np.minimum(indices, grid_offsets.shape[0] - 1)
+        indices = np.where(grid_offsets[clipped] == offsets, indices, -1)
+
+        return int(indices) if indices.ndim == 0 else indices
+
+    @classmethod
+    def drop_time_columns(cls, df):
+        """
+        Drop time columns of a dataframe aligned to the grid of a day, they can be rebuilt by "attach_time_columns"
+        :param df:
+        :return: dataframe without time columns
+        """
+        return df.drop([col for col in cls.TIME_COLUMNS if col in df.columns], axis=1).reset_index(drop=True)
+
+    @classmethod
+    def attach_time_columns(cls, df, day):
+        """
+        Rebuild time columns of a dataframe aligned to the grid of a day, rows must be in grid order
+        :param df: dataframe with one row per grid point
+        :param day: date or datetime object
+        :return: dataframe with "datetime" and "date" columns, unchanged if it already has them
+        """
+        if 'datetime' in df.columns:
+            return df
+
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+
+        df = df.sort_index().reset_index(drop=True)
+        df['datetime'] = cls.grid_for_day(day)
+        df['date'] = day
+        return df
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _grid_for_date(day):
+        day_start = np.datetime64(day, 'ns').astype(np.int64)
+        grid = (TickGrid.offsets() + day_start).astype('datetime64[ns]')
+        grid.setflags(write=False)
+        return grid
+
+    @staticmethod
+    def __to_seconds(time_str):
+        time = datetime.datetime.strptime(time_str, "%H:%M:%S").time()
+        return time.hour * 3600 + time.minute * 60 + time.second
@@ -5,4 +5,11 @@ def par_date(date_string):
         date = datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
         return date
     except:
-        return None
\ No newline at end of file
+        return None
+
+def par_time(time_string):
+    try:
+        time = datetime.datetime.strptime(time_string, "%H:%M:%S").time()
+        return time
+    except:
+        return None
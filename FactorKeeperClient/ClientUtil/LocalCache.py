@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class LocalFactorCache(object):
+    """
+        本地因子结果缓存，每个(factor, version, stock, day)存为一个npz文件(按列存储)，
+        文件中同时记录该日在服务端的更新时间，服务端更新时间变化后缓存失效
+    """
+    COLUMNS_KEY = "__columns__"
+    UPDATE_TIME_KEY = "__update_time__"
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.realpath(cache_dir)
+
+    def _get_path(self, factor, version, stock_code, day):
+        return os.path.join(self.cache_dir, factor, version, stock_code, "{}.npz".format(day))
+
+    def load(self, factor, version, stock_code, day, update_time):
+        """
+        读取缓存的某日因子结果
+        :param factor:
+        :param version:
+        :param stock_code:
+        :param day:
+        :param update_time: 服务端记录的该日更新时间
+        :return: 缓存命中且未过期时返回dataframe，否则返回None
+        """
+        path = self._get_path(factor, version, stock_code, day)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data[self.UPDATE_TIME_KEY][0]) != str(update_time):
+                    return None
+
+                columns = data[self.COLUMNS_KEY].tolist()
+                return pd.DataFrame({col: data["col_{}".format(i)] for i, col in enumerate(columns)},
+                                    columns=columns)
+        except Exception:
+            # 损坏的缓存文件视为未命中，下次保存时覆盖
+            return None
+
+    def save(self, factor, version, stock_code, day, update_time, df):
+        """
+        保存某日因子结果，先写临时文件再替换，避免读到写了一半的文件
+        :param factor:
+        :param version:
+        :param stock_code:
+        :param day:
+        :param update_time: 服务端记录的该日更新时间
+        :param df:
+        :return: None
+        """
+        path = self._get_path(factor, version, stock_code, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        arrays = {"col_{}".format(i): df[col].values for i, col in enumerate(df.columns)}
+        arrays[self.COLUMNS_KEY] = np.array([str(col) for col in df.columns])
+        arrays[self.UPDATE_TIME_KEY] = np.array([str(update_time)])
+
+        temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -2,28 +2,41 @@ import requests, os
 import pandas as pd
 import datetime
 from ClientUtil.ZipUtil import ZipUtil
+from ClientUtil.LocalCache import LocalFactorCache
 
 
 class FactorKeeperClient(object):
-    def __init__(self):
+    ERROR_FACTOR_RESULT_NOT_EXISTS = 18
+    TICK_LENGTH = 4740
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: 本地因子结果缓存目录，为None时不使用本地缓存
+        """
         self.host = "10.0.2.24"
         # self.host = "localhost"
         self.port = 8910
         self.url = "http://{0}:{1}".format(self.host, self.port)
+        self.local_cache = LocalFactorCache(cache_dir) if cache_dir is not None else None
 
-    def create_stock_view(self, stock_view_name, stock_view_relation):
+    def create_stock_view(self, stock_view_name, stock_view_relation, view_type=None):
         """
         添加一个stock view
         :param stock_view_name:
         :param stock_view_relation:
+        :param view_type: "materialized"(默认，数据复制到view表中)或"virtual"(只保存关系，读取时由成分股票组装)
         :return:
         """
         import json
 
-        res = self._do_post("{0}/stock_view".format(self.url, stock_view_name), datas={
+        datas = {
             "stock_view_name": stock_view_name,
             "stock_view_relation": json.dumps(stock_view_relation)
-        })
+        }
+        if view_type is not None:
+            datas["view_type"] = view_type
+
+        res = self._do_post("{0}/stock_view".format(self.url, stock_view_name), datas=datas)
         self._show_result(res)
         return FactorKeeperClient._get_result(res)
 
@@ -132,56 +145,80 @@ class FactorKeeperClient(object):
         self._show_result(res)
         return FactorKeeperClient._get_result(res)
 
-    def load_factor_result(self, factor_id, stock_code, fetch_date, factor_version=None):
+    def load_factor_result(self, factor_id, stock_code, fetch_date, factor_version=None, start_time=None,
+                           end_time=None, columns=None, bar=None, agg=None):
         """
         加载因子计算结果
         :param factor_id: factor名称
         :param factor_version: factor版本
         :param stock_code: 股票代码
         :param fetch_date: 时间范围
+        :param start_time: 日内起始时间(含)，如"09:30:00"，为None则不限制
+        :param end_time: 日内结束时间(含)，如"10:00:00"，为None则不限制
+        :param columns: 需要返回的列(因子名、datetime、date)，为None则全部返回
+        :param bar: 在服务端聚合成的bar周期，如"1min"、"5min"、"1d"，为None则不聚合(聚合结果不使用本地缓存)
+        :param agg: 每个bar的聚合方式，mean/last/first/sum/min/max，多个用逗号分隔，默认last
         :return: 返回码、返回消息
         """
+        if self.local_cache is not None and bar is None:
+            ret_code, df = self._load_cached_factor_result(factor_id, factor_version, stock_code, fetch_date,
+                                                           fetch_date)
+            return ret_code, self._apply_projection(df, start_time, end_time, columns) if not ret_code else df
+
+        params = self._make_projection_params(start_time, end_time, columns, bar, agg)
         if factor_version is not None:
             res = self._do_get("{0}/factor/{1}/version/{2}/stock/{3}/date/{4}".format(self.url, factor_id, factor_version, stock_code,
-                                                                         fetch_date))
+                                                                         fetch_date), params=params)
         else:
             res = self._do_get(
-                "{0}/factor/{1}/stock/{2}/date/{3}".format(self.url, factor_id, stock_code, fetch_date))
+                "{0}/factor/{1}/stock/{2}/date/{3}".format(self.url, factor_id, stock_code, fetch_date), params=params)
         ret_code, ret_msg = FactorKeeperClient._get_result(res)
         if ret_code:
             return int(ret_code), pd.DataFrame()
 
-        return ret_code, pd.read_json(ret_msg).sort_values(by=['datetime'])
+        return ret_code, self._read_result_json(ret_msg)
 
-    def load_multi_factor_result(self, factors, stock_code, fetch_date):
+    def load_multi_factor_result(self, factors, stock_code, fetch_date, start_time=None, end_time=None,
+                                 columns=None, bar=None, agg=None):
         import json
-        res = self._do_post(
-            "{0}/factor/load_multi_factors".format(self.url), datas={
-                "factors": json.dumps(factors),
-                "stock_code": stock_code,
-                "fetch_date": str(fetch_date)
-            })
+        if self.local_cache is not None and bar is None:
+            ret_code, df = self._load_cached_multi_factor_result(factors, stock_code, fetch_date, fetch_date)
+            return ret_code, self._apply_projection(df, start_time, end_time, columns) if not ret_code else df
+
+        datas = {
+            "factors": json.dumps(factors),
+            "stock_code": stock_code,
+            "fetch_date": str(fetch_date)
+        }
+        datas.update(self._make_projection_params(start_time, end_time, columns, bar, agg))
+        res = self._do_post("{0}/factor/load_multi_factors".format(self.url), datas=datas)
         ret_code, ret_msg = FactorKeeperClient._get_result(res)
         if ret_code:
             return int(ret_code), pd.DataFrame()
 
-        return ret_code, pd.read_json(ret_msg).sort_values(by=['datetime'])
+        return ret_code, self._read_result_json(ret_msg)
 
-    def load_multi_factor_result_by_range(self, factors, stock_code, start_date, end_date):
+    def load_multi_factor_result_by_range(self, factors, stock_code, start_date, end_date, start_time=None,
+                                          end_time=None, columns=None, bar=None, agg=None):
         import json
-        res = self._do_post(
-            "{0}/factor/load_multi_factors_by_range".format(self.url), datas={
-                "factors": json.dumps(factors),
-                "stock_code": stock_code,
-                "start_date": str(start_date),
-                "end_date": str(end_date)
-            })
+        if self.local_cache is not None and bar is None:
+            ret_code, df = self._load_cached_multi_factor_result(factors, stock_code, start_date, end_date)
+            return ret_code, self._apply_projection(df, start_time, end_time, columns) if not ret_code else df
+
+        datas = {
+            "factors": json.dumps(factors),
+            "stock_code": stock_code,
+            "start_date": str(start_date),
+            "end_date": str(end_date)
+        }
+        datas.update(self._make_projection_params(start_time, end_time, columns, bar, agg))
+        res = self._do_post("{0}/factor/load_multi_factors_by_range".format(self.url), datas=datas)
         ret_code, ret_msg = FactorKeeperClient._get_result(res)
         print(ret_msg)
         if ret_code:
             return int(ret_code), pd.DataFrame()
 
-        return ret_code, pd.read_json(ret_msg).sort_values(by=['datetime'])
+        return ret_code, self._read_result_json(ret_msg)
 
     def update_factor_result(self, factor_id, stock_code, factor_version=None):
         """
@@ -200,6 +237,52 @@ class FactorKeeperClient(object):
             self._show_result(res)
         return self._get_result(res)
 
+    def update_factor_result_xs(self, factor_id, factor_version=None):
+        """
+        使用截面因子生成器(factor_generator_xs)更新所有关联股票的因子结果，按日期拆分任务
+        :param factor_id: factor名称
+        :param factor_version: factor版本
+        :return: 返回码、返回消息
+        """
+        if factor_version is not None:
+            res = self._do_put("{0}/factor/{1}/version/{2}/cross_section".format(self.url, factor_id, factor_version))
+        else:
+            res = self._do_put("{0}/factor/{1}/cross_section".format(self.url, factor_id))
+        self._show_result(res)
+        return self._get_result(res)
+
+    def get_update_status_xs(self, factor_id, factor_version):
+        """
+        查询截面因子更新状态
+        :param factor_id: factor名称
+        :param factor_version: factor版本
+        :return: 返回码、返回消息
+        """
+        res = self._do_get("{0}/factor/{1}/version/{2}/cross_section/update_status".format(self.url, factor_id,
+                                                                                          factor_version))
+        self._show_result(res)
+        return FactorKeeperClient._get_result(res)
+
+    def update_stock_factors(self, stock_code):
+        """
+        更新股票关联的所有因子，每天的tick数据只加载一次，供所有因子生成器使用
+        :param stock_code: 股票代码
+        :return: 返回码、返回消息
+        """
+        res = self._do_put("{0}/stock/{1}/factors".format(self.url, stock_code))
+        self._show_result(res)
+        return self._get_result(res)
+
+    def get_stock_factors_update_status(self, stock_code):
+        """
+        查询股票关联因子的更新状态
+        :param stock_code: 股票代码
+        :return: 返回码、返回消息
+        """
+        res = self._do_get("{0}/stock/{1}/factors/update_status".format(self.url, stock_code))
+        self._show_result(res)
+        return FactorKeeperClient._get_result(res)
+
     def get_update_status(self, factor_id, stock_code, factor_version=None):
         if factor_version is not None:
             res = self._do_get("{0}/factor/{1}/version/{2}/stock/{3}/update_status".format(self.url, factor_id, factor_version, stock_code))
@@ -225,6 +308,214 @@ class FactorKeeperClient(object):
         ret_code, ret_msg = FactorKeeperClient._get_result(res)
         return ret_code, ret_msg
 
+    def get_factor_update_times(self, factor_id, stock_code, factor_version=None, start_date=None, end_date=None):
+        """
+        获取因子每个已更新日期在服务端的最近更新时间
+        :param factor_id: factor名称
+        :param stock_code: 股票代码
+        :param factor_version: factor版本，为None则取最新版
+        :param start_date:
+        :param end_date:
+        :return: 返回码、因子版本、{日期字符串: 更新时间}
+        """
+        import json
+        params = {}
+        if start_date is not None:
+            params["start_date"] = str(start_date)
+        if end_date is not None:
+            params["end_date"] = str(end_date)
+
+        if factor_version is not None:
+            res = self._do_get("{0}/factor/{1}/version/{2}/stock/{3}/update_time".format(
+                self.url, factor_id, factor_version, stock_code), params=params)
+        else:
+            res = self._do_get("{0}/factor/{1}/stock/{2}/update_time".format(self.url, factor_id, stock_code),
+                               params=params)
+        ret_code, ret_msg = FactorKeeperClient._get_result(res)
+        if ret_code:
+            return int(ret_code), None, None
+
+        ret = json.loads(ret_msg)
+        return ret_code, ret["version"], ret["update_times"]
+
+    def append_intraday_ticks(self, stock_code, ticks_df):
+        """
+        推送当日实时tick数据，服务端将tick对齐到3秒tick网格上
+        :param stock_code: 股票代码
+        :param ticks_df: 含datetime列的tick数据，只能包含同一天的tick，早于已推送tick的数据会被丢弃
+        :return: 返回码、当日已填充的tick网格数
+        """
+        datas = {
+            "ticks": ticks_df.to_json(orient="records", date_format="iso")
+        }
+        res = self._do_post("{0}/stock/{1}/ticks".format(self.url, stock_code), datas=datas)
+        ret_code, ret_msg = FactorKeeperClient._get_result(res)
+        if ret_code:
+            return int(ret_code), None
+
+        return ret_code, int(ret_msg)
+
+    def load_intraday_ticks(self, stock_code, since=0):
+        """
+        加载当日已填充的tick网格数据
+        :param stock_code: 股票代码
+        :param since: 起始网格序号，传入已获取的网格数即可只拉取新增部分
+        :return: 返回码、dataframe
+        """
+        res = self._do_get("{0}/stock/{1}/ticks".format(self.url, stock_code), params={"since": since})
+        ret_code, ret_msg = FactorKeeperClient._get_result(res)
+        if ret_code:
+            return int(ret_code), pd.DataFrame()
+
+        return ret_code, self._read_result_json(ret_msg)
+
+    def seal_intraday_ticks(self, stock_code):
+        """
+        收盘后将当日实时tick数据保存为已更新的tick数据，之后可像普通交易日一样计算因子
+        :param stock_code: 股票代码
+        :return: 返回码、返回消息
+        """
+        res = self._do_post("{0}/stock/{1}/ticks/seal".format(self.url, stock_code), "")
+        self._show_result(res)
+        return FactorKeeperClient._get_result(res)
+
+    def subscribe_intraday_ticks(self, stock_code, handler, poll_interval=3, since=0):
+        """
+        订阅当日实时tick数据，每当有新的tick网格填充时调用handler(new_slots_df, since)，
+        流式因子可在handler中基于上次的状态增量计算新网格上的因子值
+        :param stock_code: 股票代码
+        :param handler: 回调函数，new_slots_df为新填充的网格数据，since为其第一行的网格序号
+        :param poll_interval: 轮询间隔(秒)
+        :param since: 起始网格序号
+        :return: 返回码(当日网格全部填充后返回0)
+        """
+        import time
+
+        while since < self.TICK_LENGTH:
+            ret_code, df = self.load_intraday_ticks(stock_code, since)
+            if ret_code:
+                return ret_code
+
+            if df.shape[0] > 0:
+                handler(df.reset_index(drop=True), since)
+                since += df.shape[0]
+            else:
+                time.sleep(poll_interval)
+
+        return 0
+
+    def _load_cached_factor_result(self, factor_id, factor_version, stock_code, start_date, end_date):
+        """
+        通过本地缓存加载单个因子的结果，只从服务端拉取缓存中缺失或已过期的日期
+        :return: 返回码、dataframe
+        """
+        ret_code, factor_version, update_times = self.get_factor_update_times(factor_id, stock_code, factor_version,
+                                                                              start_date, end_date)
+        if ret_code:
+            return int(ret_code), pd.DataFrame()
+
+        days = sorted(update_times.keys())
+        day_dfs = {}
+        missing_runs = []
+        for index, day in enumerate(days):
+            day_df = self.local_cache.load(factor_id, factor_version, stock_code, day, update_times[day])
+            if day_df is not None:
+                day_dfs[day] = day_df
+            elif missing_runs and missing_runs[-1][-1] == index - 1:
+                missing_runs[-1].append(index)
+            else:
+                missing_runs.append([index])
+
+        # 连续缺失的日期合并为一次区间请求
+        for run in missing_runs:
+            run_days = [days[index] for index in run]
+            ret_code, df = self._fetch_factor_result_by_range(factor_id, factor_version, stock_code,
+                                                              run_days[0], run_days[-1])
+            if ret_code:
+                return int(ret_code), pd.DataFrame()
+
+            df_days = pd.to_datetime(df['date']).dt.strftime("%Y-%m-%d")
+            for day in run_days:
+                day_df = df[df_days == day].reset_index(drop=True)
+                if day_df.shape[0] == 0:
+                    continue
+                self.local_cache.save(factor_id, factor_version, stock_code, day, update_times[day], day_df)
+                day_dfs[day] = day_df
+
+        if len(day_dfs) == 0:
+            return self.ERROR_FACTOR_RESULT_NOT_EXISTS, pd.DataFrame()
+
+        result_df = pd.concat([day_dfs[day] for day in days if day in day_dfs], ignore_index=True)
+        return 0, result_df.sort_values(by=['datetime'])
+
+    def _load_cached_multi_factor_result(self, factors, stock_code, start_date, end_date):
+        result_df = None
+        for factor in factors:
+            ret_code, factor_df = self._load_cached_factor_result(factor, factors[factor], stock_code,
+                                                                  start_date, end_date)
+            if ret_code:
+                return int(ret_code), pd.DataFrame()
+
+            if result_df is None:
+                result_df = factor_df
+            else:
+                result_df = result_df.merge(factor_df[[factor, 'datetime']], on='datetime')
+
+        return 0, result_df.sort_values(by=['datetime'])
+
+    def _fetch_factor_result_by_range(self, factor_id, factor_version, stock_code, start_date, end_date):
+        import json
+        res = self._do_post(
+            "{0}/factor/load_multi_factors_by_range".format(self.url), datas={
+                "factors": json.dumps({factor_id: factor_version}),
+                "stock_code": stock_code,
+                "start_date": str(start_date),
+                "end_date": str(end_date)
+            })
+        ret_code, ret_msg = FactorKeeperClient._get_result(res)
+        if ret_code:
+            return int(ret_code), None
+
+        return ret_code, pd.read_json(ret_msg)
+
+    @staticmethod
+    def _make_projection_params(start_time, end_time, columns, bar=None, agg=None):
+        params = {}
+        if bar is not None:
+            params["bar"] = bar
+        if agg is not None:
+            params["agg"] = agg if isinstance(agg, str) else ",".join(agg)
+        if start_time is not None:
+            params["start_time"] = str(start_time)
+        if end_time is not None:
+            params["end_time"] = str(end_time)
+        if columns is not None:
+            params["columns"] = ",".join(columns)
+        return params
+
+    @staticmethod
+    def _apply_projection(df, start_time, end_time, columns):
+        """
+        在本地缓存的整日结果上截取日内时间段和列
+        """
+        if start_time is not None or end_time is not None:
+            times = df['datetime'].dt.strftime("%H:%M:%S")
+            if start_time is not None:
+                df = df[times >= str(start_time)]
+                times = times[times >= str(start_time)]
+            if end_time is not None:
+                df = df[times <= str(end_time)]
+        if columns is not None:
+            df = df[list(columns)]
+        return df.reset_index(drop=True)
+
+    @staticmethod
+    def _read_result_json(ret_msg):
+        df = pd.read_json(ret_msg)
+        if 'datetime' in df.columns:
+            df = df.sort_values(by=['datetime'])
+        return df
+
     @staticmethod
     def _do_post(url, datas, files=None):
         return requests.post(url, datas, files=files).text